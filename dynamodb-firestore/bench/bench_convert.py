@@ -0,0 +1,99 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Compares the single-pass item converter in copy-data/ddb_convert.py with
+# the previous TypeDeserializer -> json.dumps -> json.loads conversion, on
+# wide and deeply nested items built from examples/sample_data.
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from boto3.dynamodb.types import TypeDeserializer
+from decimal import Decimal
+from sample_items import load_sample_items
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(base_dir, "copy-data"))
+
+from ddb_convert import make_item_converter  # noqa: E402
+
+
+def default_type_error_handler(obj):
+    if isinstance(obj, Decimal):
+        return int(obj)
+    raise TypeError
+
+
+def json_round_trip(item, type_deserializer=TypeDeserializer()):
+    item_as_json = json.dumps(
+        type_deserializer.deserialize({"M": item}),
+        default=default_type_error_handler,
+    )
+    return json.loads(item_as_json)
+
+
+def wide_item(items):
+    # Every sample row flattened into a single item
+    wide = {}
+    for i, item in enumerate(items):
+        for name, value in item.items():
+            wide[f"{name}_{i}"] = value
+    return wide
+
+
+def nested_item(items, depth):
+    # Sample rows wrapped in alternating maps and lists
+    nested = {"M": dict(items[0])}
+    for level in range(depth):
+        row = dict(items[level % len(items)])
+        if level % 2:
+            row["child"] = nested
+            nested = {"M": row}
+        else:
+            nested = {"L": [{"M": row}, nested]}
+    return {"PK": {"S": "NESTED#1"}, "doc": nested}
+
+
+def bench(convert, item, seconds):
+    count = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        for _ in range(100):
+            convert(item)
+        count += 100
+    return count / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark DynamoDB item conversion."
+    )
+    parser.add_argument("--seconds", type=float, default=2.0)
+    parser.add_argument("--depth", type=int, default=16)
+    args = parser.parse_args()
+
+    convert_item = make_item_converter()
+    items = load_sample_items()
+    cases = {
+        "sample row": items[0],
+        "wide": wide_item(items),
+        "nested": nested_item(items, args.depth),
+    }
+
+    print(f"{'item':<12}{'json round trip/s':>20}{'single pass/s':>16}{'speedup':>10}")
+    for name, item in cases.items():
+        before = bench(json_round_trip, item, args.seconds)
+        after = bench(convert_item, item, args.seconds)
+        print(f"{name:<12}{before:>20,.0f}{after:>16,.0f}{after / before:>9.1f}x")
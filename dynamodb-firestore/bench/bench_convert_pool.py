@@ -0,0 +1,71 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Reports the items per second converted and hashed by copy-data/convert_pool
+# for an increasing number of worker processes, using S3 export lines built
+# from examples/sample_data.
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from sample_items import load_sample_items
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(base_dir, "copy-data"))
+
+from convert_pool import ConvertPool  # noqa: E402
+
+
+def export_lines(items, count):
+    lines = []
+    for i in range(count):
+        item = dict(items[i % len(items)])
+        item["pk"] = {"S": f"ITEM#{i}"}
+        lines.append(json.dumps({"Item": item}) + "\n")
+    return lines
+
+
+def bench(processes, chunks):
+    pool = ConvertPool(processes, "pk", "sk", binary_base64=True)
+    # Warm up the worker processes before timing
+    pool.convert_export_lines(chunks[0]).result()
+    start = time.perf_counter()
+    futures = [pool.convert_export_lines(chunk) for chunk in chunks]
+    count = sum(len(future.result()) for future in futures)
+    elapsed = time.perf_counter() - start
+    pool.close()
+    return count / elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the conversion process pool."
+    )
+    parser.add_argument("--items", type=int, default=200000)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument(
+        "--processes",
+        default=f"0,1,2,4,{os.cpu_count()}",
+        help="comma separated worker counts, 0 converts in this process",
+    )
+    args = parser.parse_args()
+
+    lines = export_lines(load_sample_items(), args.items)
+    chunks = [
+        lines[i : i + args.chunk_size] for i in range(0, len(lines), args.chunk_size)
+    ]
+
+    print(f"{'processes':>10}{'items/s':>12}")
+    for processes in sorted({int(p) for p in args.processes.split(",")}):
+        print(f"{processes:>10}{bench(processes, chunks):>12,.0f}")
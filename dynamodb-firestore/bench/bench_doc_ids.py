@@ -0,0 +1,113 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Compares the document ID strategies of copy-data/doc_ids.py: the time to
+# build a million IDs, whether keys that only differ in where the partition
+# key ends get distinct IDs, and whether concat and base64 IDs decode back
+# to their keys.
+
+import argparse
+import os
+import sys
+import time
+
+from decimal import Decimal
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(base_dir, "copy-data"))
+
+from doc_ids import STRATEGIES, decode_doc_id, doc_id_function  # noqa: E402
+
+# Keys that are easy to confuse when they are simply concatenated. The type
+# of a key attribute is fixed by the table, so numbers and strings are
+# checked separately.
+STRING_KEYS = [
+    ("a", "bc"),
+    ("ab", "c"),
+    ("a#b", "c"),
+    ("a", "b#c"),
+    ("a/b", "c"),
+    ("a", "b/c"),
+    ("a%23b", "c"),
+    ("1", "23"),
+    ("12", "3"),
+    (".", ""),
+    ("..", ""),
+    ("__a__", "b"),
+    ("_", "_"),
+    ("", "a"),
+    ("a", ""),
+]
+NUMBER_KEYS = [
+    (1, 23),
+    (12, 3),
+    (Decimal("1.5"), 0),
+    (Decimal("1"), Decimal("50")),
+    (-1, 5),
+]
+
+
+def make_docs(count):
+    return [{"PK": f"USER#{i}", "SK": f"ORDER#{i * 7919}"} for i in range(count)]
+
+
+def bench(make_ids, docs, seconds):
+    count = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        make_ids(docs)
+        count += len(docs)
+    return (time.perf_counter() - start) / count * 1e6
+
+
+def collisions(make_ids):
+    count = 0
+    for keys in (STRING_KEYS, NUMBER_KEYS):
+        ids = make_ids([{"PK": pk, "SK": sk} for pk, sk in keys])
+        count += len(ids) - len(set(ids))
+    return count
+
+
+def round_trip_errors(strategy, make_ids):
+    if strategy not in ("concat", "base64"):
+        return None
+    docs = [{"PK": pk, "SK": sk} for pk, sk in STRING_KEYS]
+    errors = 0
+    for doc, doc_id in zip(docs, make_ids(docs)):
+        if decode_doc_id(strategy, doc_id) != [doc["PK"], doc["SK"]]:
+            errors += 1
+    return errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark document ID strategies.")
+    parser.add_argument("--seconds", type=float, default=2.0)
+    parser.add_argument("--page-size", type=int, default=500)
+    args = parser.parse_args()
+
+    docs = make_docs(args.page_size)
+    print(
+        f"{'strategy':<10}{'s per 1M ids':>14}{'collisions':>12}"
+        f"{'decode errors':>15}"
+    )
+    for strategy in STRATEGIES:
+        try:
+            make_ids = doc_id_function(strategy, "PK", "SK")
+        except ValueError as e:
+            print(f"{strategy:<10}{e}")
+            continue
+        seconds = bench(make_ids, docs, args.seconds)
+        errors = round_trip_errors(strategy, make_ids)
+        print(
+            f"{strategy:<10}{seconds:>14.3f}{collisions(make_ids):>12}"
+            f"{'-' if errors is None else errors:>15}"
+        )
@@ -0,0 +1,333 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Runs the copy scripts and the stream replication functions end to end
+# against local stand-ins: DynamoDB Local (or a moto server), an S3 export
+# written to a local directory, and the Firestore and Datastore emulators.
+#
+# The source table is filled with items synthesized by
+# examples/load_items.py. Each case runs in its own process, and the
+# benchmark reports its items per second and commit latency, from the
+# --stats file of the copy scripts or bench/replay_stream.py, and its peak
+# RSS and CPU time, from the resource usage of the process. The results are
+# saved to a JSON file, and compared with a previous one with --baseline.
+
+import argparse
+import gzip
+import json
+import os
+import shlex
+import subprocess
+import sys
+import time
+import urllib.request
+
+import boto3
+
+from boto3.dynamodb.types import TypeSerializer
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(base_dir, "examples"))
+
+from load_items import Counter, load_all, read_templates, synthesize  # noqa: E402
+
+copy_dir = os.path.join(base_dir, "copy-data")
+lambda_dir = os.path.join(base_dir, "streaming-replication")
+# Command of each case, with the fields in braces filled in by run_case,
+# and the database it writes to
+CASES = {
+    "ddb-firestore": (
+        [f"{copy_dir}/cp_ddb_firestore.py", "{table}"],
+        "firestore",
+    ),
+    "ddb-datastore": (
+        [f"{copy_dir}/cp_ddb_datastore.py", "{table}"],
+        "datastore",
+    ),
+    "s3-firestore": (
+        [f"{copy_dir}/cp_s3_export_firestore.py", "{table}", "{export}"],
+        "firestore",
+    ),
+    "s3-datastore": (
+        [f"{copy_dir}/cp_s3_export_datastore.py", "{table}", "{export}"],
+        "datastore",
+    ),
+    "lambda-firestore": (
+        [
+            f"{base_dir}/bench/replay_stream.py",
+            f"{lambda_dir}/lambda-func-firestore/sync-from-stream.py",
+            "{template}",
+            "--items",
+            "{items}",
+            "--padding",
+            "{padding}",
+        ],
+        "firestore",
+    ),
+    "lambda-datastore": (
+        [
+            f"{base_dir}/bench/replay_stream.py",
+            f"{lambda_dir}/lambda-func-datastore/sync-from-stream.py",
+            "{template}",
+            "--items",
+            "{items}",
+            "--padding",
+            "{padding}",
+        ],
+        "datastore",
+    ),
+}
+# Options of the copy scripts for a benchmark run: no progress lines, and
+# no write rate ramp-up, which would only measure the ramp
+COPY_ARGS = ["--progress-interval", "0", "--initial-rate", "0"]
+
+
+def create_table(client, table_name):
+    """Creates the source table, and returns False if it already exists."""
+    try:
+        client.create_table(
+            TableName=table_name,
+            AttributeDefinitions=[
+                {"AttributeName": "PK", "AttributeType": "S"},
+                {"AttributeName": "SK", "AttributeType": "S"},
+            ],
+            KeySchema=[
+                {"AttributeName": "PK", "KeyType": "HASH"},
+                {"AttributeName": "SK", "KeyType": "RANGE"},
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        )
+    except client.exceptions.ResourceInUseException:
+        return False
+    client.get_waiter("table_exists").wait(TableName=table_name)
+    return True
+
+
+def load_table(table_name, template, items, padding, endpoint_url, threads=8):
+    """Loads the items, and raises the first error of a loader thread."""
+    counter = Counter()
+    load_all(
+        table_name,
+        read_templates(template),
+        items,
+        threads,
+        padding,
+        endpoint_url,
+        counter,
+    )
+    return counter.value
+
+
+def write_export(export_dir, template, items, padding, files):
+    """Writes the items in the S3 export format, in a local directory."""
+    serializer = TypeSerializer()
+    templates = read_templates(template)
+    os.makedirs(os.path.join(export_dir, "data"), exist_ok=True)
+    size = -(-items // files)
+    with open(os.path.join(export_dir, "manifest-files.json"), "w") as manifest:
+        for n, start in enumerate(range(0, items, size)):
+            key = f"AWSDynamoDB/bench/data/{n:05d}.json.gz"
+            path = os.path.join(export_dir, "data", f"{n:05d}.json.gz")
+            with gzip.open(path, "wt", compresslevel=1) as fout:
+                for i in range(start, min(items, start + size)):
+                    item = synthesize(
+                        templates[i % len(templates)], i // len(templates), padding
+                    )
+                    image = {k: serializer.serialize(v) for k, v in item.items()}
+                    fout.write(json.dumps({"Item": image}) + "\n")
+            manifest.write(json.dumps({"dataFileS3Key": key}) + "\n")
+
+
+def clear_emulator(database, env):
+    # Deletes the documents left by the previous case, so each case writes
+    # to an empty database
+    if database == "firestore":
+        host = env["FIRESTORE_EMULATOR_HOST"]
+        project = env["GOOGLE_CLOUD_PROJECT"]
+        url = f"http://{host}/emulator/v1/projects/{project}"
+        request = urllib.request.Request(
+            f"{url}/databases/(default)/documents", method="DELETE"
+        )
+    else:
+        host = env["DATASTORE_EMULATOR_HOST"]
+        request = urllib.request.Request(f"http://{host}/reset", method="POST")
+    urllib.request.urlopen(request).close()
+
+
+def run_case(name, fields, env, extra_args, work_dir):
+    command, database = CASES[name]
+    command = [arg.format(**fields) for arg in command]
+    stats_path = os.path.join(work_dir, f"{name}.stats.json")
+    log_path = os.path.join(work_dir, f"{name}.log")
+    if name.startswith("lambda"):
+        command += ["--stats", stats_path]
+    else:
+        command += COPY_ARGS + ["--stats", stats_path] + extra_args
+    clear_emulator(database, env)
+
+    start = time.monotonic()
+    with open(log_path, "w") as log:
+        process = subprocess.Popen(
+            [sys.executable] + command, env=env, stdout=log, stderr=subprocess.STDOUT
+        )
+        # The resource usage includes the worker processes of --processes
+        _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.monotonic() - start
+    if status:
+        print(f"{name} failed, see {log_path}")
+        return None
+
+    with open(stats_path) as fin:
+        stats = json.load(fin)
+    return {
+        "wall_seconds": round(elapsed, 3),
+        "items": stats["items_committed"],
+        "items_per_second": stats["items_per_second"],
+        "commit_latency_p50_ms": stats["commit_latency_p50_ms"],
+        "commit_latency_p99_ms": stats["commit_latency_p99_ms"],
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": round(usage.ru_maxrss / 1024, 1),
+        "cpu_seconds": round(usage.ru_utime + usage.ru_stime, 3),
+    }
+
+
+def compare(results, baseline, tolerance):
+    print(f"\n{'case':<18}{'items/s':>10}{'baseline':>10}{'change':>9}")
+    for name, result in results.items():
+        before = baseline.get("results", {}).get(name)
+        if not result or not before:
+            continue
+        after = result["items_per_second"]
+        change = (after - before["items_per_second"]) / before["items_per_second"]
+        flag = "  regression" if change < -tolerance / 100 else ""
+        print(
+            f"{name:<18}{after:>10,.0f}{before['items_per_second']:>10,.0f}"
+            f"{change * 100:>8.1f}%{flag}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the copy and replication tools end to end."
+    )
+    parser.add_argument(
+        "--cases",
+        default=",".join(CASES),
+        help=f"comma separated cases to run (default: {','.join(CASES)})",
+    )
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument(
+        "--padding", type=int, default=0, help="bytes of padding added to each item"
+    )
+    parser.add_argument(
+        "--template", choices=["Customer_Order", "Product"], default="Product"
+    )
+    parser.add_argument(
+        "--export-files", type=int, default=8, help="data files of the S3 export"
+    )
+    parser.add_argument("--dynamodb-endpoint", default="http://localhost:8000")
+    parser.add_argument("--firestore-emulator", default="localhost:8080")
+    parser.add_argument("--datastore-emulator", default="localhost:8081")
+    parser.add_argument("--project", default="bench-project")
+    parser.add_argument(
+        "--copy-args",
+        default="",
+        help='extra options of the copy scripts, for example "--segments 4 '
+        '--workers 8"',
+    )
+    parser.add_argument("--work-dir", default="bench-e2e")
+    parser.add_argument("--output", help="JSON file to save the results to")
+    parser.add_argument("--baseline", help="JSON results of a previous run")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=10,
+        help="percent of items/s below the baseline reported as a regression",
+    )
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault("AWS_ACCESS_KEY_ID", "bench")
+    env.setdefault("AWS_SECRET_ACCESS_KEY", "bench")
+    env.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    env.update(
+        AWS_ENDPOINT_URL_DYNAMODB=args.dynamodb_endpoint,
+        FIRESTORE_EMULATOR_HOST=args.firestore_emulator,
+        DATASTORE_EMULATOR_HOST=args.datastore_emulator,
+        GOOGLE_CLOUD_PROJECT=args.project,
+        DATASTORE_PROJECT_ID=args.project,
+    )
+    os.environ.update(env)
+    os.makedirs(args.work_dir, exist_ok=True)
+
+    table_name = f"bench_{args.template}_{args.items}_{args.padding}"
+    client = boto3.client("dynamodb", endpoint_url=args.dynamodb_endpoint)
+    if create_table(client, table_name):
+        start = time.monotonic()
+        try:
+            count = load_table(
+                table_name,
+                args.template,
+                args.items,
+                args.padding,
+                args.dynamodb_endpoint,
+            )
+        except Exception:
+            # Leaves no partly loaded table for the next run to reuse
+            client.delete_table(TableName=table_name)
+            raise
+        print(f"Loaded {count} items in {time.monotonic() - start:.1f} s")
+    export_dir = os.path.join(os.path.abspath(args.work_dir), table_name)
+    if not os.path.exists(os.path.join(export_dir, "manifest-files.json")):
+        write_export(
+            export_dir, args.template, args.items, args.padding, args.export_files
+        )
+
+    fields = {
+        "table": table_name,
+        "export": export_dir,
+        "template": args.template,
+        "items": args.items,
+        "padding": args.padding,
+    }
+    extra_args = shlex.split(args.copy_args)
+    results = {}
+    print(
+        f"{'case':<18}{'items/s':>10}{'p50 ms':>9}{'p99 ms':>9}"
+        f"{'RSS MB':>9}{'CPU s':>9}"
+    )
+    for name in args.cases.split(","):
+        result = run_case(name, fields, env, extra_args, args.work_dir)
+        results[name] = result
+        if result:
+            print(
+                f"{name:<18}{result['items_per_second']:>10,.0f}"
+                f"{result['commit_latency_p50_ms']:>9.1f}"
+                f"{result['commit_latency_p99_ms']:>9.1f}"
+                f"{result['peak_rss_mb']:>9.1f}{result['cpu_seconds']:>9.1f}"
+            )
+
+    if args.output:
+        with open(args.output, "w") as fout:
+            json.dump(
+                {
+                    "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                    "config": {
+                        k: v for k, v in vars(args).items() if k not in ("output",)
+                    },
+                    "results": results,
+                },
+                fout,
+                indent=2,
+            )
+    if args.baseline:
+        with open(args.baseline) as fin:
+            compare(results, json.load(fin), args.tolerance)
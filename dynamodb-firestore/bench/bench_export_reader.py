@@ -0,0 +1,133 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Compares ways to read and parse the lines of an S3 export data file: text
+# lines of a gzip file parsed with json, like the S3 export scripts did
+# before copy-data/export_reader.py, and the byte lines of export_reader
+# parsed with json or orjson, in chunks of 500 lines, or fewer for the byte
+# lines of large items. The data file is written once to --work-dir, from
+# the rows of examples/sample_data padded to --item-size bytes. Each reader
+# runs in its own process, and the benchmark reports the MB of uncompressed
+# lines it parses per second and its peak RSS.
+
+import argparse
+import gzip
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from sample_items import load_sample_items
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(base_dir, "copy-data"))
+
+READERS = ("text-json", "bytes-json", "bytes-orjson")
+# Lines per chunk, like the limit of the S3 export scripts
+CHUNK_SIZE = 500
+
+
+def write_fixture(path, size_mb, item_size):
+    items = load_sample_items()
+    written = 0
+    with gzip.open(path, "wb", compresslevel=1) as fout:
+        i = 0
+        while written < size_mb << 20:
+            item = dict(items[i % len(items)])
+            item["PK"] = {"S": f"PK#{i}"}
+            line = json.dumps({"Item": item})
+            padding = max(0, item_size - len(line) - 30)
+            item["padding"] = {"S": "x" * padding}
+            line = (json.dumps({"Item": item}) + "\n").encode()
+            fout.write(line)
+            written += len(line)
+            i += 1
+
+
+def chunk_by_count(lines, limit):
+    # The chunks of the text reader, like more_itertools.chunked
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) == limit:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run_reader(reader, path):
+    if reader == "text-json":
+        chunks = chunk_by_count(gzip.open(path, "rt"), CHUNK_SIZE)
+    else:
+        from export_reader import chunk_lines, read_lines
+
+        chunks = chunk_lines(read_lines(path), CHUNK_SIZE)
+    if reader == "bytes-orjson":
+        from orjson import loads
+    else:
+        from json import loads
+
+    nbytes = 0
+    start = time.monotonic()
+    for chunk in chunks:
+        nbytes += sum(map(len, chunk))
+        [loads(line)["Item"] for line in chunk]
+    elapsed = time.monotonic() - start
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return {
+        "mb_per_second": nbytes / elapsed / (1 << 20),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": usage.ru_maxrss / 1024,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark reading S3 export data files."
+    )
+    parser.add_argument(
+        "--size-mb", type=int, default=2048, help="uncompressed MB of the file"
+    )
+    parser.add_argument("--item-size", type=int, default=4096)
+    parser.add_argument("--readers", default=",".join(READERS))
+    parser.add_argument("--work-dir", default="bench-export-reader")
+    parser.add_argument("--run", choices=READERS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    path = os.path.join(
+        args.work_dir, f"export_{args.size_mb}_{args.item_size}.json.gz"
+    )
+    if args.run:
+        print(json.dumps(run_reader(args.run, path)))
+        sys.exit()
+
+    if not os.path.exists(path):
+        os.makedirs(args.work_dir, exist_ok=True)
+        start = time.monotonic()
+        write_fixture(path + ".tmp", args.size_mb, args.item_size)
+        os.rename(path + ".tmp", path)
+        print(f"Wrote {path} in {time.monotonic() - start:.1f} s")
+
+    print(f"{'reader':<14}{'MB/s':>10}{'RSS MB':>10}")
+    for reader in args.readers.split(","):
+        output = subprocess.run(
+            [sys.executable, __file__, "--run", reader] + sys.argv[1:],
+            stdout=subprocess.PIPE,
+            check=True,
+        ).stdout
+        result = json.loads(output)
+        print(
+            f"{reader:<14}{result['mb_per_second']:>10,.1f}"
+            f"{result['peak_rss_mb']:>10,.1f}"
+        )
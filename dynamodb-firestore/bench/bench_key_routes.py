@@ -0,0 +1,83 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Measures the cost per item of routing documents to subcollections with
+# copy-data/key_routes.py, next to the cost of converting the item and
+# building its document ID, for the rows of examples/sample_data routed
+# like the Customer_Order table of examples/put_customer_order_items.py.
+
+import argparse
+import os
+import sys
+import time
+
+from sample_items import load_sample_items
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(base_dir, "copy-data"))
+
+from ddb_convert import make_item_converter  # noqa: E402
+from doc_ids import doc_id_function  # noqa: E402
+from key_routes import KeyRouter  # noqa: E402
+
+CUSTOMER_ORDER_ROUTES = [
+    {
+        "pk": "CUST#{customer_id}",
+        "sk": "ORDER#{order_id}",
+        "path": "customers/{customer_id}/orders/{order_id}",
+    },
+    {"pk": "CUST#{customer_id}", "path": "customers/{customer_id}"},
+    {"pk": "ORDER#{order_id}", "sk": "LINE#{n}", "path": "orders/{order_id}/lines/{n}"},
+]
+
+
+def bench(function, docs, seconds):
+    count = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        for doc in docs:
+            function(doc)
+        count += len(docs)
+    return (time.perf_counter() - start) / count * 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark key routing.")
+    parser.add_argument("--seconds", type=float, default=2.0)
+    parser.add_argument(
+        "--rules",
+        type=int,
+        default=20,
+        help="total number of rules, padded with rules that never match",
+    )
+    args = parser.parse_args()
+
+    convert_item = make_item_converter()
+    items = load_sample_items()
+    docs = [convert_item(item) for item in items]
+    make_ids = doc_id_function("md5", "pk", "sk")
+    padding = [
+        {"pk": f"UNUSED{i}#{{id}}", "path": f"unused{i}/{{id}}"}
+        for i in range(max(0, args.rules - len(CUSTOMER_ORDER_ROUTES)))
+    ]
+    # The padding goes first, so that every item is tried against all rules
+    router = KeyRouter(padding + CUSTOMER_ORDER_ROUTES, "pk", "sk")
+    routed = sum(router.path(doc) is not None for doc in docs)
+
+    print(f"{len(docs)} sample items, {routed} routed by {args.rules} rules")
+    print(f"{'step':<10}{'us per item':>12}")
+    for name, function, sample in [
+        ("convert", convert_item, items),
+        ("doc id", lambda doc: make_ids([doc]), docs),
+        ("route", router.path, docs),
+    ]:
+        print(f"{name:<10}{bench(function, sample, args.seconds):>12.2f}")
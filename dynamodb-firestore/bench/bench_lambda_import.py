@@ -0,0 +1,238 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Measures the cold start of the stream replication Lambda functions: the
+# time to import sync-from-stream.py, with the copy-data modules it
+# imports, and the time of the first invocation, with the initialization
+# steps it reports when PROFILE_INIT=1. Every run is a new Python process,
+# like a new Lambda container.
+#
+# The AWS and GCP clients, and the BulkWriter of the Firestore sink, are
+# stubbed, so no network calls are made. By default the boto3 and google
+# modules are stubbed too; with --sdk the installed libraries are imported
+# and only their clients are stubbed.
+
+import argparse
+import base64
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import types
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The modules the functions import, which their images copy next to them
+sys.path.insert(0, os.path.join(base_dir, "copy-data"))
+lambda_dir = os.path.join(base_dir, "streaming-replication")
+default_paths = [
+    os.path.join(lambda_dir, "lambda-func-firestore", "sync-from-stream.py"),
+    os.path.join(lambda_dir, "lambda-func-datastore", "sync-from-stream.py"),
+]
+
+secret = {"SecretString": base64.b64encode(b"{}").decode()}
+table = {
+    "Table": {
+        "KeySchema": [
+            {"AttributeName": "PK", "KeyType": "HASH"},
+            {"AttributeName": "SK", "KeyType": "RANGE"},
+        ]
+    }
+}
+
+
+class Stub:
+    """Accepts any attribute access or call, standing in for a client."""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __getattr__(self, name):
+        return Stub()
+
+    def __call__(self, *args, **kwargs):
+        return Stub()
+
+    def update(self, *args, **kwargs):
+        pass
+
+    def get_secret_value(self, **kwargs):
+        return secret
+
+    def describe_table(self, **kwargs):
+        return table
+
+    def document(self, path):
+        return types.SimpleNamespace(path=path)
+
+
+class StubBulkWriter:
+    """Stands in for the BulkWriter of the Firestore sink, and reports every
+    write as committed when it is added."""
+
+    def __init__(self, client=None, options=None):
+        self._operations = []
+
+    def on_write_result(self, callback):
+        self._on_write_result = callback
+
+    def on_write_error(self, callback):
+        pass
+
+    def set(self, reference, document_data):
+        self._on_write_result(reference, None, self)
+
+    def delete(self, reference):
+        self._on_write_result(reference, None, self)
+
+    def _send(self, batch):
+        pass
+
+    def _schedule_ready_retries(self):
+        pass
+
+    def _enqueue_current_batch(self):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def install_stubs(sdk):
+    if sdk:
+        import boto3
+        from google.cloud import datastore, firestore
+        from google.oauth2 import service_account
+
+        boto3.client = Stub
+        firestore.Client = Stub
+        datastore.Client = Stub
+        datastore.Entity = Stub
+        service_account.Credentials.from_service_account_info = Stub
+        from google.cloud.firestore_v1 import bulk_writer
+
+        bulk_writer.BulkWriter = StubBulkWriter
+        return
+
+    boto3 = types.ModuleType("boto3")
+    boto3.client = Stub
+    google = types.ModuleType("google")
+    oauth2 = types.ModuleType("google.oauth2")
+    oauth2.service_account = types.SimpleNamespace(Credentials=Stub())
+    cloud = types.ModuleType("google.cloud")
+    cloud.firestore = types.SimpleNamespace(Client=Stub)
+    cloud.datastore = types.SimpleNamespace(Client=Stub, Entity=Stub)
+    firestore_v1 = types.ModuleType("google.cloud.firestore_v1")
+    bulk_writer = types.ModuleType("google.cloud.firestore_v1.bulk_writer")
+    bulk_writer.BulkWriter = StubBulkWriter
+    bulk_writer.BulkWriterOptions = Stub
+    firestore_v1.bulk_writer = bulk_writer
+    google.oauth2 = oauth2
+    google.cloud = cloud
+    cloud.firestore_v1 = firestore_v1
+    sys.modules.update(
+        {
+            "boto3": boto3,
+            "google": google,
+            "google.oauth2": oauth2,
+            "google.cloud": cloud,
+            "google.cloud.firestore_v1": firestore_v1,
+            "google.cloud.firestore_v1.bulk_writer": bulk_writer,
+        }
+    )
+
+
+def stream_event(records):
+    return {
+        "Records": [
+            {
+                "eventName": "INSERT",
+                "dynamodb": {
+                    "Keys": {"PK": {"S": f"ITEM#{i}"}, "SK": {"S": "A"}},
+                    "NewImage": {"value": {"N": str(i)}},
+                    "SequenceNumber": str(i + 1),
+                },
+            }
+            for i in range(records)
+        ]
+    }
+
+
+def run_once(path, sdk, records):
+    # Runs in the child process, and prints the timings as JSON
+    os.environ.setdefault("AWS_SECRET_ARN", "arn:aws:secretsmanager:bench")
+    os.environ.setdefault("DYNAMODB_TABLE_NAME", "bench")
+    os.environ["PROFILE_INIT"] = "1"
+    install_stubs(sdk)
+
+    start = time.perf_counter()
+    spec = importlib.util.spec_from_file_location("sync_from_stream", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    import_ms = (time.perf_counter() - start) * 1000
+
+    # Keep the timings instead of printing them with the handler's logs
+    steps = {}
+    sync = sys.modules["stream_sync"]
+    sync.print = lambda *args, **kwargs: None
+    sync.log_init_timings = lambda: steps.update(sync.init_timings)
+
+    start = time.perf_counter()
+    response = module.lambda_handler(stream_event(records), None)
+    invoke_ms = (time.perf_counter() - start) * 1000
+    if response["batchItemFailures"]:
+        sys.exit(f"The invocation failed: {response}")
+
+    print(json.dumps({"import": import_ms, "invoke": invoke_ms, "steps": steps}))
+
+
+def run(path, sdk, records):
+    cmd = [sys.executable, __file__, "--child", path, "--records", str(records)]
+    if sdk:
+        cmd.append("--sdk")
+    output = subprocess.run(cmd, check=True, capture_output=True, text=True)
+    return json.loads(output.stdout.splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the cold start of the stream Lambda functions."
+    )
+    parser.add_argument("paths", nargs="*", default=default_paths)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--records", type=int, default=100)
+    parser.add_argument(
+        "--sdk",
+        action="store_true",
+        help="import the installed boto3 and google libraries",
+    )
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_once(args.child, args.sdk, args.records)
+        sys.exit(0)
+
+    for path in args.paths:
+        results = [run(path, args.sdk, args.records) for _ in range(args.runs)]
+        name = os.path.basename(os.path.dirname(path)) or path
+        print(f"{name}: median of {args.runs} runs")
+        for key in ["import", "invoke"]:
+            ms = statistics.median(result[key] for result in results)
+            print(f"  {key + ' ms':<32}{ms:>10.1f}")
+        for step in results[0]["steps"]:
+            ms = statistics.median(result["steps"].get(step, 0) for result in results)
+            print(f"    {step:<30}{ms:>10.1f}")
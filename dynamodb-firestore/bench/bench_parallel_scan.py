@@ -0,0 +1,93 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# Reports how the copy throughput of copy-data/parallel_scan.py scales with
+# the number of scan segments and writer threads. The table is simulated:
+# each Scan request waits --scan-latency seconds, like a round trip to
+# DynamoDB, and each page waits --write-latency seconds, like a commit, so
+# the results show how well the segments and writers overlap rather than
+# the speed of this machine.
+
+import argparse
+import os
+import sys
+import time
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(base_dir, "copy-data"))
+
+from parallel_scan import parallel_scan  # noqa: E402
+
+
+class FakeTable:
+    """Answers Scan requests for `items` keys split into any segments."""
+
+    def __init__(self, items, latency):
+        self.items = [{"pk": {"S": f"ITEM#{i}"}} for i in range(items)]
+        self.latency = latency
+
+    def scan(self, Limit, Segment=0, TotalSegments=1, ExclusiveStartKey=None, **_):
+        time.sleep(self.latency)
+        start = int(ExclusiveStartKey["i"]["N"]) if ExclusiveStartKey else Segment
+        indexes = range(start, len(self.items), TotalSegments)[:Limit]
+        response = {
+            "Items": [self.items[i] for i in indexes],
+            "Count": len(indexes),
+        }
+        if indexes and indexes[-1] + TotalSegments < len(self.items):
+            next_start = indexes[-1] + TotalSegments
+            response["LastEvaluatedKey"] = {"i": {"N": str(next_start)}}
+        return response
+
+
+def bench(table, segments, workers, write_latency):
+    def handle_page(items, on_commit):
+        time.sleep(write_latency)
+        return len(items)
+
+    start = time.perf_counter()
+    read_cnt, write_cnt = parallel_scan(
+        table, {"Limit": 500}, segments, workers, handle_page
+    )
+    elapsed = time.perf_counter() - start
+    assert read_cnt == write_cnt == len(table.items)
+    return write_cnt / elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the parallel scan with simulated latencies."
+    )
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument(
+        "--segments",
+        default="1,2,4,8,16",
+        help="comma separated segment counts",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="writer threads for every segment count (default: as many as "
+        "segments)",
+    )
+    parser.add_argument("--scan-latency", type=float, default=0.05)
+    parser.add_argument("--write-latency", type=float, default=0.1)
+    args = parser.parse_args()
+
+    table = FakeTable(args.items, args.scan_latency)
+    print(f"{'segments':>10}{'workers':>10}{'items/s':>12}{'speedup':>10}")
+    baseline = None
+    for segments in sorted({int(s) for s in args.segments.split(",")}):
+        workers = args.workers or segments
+        rate = bench(table, segments, workers, args.write_latency)
+        baseline = baseline or rate
+        print(f"{segments:>10}{workers:>10}{rate:>12,.0f}{rate / baseline:>9.1f}x")
@@ -0,0 +1,150 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Simulates a copy into a new collection against a backend whose capacity
+# grows as it splits hot key ranges, and drops for a while as if another
+# workload competed for the same ranges. Writes above the capacity fail
+# with contention errors. The simulation runs on a virtual clock, so an
+# hour of writes takes a few seconds.
+#
+# It compares writing without a limit, with the 500/50/5 ramp only, and
+# with the ramp and AIMD backoff of copy-data/rate_limiter.py.
+
+import argparse
+import os
+import sys
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(base_dir, "copy-data"))
+
+from rate_limiter import RateLimiter  # noqa: E402
+
+# Seconds per simulation step
+TICK = 0.1
+# Writes per BulkWriter RPC
+BATCH_SIZE = 20
+# Round trip of a write RPC in seconds
+RTT = 0.05
+
+
+class Backend:
+    """Capacity that follows the 500/50/5 ramp with some headroom."""
+
+    def __init__(self, headroom, drop_start, drop_end, drop_factor):
+        self.headroom = headroom
+        self.drop_start = drop_start
+        self.drop_end = drop_end
+        self.drop_factor = drop_factor
+
+    def capacity(self, t):
+        rate = 500 * self.headroom * 1.5 ** (t / 300)
+        if self.drop_start <= t < self.drop_end:
+            rate *= self.drop_factor
+        return rate
+
+
+def simulate(backend, limiter, seconds, writers, clock):
+    ticks = int(seconds / TICK)
+    sent = [0.0] * (ticks + 1)
+    ready = [0.0] * writers
+    rows = []
+    totals = {"committed": 0.0, "errors": 0.0}
+    window = {"committed": 0.0, "errors": 0.0, "rate": 0.0}
+
+    for tick in range(ticks):
+        t = tick * TICK
+        clock.t = t
+        # Writers that are not waiting send their next batch
+        for i in range(writers):
+            if ready[i] > t:
+                continue
+            delay = limiter.reserve(BATCH_SIZE) if limiter else 0.0
+            send_tick = min(ticks, int((t + delay) / TICK))
+            sent[send_tick] += BATCH_SIZE
+            ready[i] = t + delay + RTT
+
+        # The backend commits what was sent in this tick, up to its capacity
+        capacity = backend.capacity(t) * TICK
+        committed = min(sent[tick], capacity)
+        errors = sent[tick] - committed
+        totals["committed"] += committed
+        totals["errors"] += errors
+        window["committed"] += committed
+        window["errors"] += errors
+        if errors and limiter:
+            limiter.on_contention()
+
+        window["rate"] = limiter.rate() if limiter else float("inf")
+        if (tick + 1) % int(60 / TICK) == 0:
+            rows.append(
+                (
+                    t + TICK,
+                    backend.capacity(t),
+                    window["rate"],
+                    window["committed"] / 60,
+                    window["errors"] / 60,
+                )
+            )
+            window = {"committed": 0.0, "errors": 0.0, "rate": 0.0}
+    return totals, rows
+
+
+class Clock:
+    t = 0.0
+
+    def __call__(self):
+        return self.t
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Simulate the write rate limiter against a backend."
+    )
+    parser.add_argument("--minutes", type=int, default=40)
+    parser.add_argument("--writers", type=int, default=64)
+    parser.add_argument("--headroom", type=float, default=1.2)
+    parser.add_argument("--drop-start", type=float, default=900)
+    parser.add_argument("--drop-end", type=float, default=1500)
+    parser.add_argument("--drop-factor", type=float, default=0.4)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    backend = Backend(
+        args.headroom, args.drop_start, args.drop_end, args.drop_factor
+    )
+    modes = {
+        "unlimited": lambda clock: None,
+        "ramp only": lambda clock: RateLimiter(decrease=1, clock=clock),
+        "ramp + AIMD": lambda clock: RateLimiter(clock=clock),
+    }
+
+    print(f"{'mode':<14}{'committed':>12}{'errors':>12}{'error %':>9}")
+    for name, make_limiter in modes.items():
+        clock = Clock()
+        limiter = make_limiter(clock)
+        totals, rows = simulate(
+            backend, limiter, args.minutes * 60, args.writers, clock
+        )
+        sent = totals["committed"] + totals["errors"]
+        print(
+            f"{name:<14}{totals['committed']:>12,.0f}{totals['errors']:>12,.0f}"
+            f"{totals['errors'] / sent * 100:>8.1f}%"
+        )
+        if args.verbose:
+            print(
+                f"  {'minute':>6}{'capacity/s':>12}{'limit/s':>10}"
+                f"{'committed/s':>13}{'errors/s':>10}"
+            )
+            for t, capacity, rate, committed, errors in rows:
+                print(
+                    f"  {t / 60:>6.0f}{capacity:>12,.0f}{rate:>10,.0f}"
+                    f"{committed:>13,.0f}{errors:>10,.0f}"
+                )
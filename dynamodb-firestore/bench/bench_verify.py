@@ -0,0 +1,112 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Simulates the verification of a copy with copy-data/verify.py in memory:
+# the target is the source with some documents deleted, added and changed.
+# It reports the cost of hashing a document into the range digests, the
+# digest nodes compared to find the leaf ranges that differ, the documents
+# read again by the drill-down, and whether the drill-down names exactly the
+# documents that were changed.
+
+import argparse
+import os
+import random
+import sys
+import time
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(base_dir, "copy-data"))
+
+from doc_ids import doc_id_function  # noqa: E402
+from verify import RangeDigest, compare, diff_items, leaf_function  # noqa: E402
+
+
+def make_docs(items):
+    make_ids = doc_id_function("md5", "PK", "SK")
+    docs = [
+        {
+            "PK": f"CUST#{i // 10}",
+            "SK": f"ORDER#{i}",
+            "order_amount": i * 1.5,
+            "number_of_items": i % 7,
+            "status": "shipped",
+        }
+        for i in range(items)
+    ]
+    return {f"bench/{doc_id}": doc for doc_id, doc in zip(make_ids(docs), docs)}
+
+
+def digest(path_docs, leaf_of, depth, keep=None):
+    result = RangeDigest(leaf_of, depth, keep)
+    batch = list(path_docs.items())
+    for i in range(0, len(batch), 500):
+        result.add(batch[i : i + 500])
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark copy verification.")
+    parser.add_argument("--items", type=int, default=200000)
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument(
+        "--changes",
+        type=int,
+        default=10,
+        help="documents deleted, added and changed in the target, each",
+    )
+    args = parser.parse_args()
+
+    random.seed(1)
+    source = make_docs(args.items)
+    target = dict(source)
+    missing = random.sample(sorted(source), args.changes)
+    for path in missing:
+        del target[path]
+    different = random.sample(sorted(target), args.changes)
+    for path in different:
+        target[path] = dict(target[path], status="lost")
+    extra = [f"bench/{i:032x}" for i in range(args.changes)]
+    for path in extra:
+        target[path] = {"PK": "stray", "SK": path}
+
+    leaf_of = leaf_function("bench", "md5", args.depth)
+    start = time.perf_counter()
+    source_digest = digest(source, leaf_of, args.depth)
+    hash_us = (time.perf_counter() - start) / len(source) * 1e6
+    target_digest = digest(target, leaf_of, args.depth)
+
+    start = time.perf_counter()
+    leaves, compared = compare(source_digest, target_digest)
+    compare_ms = (time.perf_counter() - start) * 1000
+    nodes = len(source_digest.tree())
+
+    keep = set(leaves)
+    found = diff_items(
+        digest(source, leaf_of, args.depth, keep),
+        digest(target, leaf_of, args.depth, keep),
+    )
+    reread = sum(leaf_of(path) in keep for path in target)
+    expected = (sorted(missing), sorted(extra), sorted(different))
+
+    print(f"{len(source)} source and {len(target)} target documents")
+    print(f"Hashing: {hash_us:.2f} us per document")
+    print(
+        f"Compared {compared} of {nodes} digest nodes in {compare_ms:.1f} ms, "
+        f"{len(leaves)} leaf ranges differ"
+    )
+    print(
+        f"Drill-down read {reread} target documents "
+        f"({reread / len(target):.2%} of the copy)"
+    )
+    for name, paths, injected in zip(
+        ["Missing", "Extra", "Different"], found, expected
+    ):
+        print(f"{name}: found {len(paths)}, exact: {paths == injected}")
@@ -0,0 +1,111 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Replays INSERT stream records of the items of examples/load_items.py
+# through the lambda_handler of a stream replication function, in batches
+# like the DynamoDB event source sends them, and writes the throughput and
+# handler latency to a JSON file in the format of the copy scripts' --stats.
+#
+# The GCP credentials are anonymous, so the function is meant to write to
+# the Firestore or Datastore emulator set in FIRESTORE_EMULATOR_HOST or
+# DATASTORE_EMULATOR_HOST.
+
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import time
+
+from boto3.dynamodb.types import TypeSerializer
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(base_dir, "examples"))
+# The modules the functions import, which their images copy next to them
+sys.path.insert(0, os.path.join(base_dir, "copy-data"))
+
+from load_items import read_templates, synthesize  # noqa: E402
+from progress import percentile  # noqa: E402
+
+
+def stream_records(table_name, items, padding):
+    serializer = TypeSerializer()
+    templates = read_templates(table_name)
+    for i in range(items):
+        item = synthesize(templates[i % len(templates)], i // len(templates), padding)
+        image = {k: serializer.serialize(v) for k, v in item.items()}
+        yield {
+            "eventName": "INSERT",
+            "dynamodb": {
+                "Keys": {"PK": image["PK"], "SK": image["SK"]},
+                "NewImage": image,
+                "SequenceNumber": str(i + 1),
+            },
+        }
+
+
+def load_function(path):
+    spec = importlib.util.spec_from_file_location("sync_from_stream", path)
+    function = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(function)
+    return function
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Replay stream records through a replication function."
+    )
+    parser.add_argument("function", help="path of sync-from-stream.py")
+    parser.add_argument("table_name", choices=["Customer_Order", "Product"])
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--padding", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--stats", help="JSON file to write the totals to")
+    args = parser.parse_args()
+
+    os.environ.update(
+        DYNAMODB_TABLE_NAME=args.table_name,
+        DYNAMODB_PK="PK",
+        DYNAMODB_SK="SK",
+        AWS_SECRET_ARN="unused",
+    )
+    function = load_function(args.function)
+    from google.auth.credentials import AnonymousCredentials
+
+    sys.modules["stream_sync"].clients["credentials"] = AnonymousCredentials()
+
+    records = list(stream_records(args.table_name, args.items, args.padding))
+    latencies = []
+    failed = 0
+    start = time.monotonic()
+    for i in range(0, len(records), args.batch_size):
+        batch_start = time.monotonic()
+        result = function.lambda_handler(
+            {"Records": records[i : i + args.batch_size]}, None
+        )
+        latencies.append(time.monotonic() - batch_start)
+        failed += len(result["batchItemFailures"])
+    elapsed = time.monotonic() - start
+
+    latencies.sort()
+    stats = {
+        "elapsed_seconds": round(elapsed, 3),
+        "items_committed": len(records),
+        "batches": len(latencies),
+        "failed_batches": failed,
+        "items_per_second": round(len(records) / elapsed, 1),
+        "commit_latency_p50_ms": round(percentile(latencies, 0.5) * 1000, 1),
+        "commit_latency_p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+    }
+    print(f"Throughput: {stats}")
+    if args.stats:
+        with open(args.stats, "w") as fout:
+            json.dump(stats, fout, indent=2)
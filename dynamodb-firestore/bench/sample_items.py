@@ -0,0 +1,47 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Builds DynamoDB items, in attribute value format, from the rows of the
+# files in examples/sample_data.
+
+import csv
+import glob
+import os
+
+from decimal import Decimal
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def to_attribute_value(value):
+    try:
+        Decimal(value)
+        return {"N": value}
+    except ArithmeticError:
+        return {"S": value}
+
+
+def load_sample_items():
+    items = []
+    pattern = os.path.join(base_dir, "examples", "sample_data", "*.tsv")
+    for path in sorted(glob.glob(pattern)):
+        with open(path, newline="") as tsvfile:
+            reader = csv.reader(tsvfile, delimiter="\t", quotechar='"')
+            header = next(reader)
+            for row in reader:
+                items.append(
+                    {
+                        name: to_attribute_value(value)
+                        for name, value in zip(header, row)
+                        if value
+                    }
+                )
+    return items
@@ -0,0 +1,107 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import functools
+
+from concurrent.futures import ThreadPoolExecutor
+from read_capacity import is_throttle
+
+# Placed on the page queue once per writer after all segments are scanned
+_DONE = object()
+
+
+async def async_parallel_scan(
+    ddb_client,
+    scan_kwargs,
+    segments,
+    workers,
+    handle_page,
+    checkpoint=None,
+    read_limiter=None,
+):
+    """The asyncio counterpart of parallel_scan.parallel_scan.
+
+    Segments are scanned with the blocking boto3 client on a thread pool,
+    and `workers` asyncio tasks drain the bounded page queue by awaiting
+    the coroutine `handle_page(items, on_commit)`. A single process can
+    therefore keep hundreds of commits in flight. The first exception
+    cancels every task and is re-raised.
+    """
+    if checkpoint:
+        checkpoint.check_segments(segments)
+
+    loop = asyncio.get_running_loop()
+    pages = asyncio.Queue(maxsize=workers * 2)
+    counts = {"read": 0, "write": 0}
+    executor = ThreadPoolExecutor(max_workers=segments)
+
+    async def scan(segment):
+        kwargs = dict(scan_kwargs)
+        if segments > 1:
+            kwargs["Segment"] = segment
+            kwargs["TotalSegments"] = segments
+        if read_limiter:
+            kwargs["ReturnConsumedCapacity"] = "TOTAL"
+        progress = None
+        if checkpoint:
+            progress = checkpoint.stream(f"segment/{segment}")
+            if progress.done:
+                return
+            if progress.position:
+                kwargs["ExclusiveStartKey"] = progress.position
+        while True:
+            if read_limiter:
+                kwargs["Limit"] = read_limiter.page_limit()
+            try:
+                response = await loop.run_in_executor(
+                    executor, functools.partial(ddb_client.scan, **kwargs)
+                )
+            except Exception as e:
+                if not (read_limiter and is_throttle(e)):
+                    raise
+                await asyncio.sleep(read_limiter.on_throttle())
+                continue
+            if read_limiter:
+                await asyncio.sleep(read_limiter.consume(response))
+            counts["read"] += response.get("Count", 0)
+            start_key = response.get("LastEvaluatedKey", None)
+            on_commit = None
+            if progress:
+                on_commit = progress.submit(start_key, done=start_key is None)
+            await pages.put((response.get("Items", []), on_commit))
+            if start_key is None:
+                break
+            kwargs["ExclusiveStartKey"] = start_key
+
+    async def scan_all():
+        await asyncio.gather(*(scan(segment) for segment in range(segments)))
+        for _ in range(workers):
+            await pages.put(_DONE)
+
+    async def write():
+        while True:
+            page = await pages.get()
+            if page is _DONE:
+                return
+            written = await handle_page(*page)
+            counts["write"] += written
+
+    tasks = [asyncio.create_task(scan_all())]
+    tasks += [asyncio.create_task(write()) for _ in range(workers)]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        executor.shutdown(wait=False)
+
+    return counts["read"], counts["write"]
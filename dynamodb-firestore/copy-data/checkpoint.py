@@ -0,0 +1,144 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Records the progress of a copy in a SQLite file so an interrupted run can
+# be resumed. Progress is tracked per stream: a DynamoDB scan segment, whose
+# position is the LastEvaluatedKey of the last committed page, an S3
+# export data file, whose position is the number of committed lines, or the
+# changes of an incremental export, whose position is the number of
+# committed changes.
+#
+# Pages are committed out of order by the write sinks, so a stream's
+# position only advances past a page once it and every earlier page of the
+# stream have been acknowledged.
+
+import base64
+import json
+import sqlite3
+import threading
+
+
+def _encode(obj):
+    # LastEvaluatedKey may hold binary key values
+    if isinstance(obj, bytes):
+        return {"__bytes__": base64.b64encode(obj).decode()}
+    raise TypeError
+
+
+def _decode(obj):
+    if "__bytes__" in obj:
+        return base64.b64decode(obj["__bytes__"])
+    return obj
+
+
+class CheckpointError(Exception):
+    pass
+
+
+class Checkpoint:
+    def __init__(self, path, table_name, resume=False):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS progress "
+            "(stream TEXT PRIMARY KEY, position TEXT, done INTEGER)"
+        )
+        row = self._db.execute(
+            "SELECT value FROM meta WHERE key = 'table_name'"
+        ).fetchone()
+        if resume:
+            if row is None:
+                raise CheckpointError(f"No checkpoint to resume in {path}")
+            if row[0] != table_name:
+                raise CheckpointError(f"{path} is a checkpoint of table {row[0]}")
+        else:
+            self._db.execute("DELETE FROM meta")
+            self._db.execute("DELETE FROM progress")
+            self._db.execute("INSERT INTO meta VALUES ('table_name', ?)", (table_name,))
+        self._db.commit()
+
+    def check_segments(self, total_segments):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM meta WHERE key = 'total_segments'"
+            ).fetchone()
+            if row is None:
+                self._db.execute(
+                    "INSERT INTO meta VALUES ('total_segments', ?)",
+                    (str(total_segments),),
+                )
+                self._db.commit()
+            elif int(row[0]) != total_segments:
+                raise CheckpointError(
+                    f"The checkpoint was created with --segments {row[0]}"
+                )
+
+    def stream(self, name):
+        """Returns a StreamProgress with the last committed position of name."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT position, done FROM progress WHERE stream = ?", (name,)
+            ).fetchone()
+        if row is None:
+            return StreamProgress(self, name, None, False)
+        position = json.loads(row[0], object_hook=_decode)
+        return StreamProgress(self, name, position, bool(row[1]))
+
+    def _save(self, name, position, done):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO progress VALUES (?, ?, ?)",
+                (name, json.dumps(position, default=_encode), int(done)),
+            )
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class StreamProgress:
+    def __init__(self, checkpoint, name, position, done):
+        self.checkpoint = checkpoint
+        self.name = name
+        self.position = position
+        self.done = done
+        self._lock = threading.Lock()
+        self._pages = {}
+        self._next_seq = 0
+        self._next_ack = 0
+
+    def submit(self, position, done=False):
+        """Registers the next page of the stream.
+
+        Returns the callback to call once the page has been committed, which
+        persists position (and done, for the last page) when every earlier
+        page has been committed too.
+        """
+        with self._lock:
+            seq = self._next_seq
+            self._next_seq += 1
+            self._pages[seq] = None
+        return lambda: self._ack(seq, position, done)
+
+    def _ack(self, seq, position, done):
+        with self._lock:
+            self._pages[seq] = (position, done)
+            advanced = False
+            while self._pages.get(self._next_ack) is not None:
+                self.position, self.done = self._pages.pop(self._next_ack)
+                self._next_ack += 1
+                advanced = True
+            if advanced:
+                self.checkpoint._save(self.name, self.position, self.done)
@@ -0,0 +1,132 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Runs the CPU-bound parse, convert and document ID hashing steps in a pool
+# of processes, so they are not limited by the GIL shared with the threads
+# doing network I/O. Each task is a whole page or chunk of items, to keep
+# the pickling cost per item low, and returns (doc_id, doc) pairs that are
+# ready to write.
+
+import multiprocessing
+
+from concurrent.futures import Future, ProcessPoolExecutor
+from ddb_convert import make_item_converter
+from doc_ids import doc_id_function
+
+try:
+    # Parses export lines several times faster than json
+    from orjson import loads
+except ImportError:
+    from json import loads
+
+
+class _Converter:
+    # The item converter and document ID function of a pool
+    def __init__(self, pk, sk, binary_base64, type_map, doc_id_strategy):
+        self.convert_item = make_item_converter(binary_base64, type_map)
+        self.doc_ids = doc_id_function(doc_id_strategy, pk, sk)
+
+    def _with_doc_ids(self, docs):
+        return list(zip(self.doc_ids(docs), docs))
+
+    def scan_items(self, items):
+        return self._with_doc_ids([self.convert_item(item) for item in items])
+
+    def export_lines(self, lines):
+        convert_item = self.convert_item
+        return self._with_doc_ids([convert_item(loads(line)["Item"]) for line in lines])
+
+    def change_lines(self, lines):
+        timestamps = []
+        keys = []
+        docs = []
+        for line in lines:
+            change = loads(line)
+            timestamps.append(int(change["Metadata"]["WriteTimestampMicros"]["N"]))
+            keys.append(self.convert_item(change["Keys"]))
+            image = change.get("NewImage")
+            docs.append(self.convert_item(image) if image is not None else None)
+        return list(zip(timestamps, self.doc_ids(keys), keys, docs, map(len, lines)))
+
+
+# Converter of a worker process, set by _init_worker. Pools that convert in
+# the calling thread keep their own, so that several can coexist.
+_converter = None
+
+
+def _init_worker(*args):
+    global _converter
+    _converter = _Converter(*args)
+
+
+def _convert(method, arg):
+    return getattr(_converter, method)(arg)
+
+
+class ConvertPool:
+    """Converts chunks of items in worker processes.
+
+    With processes=0 the conversion runs in the calling thread, and the
+    returned futures are already done.
+    """
+
+    def __init__(
+        self,
+        processes,
+        pk,
+        sk,
+        binary_base64=False,
+        type_map=None,
+        doc_id_strategy="md5",
+    ):
+        self._executor = None
+        args = (pk, sk, binary_base64, type_map, doc_id_strategy)
+        # Also fails here on an invalid strategy rather than in the workers
+        self._converter = _Converter(*args)
+        if processes:
+            # Forking a process that holds gRPC channels is not safe
+            self._executor = ProcessPoolExecutor(
+                processes,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=args,
+            )
+
+    def _submit(self, method, arg):
+        if self._executor:
+            return self._executor.submit(_convert, method, arg)
+        future = Future()
+        try:
+            future.set_result(getattr(self._converter, method)(arg))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def convert_scan_items(self, items):
+        """Returns a future of the (doc_id, doc) pairs for scanned items."""
+        return self._submit("scan_items", items)
+
+    def convert_export_lines(self, lines):
+        """Returns a future of the (doc_id, doc) pairs for S3 export lines."""
+        return self._submit("export_lines", lines)
+
+    def convert_change_lines(self, lines):
+        """Returns a future of the changes in incremental export lines.
+
+        Each change is a (timestamp, doc_id, keys, doc, nbytes) tuple, where
+        keys is the document of the item's key attributes and doc is None
+        for a delete.
+        """
+        return self._submit("change_lines", lines)
+
+    def close(self):
+        if self._executor:
+            self._executor.shutdown()
@@ -9,128 +9,87 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import hashlib
+import argparse
 import sys
-import json
-import boto3
 
-from google.cloud import firestore
-from boto3.dynamodb.types import TypeDeserializer
-from decimal import Decimal
-
-
-ddb_client = boto3.client("dynamodb")
-firestore_client = firestore.Client()
-# Maximum number of writes that can be passed
-# to a Commit operation in Firestore is 500
-limit = 500
-
-
-def dumps(item: dict) -> str:
-    return json.dumps(item, default=default_type_error_handler)
-
-
-def default_type_error_handler(obj):
-    if isinstance(obj, Decimal):
-        return int(obj)
-    raise TypeError
-
-
-def copy_table(table_name):
-    global ddb_client, firestore_client
-    if not ddb_client:
-        ddb_client = boto3.client("dynamodb")
-    if not firestore_client:
-        firestore_client = firestore.Client()
-
-    res = ddb_client.describe_table(TableName=table_name)
-    pk, sk = parse_schema(res)
-
-    scan_kwargs = {
-        "Limit": limit,
-        "TableName": table_name,
-    }
-    done = False
-    start_key = None
-    read_cnt = 0
-    write_cnt = 0
-
-    print(f"DDB PK -> Firestore ID")
-    while not done:
-        if start_key:
-            scan_kwargs["ExclusiveStartKey"] = start_key
-
-        response = ddb_client.scan(**scan_kwargs)
-        ddb_items = response.get("Items", [])
-        read_cnt += response.get("Count", 0)
-        fs_docs = convert_items(ddb_items)
-        write_batch(fs_docs, table_name, pk, sk)
-        write_cnt += len(fs_docs)
-        start_key = response.get("LastEvaluatedKey", None)
-        done = start_key is None
-
-    print(f"Total items read from DynamoDB: {read_cnt}")
-    print(f"Total items written to Firestore: {write_cnt}")
-
-
-def parse_schema(schema_dict):
-    pk = None
-    sk = None
-
-    table_dict = schema_dict["Table"]
-    key_schema = table_dict["KeySchema"]
-
-    for key in key_schema:
-        key_name = key["AttributeName"]
-        key_type = key["KeyType"]
-
-        if key_type == "HASH":
-            pk = key_name
-        if key_type == "RANGE":
-            sk = key_name
-
-    return pk, sk
-
-
-def write_batch(fs_docs, table, pk, sk):
-
-    batch = firestore_client.batch()
-
-    for doc in fs_docs:
-        pk_val = doc[pk]
-
-        if sk is not None:
-            sk_val = doc[sk]
-
-        doc_id_val = pk_val if sk_val is None else pk_val + sk_val
-        doc_id_hash = hashlib.md5(doc_id_val.encode())
-        doc_id_md5 = doc_id_hash.hexdigest()
-
-        print(f"{pk_val} -> {doc_id_md5}")
-
-        doc_ref = firestore_client.collection(table).document(doc_id_md5)
-        batch.set(doc_ref, doc)
-
-    batch.commit()
-
-
-def ddb_deserialize(r, type_deserializer=TypeDeserializer()):
-    return type_deserializer.deserialize({"M": r})
-
-
-def convert_items(db_items):
-    fs_docs = []
-
-    for item_dict in db_items:
-        item_as_json = dumps(ddb_deserialize(item_dict))
-        fs_doc = json.loads(item_as_json)
-        fs_docs.append(fs_doc)
-    return fs_docs
+from engine import add_copy_arguments, copy_options, copy_table, verify_table
+from scan_source import ScanSource
 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        sys.exit("Please provide a DynamoDB table name.")
-
-    table_name = sys.argv[1]
-    copy_table(table_name)
+    parser = argparse.ArgumentParser(
+        description="Copy a DynamoDB table to Firestore."
+    )
+    parser.add_argument("table_name", help="DynamoDB table name")
+    parser.add_argument(
+        "--segments",
+        type=int,
+        default=1,
+        help="number of parallel DynamoDB scan segments (default: 1)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of threads writing to Firestore (default: 1)",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["threads", "asyncio"],
+        default="threads",
+        help="run the copy on threads, or on an asyncio event loop with a "
+        "Firestore AsyncClient and --workers writer tasks (default: threads)",
+    )
+    parser.add_argument(
+        "--read-capacity-percent",
+        type=float,
+        help="percentage of the provisioned read capacity of the table that "
+        "the scan may consume (default: no limit)",
+    )
+    parser.add_argument(
+        "--read-capacity",
+        type=float,
+        help="read capacity units per second that the scan may consume, for "
+        "example for on-demand tables (default: no limit)",
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="compare an existing copy with the table instead of copying it, "
+        "with the same --doc-id, --type-map and --key-routes",
+    )
+    parser.add_argument(
+        "--verify-depth",
+        type=int,
+        default=4,
+        help="hex digits of the document ID ranges that --verify compares "
+        "digests of (default: 4)",
+    )
+    add_copy_arguments(parser, "firestore")
+    args = parser.parse_args()
+    if args.segments < 1:
+        parser.error("--segments must be at least 1")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    options = copy_options(parser, args)
+
+    source = ScanSource(
+        args.table_name,
+        segments=args.segments,
+        workers=args.workers,
+        read_capacity_percent=args.read_capacity_percent,
+        read_capacity=args.read_capacity,
+    )
+    if args.verify:
+        matches = verify_table(
+            source,
+            "firestore",
+            type_map=options["type_map"],
+            processes=args.processes,
+            doc_id_strategy=args.doc_id,
+            key_routes=options["key_routes"],
+            depth=args.verify_depth,
+        )
+        sys.exit(0 if matches else 1)
+
+    copy_table(source, "firestore", engine=args.engine, **options)
@@ -0,0 +1,156 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Converts DynamoDB attribute values, such as {"N": "42"}, directly into
+# the Python values the Firestore and Datastore clients accept, in a
+# single pass and without an intermediate JSON copy of the item.
+#
+# How numbers and binary values are stored can be chosen per top-level
+# attribute with a type map such as:
+#
+#   {"*": "auto", "order_amount": "decimal", "thumbnail": "base64"}
+#
+# Number types:
+#   auto     integral values that fit in 64 bits as int, others as float
+#   int      truncated to int, or the decimal string outside 64 bits
+#   float    float
+#   decimal  the exact decimal string from DynamoDB
+# Binary types:
+#   bytes    Firestore bytes / Datastore blob
+#   base64   base64 encoded string
+#
+# The "*" key sets the number type for attributes without a rule. Sets are
+# stored as arrays.
+
+import base64
+import json
+
+from decimal import Decimal
+
+_INT64_MIN = -(2 ** 63)
+_INT64_MAX = 2 ** 63 - 1
+
+
+def _passthrough(value):
+    return value
+
+
+def _null(value):
+    return None
+
+
+def _int(value):
+    try:
+        number = int(value)
+    except ValueError:
+        number = int(Decimal(value))
+    if _INT64_MIN <= number <= _INT64_MAX:
+        return number
+    # Firestore and Datastore reject larger integers
+    return value
+
+
+def _to_base64(value):
+    return base64.b64encode(value).decode()
+
+
+def _auto(value):
+    try:
+        number = int(value)
+    except ValueError:
+        number = Decimal(value)
+        if number != number.to_integral_value():
+            return float(number)
+        number = int(number)
+    if _INT64_MIN <= number <= _INT64_MAX:
+        return number
+    return float(number)
+
+
+NUMBER_TYPES = {
+    "auto": _auto,
+    "int": _int,
+    "float": float,
+    "decimal": _passthrough,
+}
+BINARY_TYPES = {"bytes", "base64"}
+
+
+def load_type_map(path):
+    with open(path) as fin:
+        type_map = json.load(fin)
+    for attribute, type_name in type_map.items():
+        if type_name in NUMBER_TYPES:
+            continue
+        if type_name in BINARY_TYPES and attribute != "*":
+            continue
+        raise ValueError(f"Invalid type {type_name!r} for attribute {attribute!r}")
+    return type_map
+
+
+def _make_value_converter(number, binary):
+    def convert(attribute_value):
+        for tag, value in attribute_value.items():
+            return converters[tag](value)
+
+    converters = {
+        "S": _passthrough,
+        "N": number,
+        "B": binary,
+        "BOOL": _passthrough,
+        "NULL": _null,
+        "SS": list,
+        "NS": lambda value: [number(n) for n in value],
+        "BS": lambda value: [binary(b) for b in value],
+        "M": lambda value: {k: convert(v) for k, v in value.items()},
+        "L": lambda value: [convert(v) for v in value],
+    }
+    return convert
+
+
+def make_item_converter(binary_base64=False, type_map=None):
+    """Returns a function that converts a DynamoDB item into a document.
+
+    Set binary_base64 when binary values are base64 encoded strings, as in
+    S3 exports and stream events, rather than bytes as returned by scan.
+    The rules in type_map are resolved here, once, into one converter per
+    attribute so that converting an item makes no per-value decisions.
+    """
+    type_map = dict(type_map or {})
+    default_number = NUMBER_TYPES[type_map.pop("*", "auto")]
+
+    if binary_base64:
+        to_bytes = base64.b64decode
+        to_base64 = _passthrough
+    else:
+        to_bytes = _passthrough
+        to_base64 = _to_base64
+
+    default_convert = _make_value_converter(default_number, to_bytes)
+    attribute_converters = {}
+    for attribute, type_name in type_map.items():
+        if type_name in NUMBER_TYPES:
+            convert = _make_value_converter(NUMBER_TYPES[type_name], to_bytes)
+        elif type_name == "base64":
+            convert = _make_value_converter(default_number, to_base64)
+        else:
+            convert = default_convert
+        attribute_converters[attribute] = convert
+
+    if not attribute_converters:
+        return lambda item: {k: default_convert(v) for k, v in item.items()}
+
+    get_converter = attribute_converters.get
+
+    def convert_item(item):
+        return {k: get_converter(k, default_convert)(v) for k, v in item.items()}
+
+    return convert_item
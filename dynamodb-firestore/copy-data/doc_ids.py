@@ -0,0 +1,186 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Document ID strategies. Each one builds the IDs of a whole page of
+# converted documents from their partition key and optional sort key:
+#
+#   md5     MD5 hex digest of str(pk) + str(sk), the original IDs. Keys such
+#           as ("a", "bc") and ("ab", "c") get the same ID.
+#   xxh3    128-bit xxHash hex digest of the length-prefixed keys. Needs the
+#           xxhash package.
+#   concat  the percent-encoded keys joined by "#", for example "ab#c".
+#   base64  URL-safe base64 of the keys as a JSON array, which keeps the
+#           key types. Binary keys are {"b": <base64 of the bytes>}.
+#
+# The hashes spread documents evenly over the key range. concat and base64
+# keep the keys readable or recoverable with decode_doc_id, but keep their
+# order too, so tables with sequential keys write to a hot key range. Their
+# IDs grow with the keys, and keys too long for an ID raise a ValueError.
+
+import base64
+import hashlib
+import json
+import re
+import string
+
+from urllib.parse import quote, unquote
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+STRATEGIES = ("md5", "xxh3", "concat", "base64")
+# Characters that quote() leaves as they are
+_UNRESERVED = re.compile(r"[A-Za-z0-9_.~-]*")
+_UNRESERVED_CHARS = frozenset(string.ascii_letters + string.digits + "_.~-")
+# Maximum size of a document ID in Firestore and of a key name in Datastore.
+# concat and base64 IDs grow with the keys, so they can exceed it.
+MAX_ID_BYTES = 1500
+
+
+def md5_doc_ids(docs, pk, sk):
+    """Returns the MD5 hex digest of the partition and sort key of each doc."""
+    md5 = hashlib.md5
+    if sk is None:
+        return [md5(str(doc[pk]).encode()).hexdigest() for doc in docs]
+    return [md5((str(doc[pk]) + str(doc[sk])).encode()).hexdigest() for doc in docs]
+
+
+def xxh3_doc_ids(docs, pk, sk):
+    """Returns the xxHash of the length-prefixed keys of each doc."""
+    xxh3 = xxhash.xxh3_128_hexdigest
+    if sk is None:
+        return [xxh3(str(doc[pk]).encode()) for doc in docs]
+    ids = []
+    for doc in docs:
+        pk_value = str(doc[pk])
+        ids.append(xxh3(f"{len(pk_value)}:{pk_value}{doc[sk]}".encode()))
+    return ids
+
+
+def _escape(doc_id):
+    # Firestore and Datastore reserve the IDs ".", ".." and "__.*__"
+    if doc_id[:1] in (".", "_"):
+        return f"%{ord(doc_id[0]):02X}{doc_id[1:]}"
+    return doc_id
+
+
+def _quote(value):
+    # Most keys need no encoding, and are much faster to check than quote
+    value = str(value)
+    if _UNRESERVED.fullmatch(value):
+        return value
+    return quote(value, safe="")
+
+
+def quote_key(value):
+    """Returns a key value percent-encoded for use as a document ID."""
+    return _escape(_quote(value))
+
+
+def _quote_page(keys, separators):
+    # Percent-encodes the keys of a page, "\0" separated key values joined by
+    # "\n", as one string with a replace() for each character that needs
+    # it, which is several times faster than quoting the values one by one.
+    # Returns None if the keys are not ASCII or contain the separators.
+    if not keys.isascii() or keys.count("\n") + keys.count("\0") != separators:
+        return None
+    # % first, so that the escapes of the other characters are kept
+    for char in sorted(set(keys) - _UNRESERVED_CHARS, key=lambda c: c != "%"):
+        if char not in "\n\0":
+            keys = keys.replace(char, f"%{ord(char):02X}")
+    return keys
+
+
+def _check_lengths(strategy, ids, docs, pk, sk):
+    # The IDs are ASCII, so their length is their size in bytes
+    if max(map(len, ids), default=0) <= MAX_ID_BYTES:
+        return ids
+    doc_id, doc = next((i, d) for i, d in zip(ids, docs) if len(i) > MAX_ID_BYTES)
+    keys = [doc[pk]] if sk is None else [doc[pk], doc[sk]]
+    raise ValueError(
+        f"The {strategy} document ID of the keys {keys!r} is {len(doc_id)} "
+        f"bytes, over the limit of {MAX_ID_BYTES}; use the md5 or xxh3 "
+        "document IDs for this table"
+    )
+
+
+def concat_doc_ids(docs, pk, sk):
+    """Returns the percent-encoded keys of each doc joined by "#"."""
+    if not docs:
+        return []
+    if sk is None:
+        keys = [str(doc[pk]) for doc in docs]
+        separators = len(docs) - 1
+    else:
+        keys = [str(doc[pk]) + "\0" + str(doc[sk]) for doc in docs]
+        separators = 2 * len(docs) - 1
+    text = _quote_page("\n".join(keys), separators)
+    if text is not None:
+        ids = text.replace("\0", "#").split("\n")
+        if text[:1] in (".", "_") or "\n." in text or "\n_" in text:
+            ids = [_escape(doc_id) for doc_id in ids]
+    elif sk is None:
+        ids = [quote_key(doc[pk]) for doc in docs]
+    else:
+        ids = [_escape(_quote(doc[pk]) + "#" + _quote(doc[sk])) for doc in docs]
+    return _check_lengths("concat", ids, docs, pk, sk)
+
+
+def _json_key(value):
+    # Binary keys are tagged, so that decode_doc_id returns them as bytes
+    if isinstance(value, bytes):
+        return {"b": base64.b64encode(value).decode()}
+    return str(value)
+
+
+def _decode_json_key(value):
+    return base64.b64decode(value["b"])
+
+
+def base64_doc_ids(docs, pk, sk):
+    """Returns the URL-safe base64 of the keys of each doc as a JSON array."""
+    encode = base64.urlsafe_b64encode
+    dumps = json.JSONEncoder(separators=(",", ":"), default=_json_key).encode
+    if sk is None:
+        keys = ([doc[pk]] for doc in docs)
+    else:
+        keys = ([doc[pk], doc[sk]] for doc in docs)
+    ids = [encode(dumps(key).encode()).decode().rstrip("=") for key in keys]
+    return _check_lengths("base64", ids, docs, pk, sk)
+
+
+def doc_id_function(strategy, pk, sk):
+    """Returns a function that takes a list of docs and returns their IDs."""
+    if strategy == "xxh3" and xxhash is None:
+        raise ValueError("The xxh3 document IDs need the xxhash package")
+    functions = {
+        "md5": md5_doc_ids,
+        "xxh3": xxh3_doc_ids,
+        "concat": concat_doc_ids,
+        "base64": base64_doc_ids,
+    }
+    if strategy not in functions:
+        raise ValueError(f"Unknown document ID strategy {strategy!r}")
+    function = functions[strategy]
+    return lambda docs: function(docs, pk, sk)
+
+
+def decode_doc_id(strategy, doc_id):
+    """Returns the list of key values a concat or base64 doc_id was made of."""
+    if strategy == "concat":
+        return [unquote(part) for part in doc_id.split("#")]
+    if strategy == "base64":
+        padding = "=" * (-len(doc_id) % 4)
+        keys = base64.urlsafe_b64decode(doc_id + padding)
+        return json.loads(keys, object_hook=_decode_json_key)
+    raise ValueError(f"{strategy} document IDs cannot be decoded")
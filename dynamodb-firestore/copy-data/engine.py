@@ -0,0 +1,309 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# The copy engine behind the four copy scripts. A source reads DynamoDB
+# items, from a table scan (scan_source.py) or an S3 export
+# (export_source.py), and converts them in a ConvertPool; a Pipeline
+# (pipeline.py) places the documents at their paths and writes them to the
+# sink of the target, Firestore or Datastore (write_sink.py). The stream
+# replication functions run the same pipeline and sinks on the records of
+# stream events, see stream_sync.py.
+#
+# A source has a table_name, a binary_base64 flag, describe_table(),
+# copy(table, pipeline, pool, checkpoint) that returns the items read and
+# written, and summary(read_cnt) that describes what it read.
+
+import asyncio
+
+from checkpoint import Checkpoint
+from convert_pool import ConvertPool
+from ddb_convert import load_type_map
+from doc_ids import STRATEGIES
+from key_routes import load_key_routes
+from pipeline import TARGETS, Pipeline, parse_schema
+from progress import ProgressReporter
+from rate_limiter import RateLimiter
+from verify import (
+    HEX_STRATEGIES,
+    RangeDigest,
+    leaf_function,
+    read_datastore,
+    read_firestore,
+    verify_copy,
+)
+from write_sink import make_client, make_sink
+
+# Default maximum number of outstanding writes of each target: BulkWriter
+# RPCs for Firestore, and batch commits for Datastore
+MAX_IN_FLIGHT = {"firestore": 100, "datastore": 8}
+
+
+def copy_table(
+    source,
+    target,
+    sink_type="bulk",
+    max_in_flight=None,
+    type_map=None,
+    checkpoint_path=None,
+    resume=False,
+    processes=0,
+    engine="threads",
+    progress_interval=10,
+    mapping_path=None,
+    stats_path=None,
+    rate_limiter=None,
+    doc_id_strategy="md5",
+    key_routes=None,
+):
+    """Copies the table of source to target, "firestore" or "datastore".
+
+    With engine "asyncio", the source writes from asyncio tasks with a
+    Firestore AsyncClient, which only scan sources and Firestore support.
+    Returns the (read_cnt, write_cnt) of the copy.
+    """
+    if engine == "asyncio" and target != "firestore":
+        raise ValueError("The asyncio engine only writes to Firestore")
+    sink_options = {
+        "max_in_flight": max_in_flight or MAX_IN_FLIGHT[target],
+        "rate_limiter": rate_limiter,
+    }
+    table = source.describe_table()
+    pk, sk = parse_schema(table)
+    checkpoint = None
+    if checkpoint_path:
+        checkpoint = Checkpoint(checkpoint_path, source.table_name, resume)
+
+    # The clients are created here rather than on import, and the asyncio
+    # engine creates its own in its event loop
+    sink = None
+    if engine == "threads":
+        sink = make_sink(make_client(target), target, sink_type, **sink_options)
+    reporter = ProgressReporter(progress_interval, mapping_path, sink)
+    pipeline = Pipeline(source.table_name, pk, sk, sink, reporter, key_routes)
+    pool = ConvertPool(
+        processes,
+        pk,
+        sk,
+        binary_base64=source.binary_base64,
+        type_map=type_map,
+        doc_id_strategy=doc_id_strategy,
+    )
+
+    async def copy_async():
+        # The AsyncClient must be created in the event loop it is used in
+        client = make_client(target, asynchronous=True)
+        pipeline.sink = make_sink(client, target, "async", **sink_options)
+        reporter.sink = pipeline.sink
+        return await source.copy_async(table, pipeline, pool, checkpoint)
+
+    # The pool, the sink, the reporter and the checkpoint are closed when
+    # the copy fails too, so that their processes and threads do not keep
+    # the script from exiting
+    try:
+        if engine == "asyncio":
+            read_cnt, write_cnt = asyncio.run(copy_async())
+        else:
+            read_cnt, write_cnt = source.copy(table, pipeline, pool, checkpoint)
+    finally:
+        pool.close()
+        try:
+            if pipeline.sink:
+                pipeline.sink.close()
+        finally:
+            stats = reporter.close(stats_path)
+            if checkpoint:
+                checkpoint.close()
+
+    print(source.summary(read_cnt))
+    print(f"Total items written to {TARGETS[target]}: {write_cnt}")
+    print(f"{TARGETS[target]} writes: {pipeline.sink.stats}")
+    print(f"Throughput: {stats}")
+    return read_cnt, write_cnt
+
+
+def verify_table(
+    source,
+    target,
+    type_map=None,
+    processes=0,
+    doc_id_strategy="md5",
+    key_routes=None,
+    depth=4,
+):
+    """Compares a copy in target with the table of a scan source.
+
+    See verify.py. Returns True if every document matches its item.
+    """
+    table = source.describe_table()
+    pk, sk = parse_schema(table)
+    pipeline = Pipeline(source.table_name, pk, sk, key_routes=key_routes)
+    pool = ConvertPool(
+        processes,
+        pk,
+        sk,
+        binary_base64=source.binary_base64,
+        type_map=type_map,
+        doc_id_strategy=doc_id_strategy,
+    )
+    leaf_of = leaf_function(source.table_name, doc_id_strategy, depth)
+    client = make_client(target)
+    read_documents = read_firestore if target == "firestore" else read_datastore
+
+    def read_source(keep):
+        digest = RangeDigest(leaf_of, depth, keep)
+
+        def handle_page(ddb_items, on_commit):
+            id_docs = pool.convert_scan_items(ddb_items).result()
+            digest.add([(pipeline.path(doc_id, doc), doc) for doc_id, doc in id_docs])
+            return len(id_docs)
+
+        source.scan(table, handle_page)
+        return digest
+
+    def read_target(keep):
+        digest = RangeDigest(leaf_of, depth, keep)
+        read_documents(
+            client,
+            source.table_name,
+            digest,
+            doc_id_strategy in HEX_STRATEGIES,
+            key_routes,
+            max(source.workers, 16),
+        )
+        return digest
+
+    try:
+        return verify_copy(read_source, read_target)
+    finally:
+        pool.close()
+
+
+def add_copy_arguments(parser, target):
+    """Adds the options that every copy script has to an ArgumentParser."""
+    name = TARGETS[target]
+    if target == "firestore":
+        parser.add_argument(
+            "--sink",
+            choices=["bulk", "batch"],
+            default="bulk",
+            help="write with a Firestore BulkWriter or with concurrent batch "
+            "commits (default: bulk)",
+        )
+        max_in_flight_help = "maximum number of outstanding write RPCs"
+    else:
+        max_in_flight_help = f"maximum number of concurrent {name} commits"
+    parser.add_argument(
+        "--max-in-flight",
+        type=int,
+        default=MAX_IN_FLIGHT[target],
+        help=f"{max_in_flight_help} (default: {MAX_IN_FLIGHT[target]})",
+    )
+    parser.add_argument(
+        "--doc-id",
+        choices=STRATEGIES,
+        default="md5",
+        help="how document IDs are built from the table keys, see doc_ids.py "
+        "(default: md5)",
+    )
+    parser.add_argument(
+        "--type-map",
+        help="JSON file that maps attribute names to the type used to store "
+        "their numbers or binary values, see ddb_convert.py",
+    )
+    parser.add_argument(
+        "--key-routes",
+        help="JSON file of rules that map key patterns to subcollection paths, "
+        "see key_routes.py",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        help="SQLite file that records the progress of each scan segment or "
+        "data file once its writes are committed",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue from the progress recorded in --checkpoint",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=0,
+        help="number of processes that parse and convert items and hash "
+        "document IDs, 0 to convert in the copying threads (default: 0)",
+    )
+    parser.add_argument(
+        "--initial-rate",
+        type=float,
+        default=500,
+        help="write operations per second to start at, 0 to not limit the "
+        "rate (default: 500)",
+    )
+    parser.add_argument(
+        "--max-rate",
+        type=float,
+        help="target write operations per second that the ramp-up stops at "
+        "(default: no limit)",
+    )
+    parser.add_argument(
+        "--ramp-interval",
+        type=float,
+        default=300,
+        help="seconds between increases of the write rate, 0 to keep the "
+        "initial rate (default: 300)",
+    )
+    parser.add_argument(
+        "--ramp-factor",
+        type=float,
+        default=1.5,
+        help="factor the write rate is multiplied by at each increase "
+        "(default: 1.5)",
+    )
+    parser.add_argument(
+        "--progress-interval",
+        type=float,
+        default=10,
+        help="seconds between progress reports, 0 to disable (default: 10)",
+    )
+    parser.add_argument(
+        "--mapping",
+        help="gzip file to write the partition key and document ID of every "
+        "copied item to",
+    )
+    parser.add_argument(
+        "--stats",
+        help="JSON file to write the throughput and commit latency totals to",
+    )
+
+
+def copy_options(parser, args):
+    """Returns the copy_table keyword arguments of add_copy_arguments options."""
+    if args.resume and not args.checkpoint:
+        parser.error("--resume requires --checkpoint")
+    rate_limiter = None
+    if args.initial_rate:
+        rate_limiter = RateLimiter(
+            args.initial_rate, args.max_rate, args.ramp_factor, args.ramp_interval
+        )
+    return {
+        "sink_type": getattr(args, "sink", "bulk"),
+        "max_in_flight": args.max_in_flight,
+        "type_map": load_type_map(args.type_map) if args.type_map else None,
+        "checkpoint_path": args.checkpoint,
+        "resume": args.resume,
+        "processes": args.processes,
+        "progress_interval": args.progress_interval,
+        "mapping_path": args.mapping,
+        "stats_path": args.stats,
+        "rate_limiter": rate_limiter,
+        "doc_id_strategy": args.doc_id,
+        "key_routes": load_key_routes(args.key_routes) if args.key_routes else None,
+    }
@@ -0,0 +1,143 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Keeps S3 export data files in a local directory, so that copying an
+# export again, after a failure or to the other database, reads its files
+# from disk. A file is cached under its ETag, which changes whenever the
+# object does, and the least recently used files are deleted once the cache
+# grows past its size. Files being copied, or downloaded ahead of the copy,
+# are never deleted. The directory can be shared by runs of the Firestore
+# and Datastore scripts at the same time: downloads go to a temporary file
+# that is renamed into place.
+
+import os
+import threading
+
+import boto3
+
+from concurrent.futures import ThreadPoolExecutor
+from export_reader import read_lines
+
+# Suffix of the files being downloaded
+_PART = ".part"
+
+
+class ExportCache:
+    def __init__(self, cache_dir, max_bytes, workers=4, s3_client=None):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.s3 = s3_client or boto3.client("s3")
+        self.hits = 0
+        self.downloads = 0
+        self._lock = threading.Lock()
+        # Futures of the local paths of the files fetched, by S3 URI
+        self._fetches = {}
+        self._released = set()
+        self._in_use = set()
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+
+    def prefetch(self, uri):
+        """Starts downloading uri in the background, unless it is cached."""
+        with self._lock:
+            if uri not in self._fetches and uri not in self._released:
+                self._fetches[uri] = self._executor.submit(self._fetch, uri)
+
+    def fetch(self, uri):
+        """Returns the local path of uri, once it is downloaded."""
+        with self._lock:
+            self._released.discard(uri)
+        self.prefetch(uri)
+        return self._fetches[uri].result()
+
+    def release(self, uri):
+        """Lets the file of uri be evicted, once it has been read."""
+        with self._lock:
+            future = self._fetches.pop(uri, None)
+            self._released.add(uri)
+        if future and not future.exception():
+            with self._lock:
+                self._in_use.discard(future.result())
+            self._evict()
+
+    def read_lines(self, uri, prefetch_uris=()):
+        """Yields the lines of the data file at uri, read from the cache.
+
+        The files of prefetch_uris are downloaded in the background
+        meanwhile. Local files are read where they are.
+        """
+        if not uri.startswith("s3://"):
+            yield from read_lines(uri)
+            return
+        for next_uri in prefetch_uris:
+            self.prefetch(next_uri)
+        path = self.fetch(uri)
+        try:
+            yield from read_lines(path)
+        finally:
+            self.release(uri)
+
+    def close(self):
+        self._executor.shutdown()
+
+    def _fetch(self, uri):
+        bucket, key = uri[len("s3://") :].split("/", 1)
+        etag = self.s3.head_object(Bucket=bucket, Key=key)["ETag"].strip('"')
+        path = os.path.join(self.cache_dir, f"{etag}-{os.path.basename(key)}")
+        with self._lock:
+            self._in_use.add(path)
+        try:
+            # Marks the file as recently used
+            os.utime(path)
+            with self._lock:
+                self.hits += 1
+            return path
+        except FileNotFoundError:
+            pass
+
+        part = f"{path}.{os.getpid()}.{threading.get_ident()}{_PART}"
+        try:
+            self.s3.download_file(bucket, key, part)
+            os.replace(part, path)
+        except BaseException:
+            with self._lock:
+                self._in_use.discard(path)
+            if os.path.exists(part):
+                os.remove(part)
+            raise
+        with self._lock:
+            self.downloads += 1
+        self._evict()
+        return path
+
+    def _evict(self):
+        with self._lock:
+            files = []
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith(_PART):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    # Evicted by another run
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in files)
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                if path in self._in_use:
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
@@ -0,0 +1,113 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Reads the lines of S3 export data files as bytes, with a fixed amount of
+# memory per file. The compressed file is read in blocks, from S3 or from a
+# memory map of a local file, and inflated at most buffer_size bytes at a
+# time, so neither a large file nor a highly compressed block is ever held
+# whole, and the lines are grouped into chunks of bounded size. The lines
+# are not decoded to str, since json.loads and orjson.loads parse bytes
+# directly.
+
+import io
+import mmap
+import os
+import zlib
+
+from smart_open import open
+
+# Bytes read and inflated at a time
+BUFFER_SIZE = 256 << 10
+# Bytes of lines after which a chunk ends early, so that chunks of large
+# items do not hold limit items
+CHUNK_BYTES = 4 << 20
+# zlib window bits that expect a gzip header
+_GZIP_WBITS = zlib.MAX_WBITS | 16
+
+
+def _local_blocks(path, buffer_size):
+    with io.open(path, "rb") as fin:
+        if os.fstat(fin.fileno()).st_size == 0:
+            return
+        with mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            mapped.madvise(mmap.MADV_SEQUENTIAL)
+            # Pages of the blocks already read are dropped from the RSS of
+            # the process, which needs blocks aligned to pages
+            drop = buffer_size % mmap.PAGESIZE == 0
+            with memoryview(mapped) as view:
+                for start in range(0, len(view), buffer_size):
+                    # Released on the next block, so the map can be closed
+                    with view[start : start + buffer_size] as block:
+                        yield block
+                    if drop:
+                        mapped.madvise(mmap.MADV_DONTNEED, start, buffer_size)
+
+
+def _remote_blocks(uri, transport_params, buffer_size):
+    with open(
+        uri, "rb", compression="disable", transport_params=transport_params
+    ) as fin:
+        while True:
+            block = fin.read(buffer_size)
+            if not block:
+                return
+            yield block
+
+
+def _inflate(blocks, buffer_size):
+    decompressor = zlib.decompressobj(_GZIP_WBITS)
+    for block in blocks:
+        while block:
+            yield decompressor.decompress(block, buffer_size)
+            block = decompressor.unconsumed_tail
+            if decompressor.eof:
+                # The next member of a multi-member gzip file
+                block = decompressor.unused_data
+                decompressor = zlib.decompressobj(_GZIP_WBITS)
+    yield decompressor.flush()
+
+
+def read_lines(uri, transport_params=None, buffer_size=BUFFER_SIZE):
+    """Yields the lines of an export data file as bytes, without newlines.
+
+    uri is an S3 URI or a local path, and the file is inflated if its name
+    ends with .gz.
+    """
+    if "://" in uri and not uri.startswith("file://"):
+        blocks = _remote_blocks(uri, transport_params, buffer_size)
+    else:
+        path = uri[len("file://") :] if uri.startswith("file://") else uri
+        blocks = _local_blocks(path, buffer_size)
+    if uri.endswith(".gz"):
+        blocks = _inflate(blocks, buffer_size)
+
+    tail = b""
+    for data in blocks:
+        lines = (tail + data).split(b"\n")
+        tail = lines.pop()
+        yield from lines
+    if tail:
+        yield tail
+
+
+def chunk_lines(lines, limit, max_bytes=CHUNK_BYTES):
+    """Yields lists of up to limit lines, ending early past max_bytes."""
+    chunk = []
+    nbytes = 0
+    for line in lines:
+        chunk.append(line)
+        nbytes += len(line)
+        if len(chunk) == limit or nbytes >= max_bytes:
+            yield chunk
+            chunk = []
+            nbytes = 0
+    if chunk:
+        yield chunk
@@ -0,0 +1,219 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Source of the copy engine that reads a DynamoDB export in S3, see
+# engine.py. A full export is copied data file by data file, and an
+# incremental export is reduced to the latest change of each document
+# before it is applied, see incremental_export.py.
+
+import json
+import threading
+import boto3
+from smart_open import open
+from itertools import islice
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from export_cache import ExportCache
+from export_reader import chunk_lines, read_lines
+from incremental_export import (
+    INCREMENTAL_EXPORT,
+    LatestChanges,
+    read_export_type,
+)
+from pipeline import PAGE_SIZE
+
+# Number of converted chunks of each data file waiting to be written
+max_pending_chunks = 2
+
+
+def read_manifest(s3_uri):
+    data_files = []
+    for line in open(f"{s3_uri}/manifest-files.json"):
+        item = json.loads(line)
+        data_files.append(item["dataFileS3Key"])
+    return data_files
+
+
+def data_file_uri(s3_uri, data_file):
+    # dataFileS3Key is relative to the bucket and ends with data/<file>
+    # under the export, so the export URI can also be a local directory
+    return f"{s3_uri}/{data_file[data_file.rindex('data/'):]}"
+
+
+class ExportSource:
+    """Reads the data files of the export at s3_uri, `files` at a time.
+
+    With a cache_dir, data files are read from an ExportCache of up to
+    cache_size bytes, which downloads the next `prefetch` files meanwhile.
+    """
+
+    # Binary values in S3 exports are base64 encoded
+    binary_base64 = True
+
+    def __init__(
+        self,
+        table_name,
+        s3_uri,
+        files=1,
+        cache_dir=None,
+        cache_size=50 << 30,
+        prefetch=2,
+        ddb_client=None,
+    ):
+        self.table_name = table_name
+        self.s3_uri = s3_uri.rstrip("/")
+        self.files = files
+        self.cache_dir = cache_dir
+        self.cache_size = cache_size
+        self.prefetch = prefetch
+        self.ddb_client = ddb_client or boto3.client("dynamodb")
+        self.transport_params = {"client": boto3.client("s3")}
+        self.cache = None
+        self.changes = None
+
+    def describe_table(self):
+        return self.ddb_client.describe_table(TableName=self.table_name)
+
+    def copy(self, table, pipeline, pool, checkpoint=None):
+        """Copies the export through pipeline, returns (read_cnt, write_cnt)."""
+        s3_uri = self.s3_uri
+        files = self.files
+        tp = self.transport_params
+        data_files = read_manifest(s3_uri)
+        lock = threading.Lock()
+        counts = {"read": 0, "write": 0}
+        incremental = read_export_type(s3_uri, tp) == INCREMENTAL_EXPORT
+        changes = LatestChanges() if incremental else None
+        self.changes = changes
+
+        # Data files left to copy, in the order they are copied in
+        todo = [
+            data_file
+            for data_file in data_files
+            if not (checkpoint and checkpoint.stream(f"file/{data_file}").done)
+        ]
+        positions = {data_file: i for i, data_file in enumerate(todo)}
+        cache = None
+        if self.cache_dir:
+            cache = ExportCache(self.cache_dir, self.cache_size, files + self.prefetch)
+        self.cache = cache
+
+        def data_file_lines(data_file):
+            # Reads a data file from the cache, which downloads the files that
+            # are copied next in the background
+            uri = data_file_uri(s3_uri, data_file)
+            if not cache:
+                return read_lines(uri, tp)
+            i = positions[data_file]
+            following = todo[i + 1 : i + files + self.prefetch]
+            return cache.read_lines(
+                uri, [data_file_uri(s3_uri, next_file) for next_file in following]
+            )
+
+        def copy_data_file(data_file):
+            # The position of a data file is the number of committed lines
+            progress = None
+            line_cnt = 0
+            if checkpoint:
+                progress = checkpoint.stream(f"file/{data_file}")
+                if progress.done:
+                    return
+                line_cnt = progress.position or 0
+
+            # Chunks being converted while the next chunk is read and decompressed
+            pending = deque()
+
+            def write_pending():
+                future, nbytes, on_commit = pending.popleft()
+                id_docs = future.result()
+                pipeline.write(id_docs, nbytes, on_commit)
+                with lock:
+                    counts["write"] += len(id_docs)
+
+            lines = data_file_lines(data_file)
+            for ddb_items in chunk_lines(islice(lines, line_cnt, None), PAGE_SIZE):
+                with lock:
+                    counts["read"] += len(ddb_items)
+                line_cnt += len(ddb_items)
+                on_commit = progress.submit(line_cnt) if progress else None
+                future = pool.convert_export_lines(ddb_items)
+                pending.append((future, sum(map(len, ddb_items)), on_commit))
+                if len(pending) > max_pending_chunks:
+                    write_pending()
+            while pending:
+                write_pending()
+            if progress:
+                progress.submit(line_cnt, done=True)()
+
+        def read_changes(data_file):
+            pending = deque()
+
+            def add_pending():
+                latest = []
+                for timestamp, doc_id, keys, doc, nbytes in pending.popleft().result():
+                    change = (doc_id, keys, doc, nbytes)
+                    latest.append((pipeline.path(doc_id, keys), timestamp, change))
+                changes.add(latest)
+
+            lines = data_file_lines(data_file)
+            for chunk in chunk_lines(lines, PAGE_SIZE):
+                pending.append(pool.convert_change_lines(chunk))
+                if len(pending) > max_pending_chunks:
+                    add_pending()
+            while pending:
+                add_pending()
+
+        def apply_changes():
+            # The position of the changes is the number of committed changes,
+            # in the path order of LatestChanges.chunks
+            progress = None
+            applied = 0
+            if checkpoint:
+                progress = checkpoint.stream("changes")
+                if progress.done:
+                    return
+                applied = progress.position or 0
+            with ThreadPoolExecutor(max_workers=files) as executor:
+                list(executor.map(read_changes, todo))
+            counts["read"] = changes.read
+            for chunk in changes.chunks(PAGE_SIZE, applied):
+                applied += len(chunk)
+                on_commit = progress.submit(applied) if progress else None
+                pipeline.write_changes(chunk, on_commit)
+                counts["write"] += len(chunk)
+            if progress:
+                progress.submit(applied, done=True)()
+
+        try:
+            if incremental:
+                apply_changes()
+            else:
+                with ThreadPoolExecutor(max_workers=files) as executor:
+                    list(executor.map(copy_data_file, todo))
+        finally:
+            if cache:
+                cache.close()
+        return counts["read"], counts["write"]
+
+    def summary(self, read_cnt):
+        if self.changes is not None:
+            lines = [
+                f"Changes in the incremental export: {self.changes.read}, "
+                f"to {len(self.changes)} documents"
+            ]
+        else:
+            lines = [f"Total items read from DynamoDB: {read_cnt}"]
+        if self.cache:
+            lines.append(
+                f"Export cache: {self.cache.hits} hits, "
+                f"{self.cache.downloads} downloads"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,70 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Support for DynamoDB incremental exports. Each line of their data files is
+# a change of an item: its Keys, its NewImage unless the change deleted it,
+# its OldImage with the new and old images view, and the WriteTimestampMicros
+# of the change in its Metadata. An item can change many times during the
+# export period, in any of the data files, so the changes are reduced to the
+# latest one of each document before they are applied as sets and deletes.
+
+import json
+import threading
+
+from smart_open import open
+
+FULL_EXPORT = "FULL_EXPORT"
+INCREMENTAL_EXPORT = "INCREMENTAL_EXPORT"
+
+
+def read_export_type(s3_uri, transport_params=None):
+    """Returns the exportType in the manifest-summary.json of an export."""
+    try:
+        with open(
+            f"{s3_uri}/manifest-summary.json", transport_params=transport_params
+        ) as fin:
+            summary = json.load(fin)
+    except OSError:
+        # A directory with only the data files and manifest-files.json
+        return FULL_EXPORT
+    # Exports made before incremental exports have no exportType
+    return summary.get("exportType", FULL_EXPORT)
+
+
+class LatestChanges:
+    """The latest change of each document of an incremental export."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._changes = {}
+        self.read = 0
+
+    def add(self, changes):
+        """Adds (path, timestamp, change) tuples."""
+        with self._lock:
+            self.read += len(changes)
+            for path, timestamp, change in changes:
+                latest = self._changes.get(path)
+                if latest is None or timestamp >= latest[0]:
+                    self._changes[path] = (timestamp, change)
+
+    def __len__(self):
+        return len(self._changes)
+
+    def chunks(self, size, start=0):
+        """Yields lists of up to size (path, change) pairs from the start-th.
+
+        The changes are in path order, so that a resumed run can skip the
+        changes applied before.
+        """
+        paths = sorted(self._changes)[start:]
+        for i in range(0, len(paths), size):
+            yield [(path, self._changes[path][1]) for path in paths[i : i + size]]
@@ -0,0 +1,161 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Routes the items of a single-table design to collections and
+# subcollections by the patterns of their partition and sort keys. A routes
+# file is a JSON list of rules, and the first rule that matches an item
+# gives the path of its document:
+#
+#   [
+#     {"pk": "CUST#{customer_id}", "sk": "ORDER#{order_id}",
+#      "path": "customers/{customer_id}/orders/{order_id}"},
+#     {"pk": "CUST#{customer_id}", "path": "customers/{customer_id}"}
+#   ]
+#
+# A {name} placeholder matches one or more characters of the key, and its
+# value is percent-encoded into the path. A rule without "sk" matches any
+# sort key, and writes every item of a partition it matches to the same
+# document, so it goes after the rules for the other items of the
+# partition. The path of a rule with "sk" must use its sort key
+# placeholders, for the same reason. Items that match no rule keep the
+# collection named after the table and the document ID of --doc-id.
+#
+# The rules are compiled once into a single regular expression over the
+# partition and sort key, with an alternative per rule, so routing an item
+# takes one match however many rules there are.
+
+import json
+import re
+
+from doc_ids import quote_key
+
+_PLACEHOLDER = re.compile(r"\{(\w+)\}")
+# Separates the partition key from the sort key in the matched string
+_SEPARATOR = "\x1f"
+
+
+def _compile_pattern(pattern, group_prefix):
+    # Returns an expression that matches whole key values, with a named
+    # group for each placeholder, and the (placeholder, group) pairs
+    regex = []
+    groups = []
+    end = 0
+    for match in _PLACEHOLDER.finditer(pattern):
+        group = f"{group_prefix}{len(groups)}"
+        regex.append(re.escape(pattern[end : match.start()]))
+        regex.append(f"(?P<{group}>[^{_SEPARATOR}]+?)")
+        groups.append((match.group(1), group))
+        end = match.end()
+    regex.append(re.escape(pattern[end:]))
+    return "".join(regex), groups
+
+
+def _path_regex(path):
+    # Returns an expression that matches the paths a route path gives, with
+    # any document ID in place of each placeholder
+    regex = []
+    end = 0
+    for match in _PLACEHOLDER.finditer(path):
+        regex.append(re.escape(path[end : match.start()]))
+        regex.append("[^/]+")
+        end = match.end()
+    regex.append(re.escape(path[end:]))
+    return "".join(regex)
+
+
+class _Route:
+    def __init__(self, rule, index):
+        try:
+            pk_pattern = rule["pk"]
+            self.path = rule["path"]
+        except (KeyError, TypeError):
+            raise ValueError(f"Key route {rule!r} needs a pk and a path")
+        self.group = f"r{index}"
+        pk_regex, self.groups = _compile_pattern(pk_pattern, f"{self.group}p")
+        sk_pattern = rule.get("sk")
+        sk_groups = []
+        if sk_pattern is None:
+            sk_regex = f"(?:{_SEPARATOR}.*)?"
+        else:
+            sk_regex, sk_groups = _compile_pattern(sk_pattern, f"{self.group}s")
+            sk_regex = _SEPARATOR + sk_regex
+            self.groups += sk_groups
+        self.regex = f"(?P<{self.group}>{pk_regex}{sk_regex})"
+
+        names = [name for name, _ in self.groups]
+        if len(names) != len(set(names)):
+            raise ValueError(f"Key route {rule!r} repeats a placeholder")
+        used = set(_PLACEHOLDER.findall(self.path))
+        unknown = used - set(names)
+        if unknown:
+            raise ValueError(f"Key route {rule!r} uses unknown {sorted(unknown)}")
+        # Items of a partition that differ only in an unused sort key
+        # placeholder would overwrite each other's document
+        unused = {name for name, _ in sk_groups} - used
+        if unused:
+            raise ValueError(
+                f"Key route {rule!r} does not use the sort key {sorted(unused)} "
+                "in its path, so the items of a partition would overwrite "
+                "each other"
+            )
+        segments = self.path.split("/")
+        if len(segments) % 2 or not all(segments):
+            raise ValueError(
+                f"Key route path {self.path!r} must alternate collections "
+                "and documents"
+            )
+        if any(_PLACEHOLDER.search(segment) for segment in segments[::2]):
+            raise ValueError(
+                f"Key route path {self.path!r} has a placeholder in a "
+                "collection ID, which must be fixed"
+            )
+        # The collection the route writes to, the path of its parent
+        # document, or None if it depends on the keys, and a regex of the
+        # paths of the documents the route writes
+        self.collection_id = segments[-2]
+        self.parent = "/".join(segments[:-2])
+        if _PLACEHOLDER.search(self.parent):
+            self.parent = None
+        self.path_regex = _path_regex(self.path)
+
+
+def load_key_routes(path):
+    with open(path) as fin:
+        rules = json.load(fin)
+    if not isinstance(rules, list):
+        raise ValueError("The key routes file must hold a list of rules")
+    for index, rule in enumerate(rules):
+        _Route(rule, index)
+    return rules
+
+
+class KeyRouter:
+    """Maps the keys of converted documents to their document paths."""
+
+    def __init__(self, rules, pk, sk):
+        self.pk = pk
+        self.sk = sk
+        routes = [_Route(rule, index) for index, rule in enumerate(rules)]
+        self.routes = {route.group: route for route in routes}
+        self.regex = re.compile("|".join(route.regex for route in routes), re.DOTALL)
+
+    def path(self, doc):
+        """Returns the path of the first route doc matches, or None."""
+        key = str(doc[self.pk])
+        if self.sk is not None:
+            key += _SEPARATOR + str(doc[self.sk])
+        match = self.regex.fullmatch(key)
+        if match is None:
+            return None
+        # The group of the whole rule is the last one to close
+        route = self.routes[match.lastgroup]
+        values = {name: quote_key(match.group(group)) for name, group in route.groups}
+        return route.path.format_map(values)
@@ -0,0 +1,142 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import queue
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from read_capacity import is_throttle
+
+# Placed on the page queue once per writer after all segments are scanned
+_DONE = object()
+# Seconds to wait on the page queue before re-checking for a failure
+_POLL_INTERVAL = 1
+
+
+def parallel_scan(
+    ddb_client,
+    scan_kwargs,
+    segments,
+    workers,
+    handle_page,
+    checkpoint=None,
+    read_limiter=None,
+):
+    """Scan a table with `segments` parallel scanners feeding `workers` writers.
+
+    Every scanned page is put on a bounded queue that the writer threads
+    drain by calling `handle_page(items, on_commit)`, which returns the
+    number of items it wrote. Scanning and writing overlap; when the queue
+    is full the scanners wait for the writers to catch up.
+
+    With a checkpoint, segments start from their last committed
+    LastEvaluatedKey and finished segments are skipped. on_commit must then
+    be called once the page's writes are acknowledged; it is None otherwise.
+
+    With a read_capacity.ReadCapacityLimiter, the scanners hold to its read
+    capacity budget, adapt the page size, and wait out throttling errors.
+
+    Returns a (read_cnt, write_cnt) tuple. The first exception raised by a
+    scanner or writer stops the pipeline and is re-raised.
+    """
+    if checkpoint:
+        checkpoint.check_segments(segments)
+
+    pages = queue.Queue(maxsize=workers * 2)
+    stop = threading.Event()
+    lock = threading.Lock()
+    errors = []
+    counts = {"read": 0, "write": 0}
+
+    def fail(e):
+        with lock:
+            errors.append(e)
+        stop.set()
+
+    def put(page):
+        while not stop.is_set():
+            try:
+                pages.put(page, timeout=_POLL_INTERVAL)
+                return
+            except queue.Full:
+                continue
+
+    def scan(segment):
+        kwargs = dict(scan_kwargs)
+        if segments > 1:
+            kwargs["Segment"] = segment
+            kwargs["TotalSegments"] = segments
+        if read_limiter:
+            kwargs["ReturnConsumedCapacity"] = "TOTAL"
+        progress = None
+        if checkpoint:
+            progress = checkpoint.stream(f"segment/{segment}")
+            if progress.done:
+                return
+            if progress.position:
+                kwargs["ExclusiveStartKey"] = progress.position
+        try:
+            while not stop.is_set():
+                if read_limiter:
+                    kwargs["Limit"] = read_limiter.page_limit()
+                try:
+                    response = ddb_client.scan(**kwargs)
+                except Exception as e:
+                    if not (read_limiter and is_throttle(e)):
+                        raise
+                    stop.wait(read_limiter.on_throttle())
+                    continue
+                if read_limiter:
+                    stop.wait(read_limiter.consume(response))
+                with lock:
+                    counts["read"] += response.get("Count", 0)
+                start_key = response.get("LastEvaluatedKey", None)
+                on_commit = None
+                if progress:
+                    on_commit = progress.submit(start_key, done=start_key is None)
+                put((response.get("Items", []), on_commit))
+                if start_key is None:
+                    break
+                kwargs["ExclusiveStartKey"] = start_key
+        except Exception as e:
+            fail(e)
+
+    def write():
+        while not stop.is_set():
+            try:
+                page = pages.get(timeout=_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+            if page is _DONE:
+                return
+            try:
+                written = handle_page(*page)
+            except Exception as e:
+                fail(e)
+                return
+            with lock:
+                counts["write"] += written
+
+    writers = [threading.Thread(target=write, daemon=True) for _ in range(workers)]
+    for writer in writers:
+        writer.start()
+
+    with ThreadPoolExecutor(max_workers=segments) as scanners:
+        list(scanners.map(scan, range(segments)))
+
+    for _ in writers:
+        put(_DONE)
+    for writer in writers:
+        writer.join()
+
+    if errors:
+        raise errors[0]
+    return counts["read"], counts["write"]
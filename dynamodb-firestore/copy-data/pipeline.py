@@ -0,0 +1,94 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# The write end of the copy engine, shared by the copy scripts and the
+# stream replication functions: it places converted documents at their
+# paths and hands them to a write sink of write_sink.py. It only imports
+# key_routes, so that the functions start without the modules that copies
+# need.
+
+from key_routes import KeyRouter
+
+# Targets of the copies, and their names in messages
+TARGETS = {"firestore": "Firestore", "datastore": "Datastore"}
+# Maximum number of writes that can be passed
+# to a Commit operation in Firestore and Datastore is 500
+PAGE_SIZE = 500
+
+
+def parse_schema(schema_dict):
+    pk = None
+    sk = None
+
+    table_dict = schema_dict["Table"]
+    key_schema = table_dict["KeySchema"]
+
+    for key in key_schema:
+        key_name = key["AttributeName"]
+        key_type = key["KeyType"]
+
+        if key_type == "HASH":
+            pk = key_name
+        if key_type == "RANGE":
+            sk = key_name
+
+    return pk, sk
+
+
+class Pipeline:
+    """Writes converted documents of a table to a sink.
+
+    A document goes to the collection named after the table, under its
+    document ID, unless its keys match one of key_routes. Pages are tracked
+    by the optional progress reporter.
+    """
+
+    def __init__(self, table_name, pk, sk, sink=None, reporter=None, key_routes=None):
+        self.table_name = table_name
+        self.pk = pk
+        self.sk = sk
+        self.sink = sink
+        self.reporter = reporter
+        self.router = KeyRouter(key_routes, pk, sk) if key_routes else None
+
+    def path(self, doc_id, doc):
+        """Returns the path of doc, which holds at least the key attributes."""
+        path = self.router.path(doc) if self.router else None
+        return path or f"{self.table_name}/{doc_id}"
+
+    def _track(self, id_docs, nbytes, on_commit):
+        if not self.reporter:
+            return on_commit
+        return self.reporter.track(id_docs, self.pk, nbytes, on_commit)
+
+    def write(self, id_docs, nbytes, on_commit=None):
+        ops = [(self.path(doc_id, doc), doc) for doc_id, doc in id_docs]
+        self.sink.write(ops, self._track(id_docs, nbytes, on_commit))
+
+    async def write_async(self, id_docs, nbytes, on_commit=None):
+        ops = [(self.path(doc_id, doc), doc) for doc_id, doc in id_docs]
+        await self.sink.write(ops, self._track(id_docs, nbytes, on_commit))
+
+    def write_changes(self, changes, on_commit=None):
+        """Writes (path, (doc_id, keys, doc, nbytes)) changes.
+
+        doc is None for a delete, see incremental_export.py.
+        """
+        ops = []
+        id_docs = []
+        nbytes = 0
+
+        for path, (doc_id, keys, doc, size) in changes:
+            ops.append((path, doc))
+            id_docs.append((doc_id, keys))
+            nbytes += size
+
+        self.sink.write(ops, self._track(id_docs, nbytes, on_commit))
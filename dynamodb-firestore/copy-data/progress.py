@@ -0,0 +1,199 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Reports the progress of a copy every few seconds: items and bytes submitted
+# per second, items committed per second and the commit latency of the
+# pages written in the interval, instead of a line per document. The
+# mapping of DynamoDB partition keys to document IDs can be written to a
+# gzip file by a background thread, and the totals to a JSON file.
+
+import gzip
+import json
+import queue
+import threading
+import time
+
+# Number of items sampled to estimate the size of a scanned page
+_SIZE_SAMPLES = 8
+# Pages of mapping lines waiting for the mapping file writer
+_MAPPING_QUEUE_SIZE = 100
+# Placed on the mapping queue when the reporter is closed
+_DONE = object()
+
+
+def _value_size(value):
+    # Size of a DynamoDB attribute value, following the rules used for the
+    # DynamoDB item size limit
+    for tag, value in value.items():
+        if tag in ("S", "B"):
+            return len(value)
+        if tag == "N":
+            return len(value) // 2 + 1
+        if tag in ("BOOL", "NULL"):
+            return 1
+        if tag in ("SS", "BS"):
+            return sum(len(v) for v in value)
+        if tag == "NS":
+            return sum(len(v) // 2 + 1 for v in value)
+        if tag == "M":
+            return 3 + sum(len(k) + 1 + _value_size(v) for k, v in value.items())
+        if tag == "L":
+            return 3 + sum(1 + _value_size(v) for v in value)
+    return 0
+
+
+def item_size(item):
+    return sum(len(name) + _value_size(value) for name, value in item.items())
+
+
+def estimate_page_size(items):
+    """Estimates the bytes of a page of DynamoDB items from a few samples."""
+    if not items:
+        return 0
+    step = max(1, len(items) // _SIZE_SAMPLES)
+    samples = items[::step]
+    return sum(map(item_size, samples)) * len(items) // len(samples)
+
+
+def percentile(sorted_values, fraction):
+    """Returns the value at fraction of sorted_values, or 0 if empty."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * fraction))
+    return sorted_values[index]
+
+
+class ProgressReporter:
+    """Aggregates the throughput of a copy and prints it periodically.
+
+    Call track() for every page handed to a write sink, and pass the
+    callback it returns to the sink so that the commit is counted.
+    """
+
+    def __init__(self, interval=10, mapping_path=None, sink=None):
+        self.interval = interval
+        self.sink = sink
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self._totals = {"submitted": 0, "bytes": 0, "committed": 0, "pages": 0}
+        self._window = {"submitted": 0, "bytes": 0, "committed": 0}
+        self._window_latencies = []
+        self._latencies = []
+        self._stop = threading.Event()
+
+        self._mapping_queue = None
+        self._mapping_writer = None
+        if mapping_path:
+            self._mapping_queue = queue.Queue(maxsize=_MAPPING_QUEUE_SIZE)
+            self._mapping_writer = threading.Thread(
+                target=self._write_mapping, args=(mapping_path,), daemon=True
+            )
+            self._mapping_writer.start()
+
+        self._reporter = None
+        if interval:
+            self._reporter = threading.Thread(target=self._report, daemon=True)
+            self._reporter.start()
+
+    def track(self, id_docs, pk, nbytes, on_commit=None):
+        """Counts a page and returns the callback to call once it is committed.
+
+        The returned callback calls on_commit, if any.
+        """
+        count = len(id_docs)
+        with self._lock:
+            for counter in (self._totals, self._window):
+                counter["submitted"] += count
+                counter["bytes"] += nbytes
+            self._totals["pages"] += 1
+        if self._mapping_queue:
+            self._mapping_queue.put(
+                "".join(f"{doc[pk]}\t{doc_id}\n" for doc_id, doc in id_docs)
+            )
+
+        start = time.monotonic()
+
+        def committed():
+            latency = time.monotonic() - start
+            with self._lock:
+                self._totals["committed"] += count
+                self._window["committed"] += count
+                self._window_latencies.append(latency)
+                self._latencies.append(latency)
+            if on_commit:
+                on_commit()
+
+        return committed
+
+    def _write_mapping(self, path):
+        with gzip.open(path, "wt", compresslevel=1) as fout:
+            fout.write("pk\tdoc_id\n")
+            while True:
+                lines = self._mapping_queue.get()
+                if lines is _DONE:
+                    return
+                fout.write(lines)
+
+    def _report(self):
+        last = time.monotonic()
+        while not self._stop.wait(self.interval):
+            now = time.monotonic()
+            with self._lock:
+                window = self._window
+                latencies = sorted(self._window_latencies)
+                self._window = {"submitted": 0, "bytes": 0, "committed": 0}
+                self._window_latencies = []
+                committed = self._totals["committed"]
+            elapsed = now - last
+            last = now
+            line = (
+                f"[{now - self._start:7.0f}s] committed {committed} items, "
+                f"{window['submitted'] / elapsed:,.0f} items/s submitted, "
+                f"{window['bytes'] / elapsed / 1e6:,.2f} MB/s, "
+                f"{window['committed'] / elapsed:,.0f} items/s committed, "
+                f"commit p50 {percentile(latencies, 0.5) * 1000:.0f} ms "
+                f"p99 {percentile(latencies, 0.99) * 1000:.0f} ms"
+            )
+            if self.sink:
+                line += f", in flight {self.sink.stats.in_flight}"
+            print(line, flush=True)
+
+    def stats(self):
+        """Returns the totals of the copy so far as a dict."""
+        elapsed = time.monotonic() - self._start
+        with self._lock:
+            totals = dict(self._totals)
+            latencies = sorted(self._latencies)
+        return {
+            "elapsed_seconds": round(elapsed, 3),
+            "items_submitted": totals["submitted"],
+            "items_committed": totals["committed"],
+            "bytes_submitted": totals["bytes"],
+            "pages": totals["pages"],
+            "items_per_second": round(totals["committed"] / elapsed, 1),
+            "bytes_per_second": round(totals["bytes"] / elapsed, 1),
+            "commit_latency_p50_ms": round(percentile(latencies, 0.5) * 1000, 1),
+            "commit_latency_p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        }
+
+    def close(self, stats_path=None):
+        """Stops reporting, finishes the mapping file and writes the stats."""
+        self._stop.set()
+        if self._reporter:
+            self._reporter.join()
+        if self._mapping_writer:
+            self._mapping_queue.put(_DONE)
+            self._mapping_writer.join()
+        stats = self.stats()
+        if stats_path:
+            with open(stats_path, "w") as fout:
+                json.dump(stats, fout, indent=2)
+        return stats
@@ -0,0 +1,138 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Throttles writes to a new collection following the Firestore "500/50/5"
+# rule: start at 500 operations per second and increase the rate by 50%
+# every 5 minutes, so the database has time to split hot key ranges.
+#
+# On top of the ramp, the rate backs off when the database signals
+# contention or an exceeded quota: it is halved (at most once per
+# cooldown) and then increases linearly back towards the ramp, which is
+# additive increase / multiplicative decrease (AIMD).
+
+import asyncio
+import threading
+import time
+
+# gRPC status codes of contention and quota errors: DEADLINE_EXCEEDED,
+# RESOURCE_EXHAUSTED, ABORTED and UNAVAILABLE
+CONTENTION_CODES = {4, 8, 10, 14}
+# The same errors as HTTP status codes
+_CONTENTION_HTTP_CODES = {409, 429, 503, 504}
+
+
+def is_contention(error):
+    """Returns whether a Google API exception signals contention or quota."""
+    status = getattr(error, "grpc_status_code", None)
+    if status is not None:
+        return status.value[0] in CONTENTION_CODES
+    return getattr(error, "code", None) in _CONTENTION_HTTP_CODES
+
+
+class RateLimiter:
+    """Token bucket for write operations with a ramp-up and AIMD backoff.
+
+    The rate is initial_rate ops/s, multiplied by ramp_factor every
+    ramp_interval seconds up to max_rate (no limit when None). After
+    on_contention() the rate is multiplied by decrease, and then grows by
+    increase ops/s every second until it is back on the ramp.
+    """
+
+    def __init__(
+        self,
+        initial_rate=500,
+        max_rate=None,
+        ramp_factor=1.5,
+        ramp_interval=300,
+        min_rate=50,
+        decrease=0.5,
+        increase=10,
+        cooldown=5,
+        clock=time.monotonic,
+    ):
+        self.initial_rate = initial_rate
+        self.max_rate = max_rate
+        self.ramp_factor = ramp_factor
+        self.ramp_interval = ramp_interval
+        self.min_rate = min_rate
+        self.decrease = decrease
+        self.increase = increase
+        self.cooldown = cooldown
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._start = clock()
+        self._updated = self._start
+        # Tokens may go negative: callers then wait until the debt is repaid
+        self._tokens = 0.0
+        # Rate after a backoff, until it grows back to the ramp
+        self._backoff_rate = None
+        self._last_backoff = None
+        self.backoffs = 0
+
+    def _ramp_rate(self, now):
+        rate = self.initial_rate
+        if self.ramp_interval:
+            steps = int((now - self._start) // self.ramp_interval)
+            rate *= self.ramp_factor ** steps
+        if self.max_rate:
+            rate = min(rate, self.max_rate)
+        return rate
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self._updated = now
+        ramp_rate = self._ramp_rate(now)
+        if self._backoff_rate is not None:
+            self._backoff_rate += self.increase * elapsed
+            if self._backoff_rate >= ramp_rate:
+                self._backoff_rate = None
+        rate = ramp_rate if self._backoff_rate is None else self._backoff_rate
+        # At most one second of unused rate is saved up as a burst
+        self._tokens = min(self._tokens + rate * elapsed, rate)
+        return rate
+
+    def rate(self):
+        """Returns the current rate in operations per second."""
+        with self._lock:
+            return self._refill(self._clock())
+
+    def reserve(self, n):
+        """Takes n tokens and returns the seconds to wait before using them."""
+        with self._lock:
+            rate = self._refill(self._clock())
+            self._tokens -= n
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / rate
+
+    def acquire(self, n):
+        delay = self.reserve(n)
+        if delay:
+            time.sleep(delay)
+
+    async def acquire_async(self, n):
+        delay = self.reserve(n)
+        if delay:
+            await asyncio.sleep(delay)
+
+    def on_contention(self):
+        """Backs the rate off after a contention or quota error."""
+        with self._lock:
+            now = self._clock()
+            rate = self._refill(now)
+            if self._last_backoff is not None:
+                if now - self._last_backoff < self.cooldown:
+                    return
+            self._last_backoff = now
+            self._backoff_rate = max(self.min_rate, rate * self.decrease)
+            # Do not spend tokens saved up at the previous rate
+            self._tokens = min(self._tokens, 0.0)
+            self.backoffs += 1
@@ -0,0 +1,106 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Holds a parallel scan to a budget of read capacity units per second, so
+# a copy from a table that is serving traffic leaves it enough capacity.
+#
+# Every scan asks for ConsumedCapacity, and the capacity it consumed is
+# taken from a token bucket shared by all segments; a segment that runs
+# ahead of the budget waits before its next scan. The page size follows
+# the items read per capacity unit, so each page takes about a second of
+# a segment's share of the budget. Throttling errors back the budget off
+# the same way contention errors back off the write rate.
+
+from rate_limiter import RateLimiter
+
+# DynamoDB error codes of throttled requests
+_THROTTLE_CODES = {
+    "ProvisionedThroughputExceededException",
+    "RequestLimitExceeded",
+    "ThrottlingException",
+}
+# Smallest page size the scan is reduced to
+_MIN_LIMIT = 10
+# Seconds of a segment's share of the budget that a page should take
+_PAGE_SECONDS = 1
+# Weight of the latest page in the items per capacity unit average
+_SMOOTHING = 0.2
+
+
+def table_read_capacity(describe_table_response):
+    """Returns the provisioned RCU of a table, or 0 for on-demand tables."""
+    table = describe_table_response["Table"]
+    throughput = table.get("ProvisionedThroughput", {})
+    return throughput.get("ReadCapacityUnits", 0)
+
+
+def read_budget(describe_table_response, percent=None, units=None):
+    """Returns the RCU budget of a scan, or None to scan without a limit.
+
+    The budget is percent of the provisioned RCU of the table and at most
+    units; on-demand tables have no provisioned RCU to take a percent of.
+    """
+    budgets = []
+    if percent:
+        provisioned = table_read_capacity(describe_table_response)
+        if provisioned:
+            budgets.append(provisioned * percent / 100)
+        else:
+            print("The table has no provisioned read capacity, use --read-capacity")
+    if units:
+        budgets.append(units)
+    return min(budgets) if budgets else None
+
+
+def is_throttle(error):
+    response = getattr(error, "response", None) or {}
+    return response.get("Error", {}).get("Code") in _THROTTLE_CODES
+
+
+class ReadCapacityLimiter:
+    def __init__(self, read_capacity, segments, max_limit=500):
+        self.segments = segments
+        self.max_limit = max_limit
+        self.limiter = RateLimiter(
+            initial_rate=read_capacity,
+            ramp_interval=0,
+            min_rate=read_capacity * 0.1,
+            increase=read_capacity * 0.02,
+            cooldown=1,
+        )
+        self._items_per_unit = None
+
+    def page_limit(self):
+        """Returns the Limit for the next scan."""
+        if self._items_per_unit is None:
+            return _MIN_LIMIT
+        share = self.limiter.rate() / self.segments * _PAGE_SECONDS
+        limit = int(self._items_per_unit * share)
+        return max(_MIN_LIMIT, min(self.max_limit, limit))
+
+    def consume(self, response):
+        """Records a scan response, and returns the seconds to wait."""
+        units = response.get("ConsumedCapacity", {}).get("CapacityUnits", 0)
+        scanned = response.get("ScannedCount", 0)
+        if units and scanned:
+            items_per_unit = scanned / units
+            if self._items_per_unit is None:
+                self._items_per_unit = items_per_unit
+            else:
+                self._items_per_unit += _SMOOTHING * (
+                    items_per_unit - self._items_per_unit
+                )
+        return self.limiter.reserve(units)
+
+    def on_throttle(self):
+        """Backs the budget off, and returns the seconds to wait."""
+        self.limiter.on_contention()
+        return self.limiter.reserve(0) or 1.0
@@ -0,0 +1,102 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Source of the copy engine that scans a DynamoDB table, see engine.py.
+
+import asyncio
+import boto3
+
+from async_scan import async_parallel_scan
+from parallel_scan import parallel_scan
+from pipeline import PAGE_SIZE
+from progress import estimate_page_size
+from read_capacity import ReadCapacityLimiter, read_budget
+
+
+class ScanSource:
+    """Reads a table with `segments` parallel scans and `workers` writers.
+
+    The scan holds to read_capacity units per second, or to
+    read_capacity_percent of the provisioned capacity, if either is set.
+    """
+
+    # Binary values are bytes in scan results
+    binary_base64 = False
+
+    def __init__(
+        self,
+        table_name,
+        segments=1,
+        workers=1,
+        read_capacity_percent=None,
+        read_capacity=None,
+        ddb_client=None,
+    ):
+        self.table_name = table_name
+        self.segments = segments
+        self.workers = workers
+        self.read_capacity_percent = read_capacity_percent
+        self.read_capacity = read_capacity
+        self.ddb_client = ddb_client or boto3.client("dynamodb")
+        self.scan_kwargs = {"Limit": PAGE_SIZE, "TableName": table_name}
+
+    def describe_table(self):
+        return self.ddb_client.describe_table(TableName=self.table_name)
+
+    def _read_limiter(self, table):
+        budget = read_budget(table, self.read_capacity_percent, self.read_capacity)
+        if budget:
+            return ReadCapacityLimiter(budget, self.segments, PAGE_SIZE)
+        return None
+
+    def scan(self, table, handle_page, checkpoint=None):
+        """Runs parallel_scan over the table that describe_table returned."""
+        return parallel_scan(
+            self.ddb_client,
+            self.scan_kwargs,
+            self.segments,
+            self.workers,
+            handle_page,
+            checkpoint,
+            self._read_limiter(table),
+        )
+
+    def copy(self, table, pipeline, pool, checkpoint=None):
+        """Copies the table through pipeline, returns (read_cnt, write_cnt)."""
+
+        def handle_page(ddb_items, on_commit):
+            id_docs = pool.convert_scan_items(ddb_items).result()
+            pipeline.write(id_docs, estimate_page_size(ddb_items), on_commit)
+            return len(id_docs)
+
+        return self.scan(table, handle_page, checkpoint)
+
+    async def copy_async(self, table, pipeline, pool, checkpoint=None):
+        """Copies the table with writer tasks, see async_scan.py."""
+
+        async def handle_page(ddb_items, on_commit):
+            id_docs = await asyncio.wrap_future(pool.convert_scan_items(ddb_items))
+            nbytes = estimate_page_size(ddb_items)
+            await pipeline.write_async(id_docs, nbytes, on_commit)
+            return len(id_docs)
+
+        return await async_parallel_scan(
+            self.ddb_client,
+            self.scan_kwargs,
+            self.segments,
+            self.workers,
+            handle_page,
+            checkpoint,
+            self._read_limiter(table),
+        )
+
+    def summary(self, read_cnt):
+        return f"Total items read from DynamoDB: {read_cnt}"
@@ -0,0 +1,237 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# The stream replication functions of streaming-replication: the records of
+# a DynamoDB stream event are the source of the same pipeline and write
+# sinks as the copy scripts, with the conversion, document IDs and key
+# routes of ddb_convert.py, doc_ids.py and key_routes.py, so the functions
+# write the documents the copies wrote. The function images copy this
+# module and those it imports next to sync-from-stream.py.
+#
+# The functions are configured with environment variables, see
+# streaming-replication/README.md.
+
+import boto3
+import os
+import json
+import base64
+import time
+
+from contextlib import contextmanager
+from ddb_convert import make_item_converter
+from doc_ids import doc_id_function
+from pipeline import TARGETS, Pipeline, parse_schema
+from write_sink import WriteSinkError, make_client, make_sink
+
+# Set PROFILE_INIT=1 to log the time spent in each initialization step
+profile_init = os.environ.get("PROFILE_INIT") == "1"
+init_timings = {}
+
+# Clients are created on first use and reused across warm invocations, so
+# a cold start does not wait for clients that are never used, such as the
+# DynamoDB client when the key schema is set in the environment
+clients = {}
+
+# Attempts per Firestore write, or per Datastore commit, before the write is
+# reported as failed
+max_write_attempts = int(os.environ.get("MAX_WRITE_ATTEMPTS", "10"))
+# Number of sub-batches a stream batch is split into and committed in
+# parallel by the Datastore function
+write_shards = int(os.environ.get("WRITE_SHARDS", "8"))
+
+# Optional per-attribute types, in the format of the --type-map file of the
+# copy scripts, resolved once per container. Binary values in stream
+# records are base64 encoded.
+type_map = json.loads(os.environ.get("TYPE_MAP", "{}"))
+convert_item = make_item_converter(binary_base64=True, type_map=type_map)
+# How document IDs are built from the table keys, and the rules that route
+# items to subcollections, which must be the same as the --doc-id and
+# --key-routes options the data was copied with
+doc_id_strategy = os.environ.get("DOC_ID_STRATEGY", "md5")
+key_routes = json.loads(os.environ.get("KEY_ROUTES") or "null")
+# Pipelines by key schema, whose key routes are compiled once per container
+pipelines = {}
+
+
+@contextmanager
+def init_step(name):
+    start = time.perf_counter()
+    yield
+    init_timings[name] = (time.perf_counter() - start) * 1000
+
+
+def get_dynamodb_client():
+    if "dynamodb" not in clients:
+        with init_step("dynamodb client"):
+            clients["dynamodb"] = boto3.client("dynamodb")
+    return clients["dynamodb"]
+
+
+def get_credentials():
+    # Load the GCP credential from AWS secrets manager.
+    # You need to create the GCP service account key file first
+    # and upload it to AWS secrets manager.
+    # The decoded credential is kept for the life of the container.
+    if "credentials" not in clients:
+        with init_step("import google.oauth2"):
+            from google.oauth2 import service_account
+        with init_step("secretsmanager client"):
+            secrets_client = boto3.client("secretsmanager")
+        with init_step("get_secret_value"):
+            kwargs = {"SecretId": os.environ["AWS_SECRET_ARN"]}
+            sa_key_val = secrets_client.get_secret_value(**kwargs)
+        with init_step("load credentials"):
+            json_account_info = json.loads(base64.b64decode(sa_key_val["SecretString"]))
+            clients["credentials"] = (
+                service_account.Credentials.from_service_account_info(json_account_info)
+            )
+    return clients["credentials"]
+
+
+def get_client(target):
+    if target not in clients:
+        credentials = get_credentials()
+        with init_step(f"{target} client"):
+            clients[target] = make_client(target, credentials)
+    return clients[target]
+
+
+def log_init_timings():
+    if profile_init and init_timings:
+        steps = ", ".join(f"{k} {v:.1f} ms" for k, v in init_timings.items())
+        print(f"Initialization: {steps}")
+        init_timings.clear()
+
+
+# Key schema of the table, cached across warm invocations
+schema_cache = {"keys": None, "expires": 0}
+schema_cache_ttl = int(os.environ.get("SCHEMA_CACHE_TTL", "300"))
+
+
+def get_key_schema(table_name, refresh=False):
+    # The deployment can pass the key schema in the environment instead
+    if "DYNAMODB_PK" in os.environ:
+        return os.environ["DYNAMODB_PK"], os.environ.get("DYNAMODB_SK") or None
+
+    now = time.monotonic()
+    if refresh or schema_cache["keys"] is None or now >= schema_cache["expires"]:
+        res = get_dynamodb_client().describe_table(TableName=table_name)
+        schema_cache["keys"] = parse_schema(res)
+        schema_cache["expires"] = now + schema_cache_ttl
+    return schema_cache["keys"]
+
+
+def get_pipeline(table_name, pk, sk):
+    if (pk, sk) not in pipelines:
+        pipelines[pk, sk] = (
+            Pipeline(table_name, pk, sk, key_routes=key_routes),
+            doc_id_function(doc_id_strategy, pk, sk),
+        )
+    return pipelines[pk, sk]
+
+
+def coalesce_records(records, pipeline, doc_ids):
+    # Keeps only the last change of each document in stream order, so a
+    # hot key updated many times in one batch is written once, and an item
+    # deleted and then re-inserted ends up inserted. Returns a dict of
+    # document path to a (sequence number, image) tuple, where the image is
+    # the DynamoDB item to set, or None to delete.
+    latest = {}
+    keys = [convert_item(rec["dynamodb"]["Keys"]) for rec in records]
+
+    for rec, key_doc, doc_id in zip(records, keys, doc_ids(keys)):
+        path = pipeline.path(doc_id, key_doc)
+        seq = rec["dynamodb"]["SequenceNumber"]
+
+        if rec["eventName"] in ["INSERT", "MODIFY"]:
+            image = dict(rec["dynamodb"]["NewImage"])
+            image.update(rec["dynamodb"]["Keys"])
+            latest[path] = (seq, image)
+
+        elif rec["eventName"] == "REMOVE":
+            latest[path] = (seq, None)
+
+    return latest
+
+
+def write_batch(target, ops):
+    # Writes a mixed list of (path, doc) sets and (path, None) deletes in
+    # stream order, and returns the paths of the writes that failed. The
+    # BulkWriter of Firestore writes in parallel and retries individual
+    # writes; Datastore writes are split into contiguous sub-batches that
+    # are committed concurrently, so that when one fails only the records
+    # from its position in the stream onwards need to be retried.
+    if not ops:
+        return set()
+    client = get_client(target)
+    if target == "datastore":
+        sink = make_sink(
+            client, target, max_in_flight=write_shards, max_attempts=max_write_attempts
+        )
+        size = -(-len(ops) // write_shards)
+    else:
+        sink = make_sink(client, target, max_attempts=max_write_attempts)
+        size = len(ops)
+    for i in range(0, len(ops), size):
+        sink.write(ops[i : i + size])
+    try:
+        sink.close()
+    except WriteSinkError as e:
+        print(e)
+    print(f"{TARGETS[target]} writes: {sink.stats}")
+    return sink.failed_paths
+
+
+def make_handler(target):
+    """Returns the Lambda handler that replicates a stream to target."""
+
+    def lambda_handler(event, context):
+        table_name = os.environ["DYNAMODB_TABLE_NAME"]
+
+        records = event["Records"]
+        start = time.perf_counter()
+        pk, sk = get_key_schema(table_name)
+        schema_ms = (time.perf_counter() - start) * 1000
+        try:
+            latest = coalesce_records(records, *get_pipeline(table_name, pk, sk))
+        except KeyError:
+            # The cached key schema is stale, for example after the table
+            # was recreated with different keys
+            start = time.perf_counter()
+            pk, sk = get_key_schema(table_name, refresh=True)
+            schema_ms += (time.perf_counter() - start) * 1000
+            latest = coalesce_records(records, *get_pipeline(table_name, pk, sk))
+        print(f"Key schema resolved in {schema_ms:.1f} ms")
+
+        ops = []
+        for path, (_, image) in sorted(latest.items(), key=lambda e: int(e[1][0])):
+            ops.append((path, None if image is None else convert_item(image)))
+        failed = write_batch(target, ops)
+        log_init_timings()
+
+        written = [doc for path, doc in ops if path not in failed]
+        write_cnt = sum(1 for doc in written if doc is not None)
+        delete_cnt = len(written) - write_cnt
+        print(f"Stream records coalesced into writes: {len(records)} -> {len(ops)}")
+        print(f"Total items synced to {TARGETS[target]}: {write_cnt}")
+        print(f"Total items removed in {TARGETS[target]}: {delete_cnt}")
+
+        # Report the earliest record whose write failed, so the event source
+        # retries the batch from there instead of re-sending every record.
+        # Records after it are re-applied, which is safe as writes are
+        # idempotent.
+        if not failed:
+            return {"batchItemFailures": []}
+        seq = min((latest[path][0] for path in failed), key=int)
+        print(f"{len(failed)} writes failed, retrying from sequence number {seq}")
+        return {"batchItemFailures": [{"itemIdentifier": seq}]}
+
+    return lambda_handler
@@ -0,0 +1,94 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# In-memory stand-ins for the clients of the copy scripts
+
+from types import SimpleNamespace
+
+
+def describe_table(table_name, pk, sk=None):
+    """Returns a DescribeTable response with the given key schema."""
+    key_schema = [{"AttributeName": pk, "KeyType": "HASH"}]
+    if sk:
+        key_schema.append({"AttributeName": sk, "KeyType": "RANGE"})
+    return {"Table": {"TableName": table_name, "KeySchema": key_schema}}
+
+
+class FakeDatastoreClient:
+    """A Datastore client whose entities are kept in `entities` by path.
+
+    fail_commit(paths) is called with the paths of each commit, and fails
+    the commit if it returns True.
+    """
+
+    def __init__(self, fail_commit=None):
+        self.entities = {}
+        self.commits = []
+        self.fail_commit = fail_commit
+
+    def key(self, *parts):
+        return parts
+
+    def batch(self):
+        return _FakeBatch(self)
+
+    def query(self, kind):
+        return _FakeQuery(self, kind)
+
+
+class _FakeEntity(dict):
+    def __init__(self, path, doc):
+        super().__init__(doc)
+        self.key = SimpleNamespace(flat_path=tuple(path.split("/")))
+
+
+class _FakeQuery:
+    # Supports the kind and ancestor of a query, not its filters
+    def __init__(self, client, kind):
+        self.client = client
+        self.kind = kind
+        self.ancestor = None
+
+    def add_filter(self, name, op, value):
+        raise NotImplementedError("the fake query has no filters")
+
+    def fetch(self):
+        prefix = "/".join(self.ancestor) + "/" if self.ancestor else ""
+        for path, doc in self.client.entities.items():
+            parts = path.split("/")
+            if parts[-2] == self.kind and path.startswith(prefix):
+                yield _FakeEntity(path, doc)
+
+
+class _FakeBatch:
+    def __init__(self, client):
+        self.client = client
+        self.ops = []
+
+    def begin(self):
+        pass
+
+    def put(self, entity):
+        self.ops.append(("/".join(entity.key), dict(entity)))
+
+    def delete(self, key):
+        self.ops.append(("/".join(key), None))
+
+    def commit(self):
+        paths = [path for path, _ in self.ops]
+        if self.client.fail_commit and self.client.fail_commit(paths):
+            raise RuntimeError(f"commit of {len(paths)} writes failed")
+        self.client.commits.append(paths)
+        for path, doc in self.ops:
+            if doc is None:
+                self.client.entities.pop(path, None)
+            else:
+                self.client.entities[path] = doc
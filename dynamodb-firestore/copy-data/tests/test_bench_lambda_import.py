@@ -0,0 +1,38 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+bench = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    "bench",
+    "bench_lambda_import.py",
+)
+
+
+@pytest.mark.parametrize("sdk", [False, True])
+def test_bench_lambda_import(sdk):
+    # A smoke run of the cold start benchmark of both stream functions
+    command = [sys.executable, bench, "--runs", "1", "--records", "10"]
+    if sdk:
+        pytest.importorskip("google.cloud.firestore")
+        pytest.importorskip("google.cloud.datastore")
+        pytest.importorskip("boto3")
+        command.append("--sdk")
+    output = subprocess.run(command, capture_output=True, text=True, timeout=120)
+    assert output.returncode == 0, output.stderr
+    assert "lambda-func-firestore" in output.stdout
+    assert "lambda-func-datastore" in output.stdout
@@ -0,0 +1,42 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from convert_pool import ConvertPool
+
+ITEMS = [{"pk": {"S": "a"}, "sk": {"N": "1"}, "data": {"B": b"xy"}}]
+
+
+def test_in_process_pools_keep_their_converters():
+    md5 = ConvertPool(0, "pk", "sk")
+    concat = ConvertPool(0, "pk", "sk", doc_id_strategy="concat")
+    base64 = ConvertPool(0, "pk", "sk", type_map={"data": "base64"})
+
+    [(md5_id, doc)] = md5.convert_scan_items(ITEMS).result()
+    assert len(md5_id) == 32
+    assert doc["data"] == b"xy"
+    [(concat_id, doc)] = concat.convert_scan_items(ITEMS).result()
+    assert concat_id == "a#1"
+    assert doc["data"] == b"xy"
+    [(base64_id, doc)] = base64.convert_scan_items(ITEMS).result()
+    assert base64_id == md5_id
+    assert doc["data"] == "eHk="
+
+
+def test_process_pool_matches_in_process_pool():
+    lines = ['{"Item": {"pk": {"S": "a"}, "sk": {"N": "1"}}}']
+    in_process = ConvertPool(0, "pk", "sk", binary_base64=True)
+    workers = ConvertPool(1, "pk", "sk", binary_base64=True)
+    try:
+        expected = in_process.convert_export_lines(lines).result()
+        assert workers.convert_export_lines(lines).result() == expected
+    finally:
+        workers.close()
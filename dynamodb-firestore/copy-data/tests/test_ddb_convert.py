@@ -0,0 +1,125 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import base64
+import json
+
+import pytest
+
+from ddb_convert import load_type_map, make_item_converter
+
+ITEM = {
+    "s": {"S": "text"},
+    "n": {"N": "42"},
+    "f": {"N": "1.5"},
+    "b": {"B": b"\x00\xff"},
+    "ss": {"SS": ["a", "b"]},
+    "ns": {"NS": ["1", "2.5"]},
+    "bs": {"BS": [b"\x01", b"\x02"]},
+    "m": {"M": {"x": {"N": "1"}, "y": {"L": [{"S": "z"}, {"NULL": True}]}}},
+    "l": {"L": [{"N": "7"}, {"M": {"b": {"B": b"\x03"}}}]},
+    "t": {"BOOL": True},
+    "null": {"NULL": True},
+}
+DOC = {
+    "s": "text",
+    "n": 42,
+    "f": 1.5,
+    "b": b"\x00\xff",
+    "ss": ["a", "b"],
+    "ns": [1, 2.5],
+    "bs": [b"\x01", b"\x02"],
+    "m": {"x": 1, "y": ["z", None]},
+    "l": [7, {"b": b"\x03"}],
+    "t": True,
+    "null": None,
+}
+
+
+def encoded(value):
+    # The attribute value with its binary values base64 encoded, as in S3
+    # exports and stream events
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode()
+    if isinstance(value, dict):
+        return {k: encoded(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [encoded(v) for v in value]
+    return value
+
+
+def test_every_type():
+    assert make_item_converter()(ITEM) == DOC
+
+
+def test_base64_binary():
+    # Exports hold base64 strings, which are stored as bytes by default
+    assert make_item_converter(binary_base64=True)(encoded(ITEM)) == DOC
+    type_map = {"b": "base64", "bs": "base64"}
+    for binary_base64, item in [(False, ITEM), (True, encoded(ITEM))]:
+        doc = make_item_converter(binary_base64, type_map)(item)
+        assert doc["b"] == "AP8="
+        assert doc["bs"] == ["AQ==", "Ag=="]
+        assert doc["l"] == [7, {"b": b"\x03"}]
+
+
+def test_number_types():
+    item = {
+        "auto": {"N": "3.0"},
+        "int": {"N": "-2.7"},
+        "float": {"N": "2"},
+        "decimal": {"N": "0.10"},
+        "big": {"N": str(2**63)},
+        "big_int": {"N": str(2**63)},
+        "min_int": {"N": str(-(2**63))},
+    }
+    type_map = {
+        "*": "auto",
+        "int": "int",
+        "float": "float",
+        "decimal": "decimal",
+        "big_int": "int",
+        "min_int": "int",
+    }
+    assert make_item_converter(type_map=type_map)(item) == {
+        "auto": 3,
+        "int": -2,
+        "float": 2.0,
+        "decimal": "0.10",
+        "big": float(2**63),
+        "big_int": str(2**63),
+        "min_int": -(2**63),
+    }
+
+
+def test_default_rule():
+    item = {"a": {"N": "1"}, "b": {"NS": ["2"]}, "c": {"N": "3"}}
+    convert = make_item_converter(type_map={"*": "decimal", "c": "int"})
+    assert convert(item) == {"a": "1", "b": ["2"], "c": 3}
+
+
+@pytest.mark.parametrize(
+    "type_map",
+    [{"a": "string"}, {"*": "bytes"}, {"*": "base64"}, {"a": 1}],
+)
+def test_load_type_map_rejects_bad_types(tmp_path, type_map):
+    path = tmp_path / "types.json"
+    path.write_text(json.dumps(type_map))
+    with pytest.raises(ValueError, match="Invalid type"):
+        load_type_map(str(path))
+
+
+def test_load_type_map(tmp_path):
+    type_map = {"*": "float", "a": "decimal", "b": "bytes", "c": "base64"}
+    path = tmp_path / "types.json"
+    path.write_text(json.dumps(type_map))
+    assert load_type_map(str(path)) == type_map
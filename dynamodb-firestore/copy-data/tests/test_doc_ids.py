@@ -0,0 +1,88 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from decimal import Decimal
+from urllib.parse import quote
+
+import pytest
+
+from doc_ids import MAX_ID_BYTES, _escape, decode_doc_id, doc_id_function
+
+KEYS = [
+    "USER#1",
+    "a/b",
+    "100%",
+    "%23",
+    ".",
+    "..",
+    "_x_",
+    "__a__",
+    "",
+    "é#ü",
+    "a b",
+    "line\nbreak",
+    "nul\0",
+    "tab\t~-_.",
+    Decimal("1.5"),
+    12,
+]
+
+
+def quoted(value):
+    # The concat IDs of the first version of the strategy
+    return quote(str(value), safe="")
+
+
+# Keys that are encoded as one string per page
+ASCII_KEYS = [k for k in KEYS if str(k).isascii() and not {"\n", "\0"} & set(str(k))]
+
+
+@pytest.mark.parametrize("page", [KEYS, ASCII_KEYS])
+def test_concat_ids_are_the_quoted_keys(page):
+    docs = [{"pk": pk, "sk": sk} for pk in page for sk in page]
+
+    ids = doc_id_function("concat", "pk", "sk")(docs)
+
+    assert ids == [_escape(quoted(doc["pk"]) + "#" + quoted(doc["sk"])) for doc in docs]
+    for doc_id, doc in zip(ids, docs):
+        assert decode_doc_id("concat", doc_id) == [str(doc["pk"]), str(doc["sk"])]
+
+
+@pytest.mark.parametrize("page", [KEYS, ASCII_KEYS])
+def test_concat_ids_of_partition_keys(page):
+    docs = [{"pk": pk} for pk in page]
+    ids = doc_id_function("concat", "pk", None)(docs)
+    assert ids == [_escape(quoted(doc["pk"])) for doc in docs]
+    assert doc_id_function("concat", "pk", None)([]) == []
+
+
+@pytest.mark.parametrize("strategy", ["concat", "base64"])
+def test_ids_over_the_size_limit_are_rejected(strategy):
+    make_ids = doc_id_function(strategy, "pk", "sk")
+    docs = [{"pk": "a", "sk": "b"}, {"pk": "a", "sk": "x" * MAX_ID_BYTES}]
+
+    with pytest.raises(ValueError, match="over the limit of 1500"):
+        make_ids(docs)
+    assert len(make_ids(docs[:1])) == 1
+
+
+def test_base64_ids_decode_to_the_keys():
+    keys = ["USER#1", "", "é#ü", 12, -1.5, b"\x00\xff", b""]
+    docs = [{"pk": pk, "sk": sk} for pk in keys for sk in keys]
+
+    ids = doc_id_function("base64", "pk", "sk")(docs)
+
+    assert len(set(ids)) == len(docs)
+    for doc_id, doc in zip(ids, docs):
+        assert decode_doc_id("base64", doc_id) == [doc["pk"], doc["sk"]]
+    # A string key is not taken for the bytes it looks like
+    assert decode_doc_id("base64", ids[0]) == ["USER#1", "USER#1"]
@@ -0,0 +1,67 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import sqlite3
+
+import pytest
+
+pytest.importorskip("google.cloud.datastore")
+
+import engine
+
+from fakes import FakeDatastoreClient, describe_table
+
+
+class FailingSource:
+    # Writes one page, then fails like a scan whose retries ran out
+    table_name = "T"
+    binary_base64 = False
+
+    def describe_table(self):
+        return describe_table("T", "pk")
+
+    def copy(self, table, pipeline, pool, checkpoint=None):
+        id_docs = pool.convert_scan_items([{"pk": {"S": "a"}}]).result()
+        pipeline.write(id_docs, 10)
+        raise RuntimeError("scan failed")
+
+
+def test_failed_copy_closes_everything(tmp_path, monkeypatch):
+    client = FakeDatastoreClient()
+    created = {}
+
+    def keep(name, factory):
+        def make(*args, **kwargs):
+            created[name] = factory(*args, **kwargs)
+            return created[name]
+
+        monkeypatch.setattr(engine, factory.__name__, make)
+
+    monkeypatch.setattr(engine, "make_client", lambda target: client)
+    keep("sink", engine.make_sink)
+    keep("reporter", engine.ProgressReporter)
+    keep("checkpoint", engine.Checkpoint)
+
+    with pytest.raises(RuntimeError, match="scan failed"):
+        engine.copy_table(
+            FailingSource(),
+            "datastore",
+            checkpoint_path=str(tmp_path / "copy.db"),
+            progress_interval=1,
+        )
+
+    # The page written before the failure was committed
+    assert list(client.entities.values()) == [{"pk": "a"}]
+    assert created["sink"]._executor._shutdown
+    assert not created["reporter"]._reporter.is_alive()
+    with pytest.raises(sqlite3.ProgrammingError):
+        created["checkpoint"]._db.execute("SELECT 1")
@@ -0,0 +1,107 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import gzip
+import json
+import os
+import time
+
+import boto3
+import pytest
+
+from export_cache import ExportCache
+
+BUCKET = "exports"
+FILES = ["a", "b", "c"]
+
+
+@pytest.fixture
+def s3(aws):
+    # An export bucket with a data file of the same size for each of FILES,
+    # and the list of the GetObject calls of the client
+    client = boto3.client("s3")
+    client.create_bucket(Bucket=BUCKET)
+    for name in FILES:
+        lines = [json.dumps({"Item": {"pk": {"S": f"{name}{i}"}}}) for i in range(100)]
+        body = gzip.compress("\n".join(lines).encode() + b"\n", mtime=0)
+        client.put_object(Bucket=BUCKET, Key=f"data/{name}.json.gz", Body=body)
+    client.gets = []
+    client.meta.events.register(
+        "before-call.s3.GetObject",
+        lambda params, **kwargs: client.gets.append(params["url_path"]),
+    )
+    return client
+
+
+def uri(name):
+    return f"s3://{BUCKET}/data/{name}.json.gz"
+
+
+def cached(cache_dir):
+    # The data files in the cache, without their ETag prefix
+    return sorted(entry.split("-", 1)[1] for entry in os.listdir(cache_dir))
+
+
+def test_second_read_is_a_hit(s3, tmp_path):
+    cache_dir = str(tmp_path)
+    first = ExportCache(cache_dir, 1 << 20, s3_client=s3)
+    lines = list(first.read_lines(uri("a")))
+    first.close()
+    assert len(lines) == 100
+    assert (first.hits, first.downloads) == (0, 1)
+    assert s3.gets
+    # The download was renamed into place
+    assert cached(cache_dir) == ["a.json.gz"]
+
+    s3.gets.clear()
+    second = ExportCache(cache_dir, 1 << 20, s3_client=s3)
+    assert list(second.read_lines(uri("a"))) == lines
+    second.close()
+    assert (second.hits, second.downloads) == (1, 0)
+    assert not s3.gets
+
+
+def test_evicts_least_recently_used(s3, tmp_path):
+    cache_dir = str(tmp_path)
+    cache = ExportCache(cache_dir, 1 << 20, s3_client=s3)
+    for name in ["a", "b"]:
+        list(cache.read_lines(uri(name)))
+        time.sleep(0.01)
+    cache.max_bytes = sum(
+        os.path.getsize(os.path.join(cache_dir, entry))
+        for entry in os.listdir(cache_dir)
+    )
+    # Reading a again makes b the least recently used file
+    list(cache.read_lines(uri("a")))
+    time.sleep(0.01)
+    list(cache.read_lines(uri("c")))
+    cache.close()
+    assert cached(cache_dir) == ["a.json.gz", "c.json.gz"]
+
+
+def test_keeps_files_in_use(s3, tmp_path):
+    cache_dir = str(tmp_path)
+    cache = ExportCache(cache_dir, 1, s3_client=s3)
+    lines = cache.read_lines(uri("a"), prefetch_uris=[uri("b")])
+    next(lines)
+    cache.fetch(uri("b"))
+    # a is being read and b was prefetched, so neither is evicted past
+    # max_bytes
+    assert cached(cache_dir) == ["a.json.gz", "b.json.gz"]
+
+    list(lines)
+    assert cached(cache_dir) == ["b.json.gz"]
+    s3.gets.clear()
+    list(cache.read_lines(uri("b")))
+    cache.close()
+    assert not s3.gets
+    assert cached(cache_dir) == []
@@ -0,0 +1,91 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import gzip
+import random
+
+import pytest
+
+from export_reader import BUFFER_SIZE, CHUNK_BYTES, chunk_lines, read_lines
+
+
+def make_lines(count, max_length, seed=0):
+    # Lines of random lengths, some of them empty, with no newlines
+    rng = random.Random(seed)
+    lines = []
+    for i in range(count):
+        length = rng.randrange(max_length)
+        lines.append((b"%d:abcdefgh," % i * (length // 10 + 1))[:length])
+    return lines
+
+
+def write(path, lines, members=1):
+    # Writes the lines, in `members` gzip members if path ends with .gz
+    data = b"".join(line + b"\n" for line in lines)
+    if path.suffix == ".gz":
+        size = -(-len(data) // members)
+        data = b"".join(
+            gzip.compress(data[i : i + size]) for i in range(0, len(data), size)
+        )
+    path.write_bytes(data)
+    return str(path)
+
+
+@pytest.mark.parametrize("name", ["data.json", "data.json.gz"])
+@pytest.mark.parametrize("buffer_size", [4096, 4097, BUFFER_SIZE])
+def test_lines_across_blocks(tmp_path, name, buffer_size):
+    # Lines longer and shorter than the blocks, so that they span block and
+    # inflate boundaries
+    lines = make_lines(100, 3 * buffer_size)
+    path = write(tmp_path / name, lines)
+    assert list(read_lines(path, buffer_size=buffer_size)) == lines
+
+
+def test_highly_compressed_lines(tmp_path):
+    # Each block inflates to many buffers
+    lines = [b"x" * (1 << 20), b"", b"y" * 5, b"z" * (3 << 20)]
+    path = write(tmp_path / "data.json.gz", lines)
+    assert list(read_lines(path, buffer_size=4096)) == lines
+
+
+@pytest.mark.parametrize("buffer_size", [4096, BUFFER_SIZE])
+def test_multi_member_gzip(tmp_path, buffer_size):
+    lines = make_lines(2000, 1000)
+    path = write(tmp_path / "data.json.gz", lines, members=7)
+    assert list(read_lines(path, buffer_size=buffer_size)) == lines
+    assert list(read_lines(f"file://{path}", buffer_size=buffer_size)) == lines
+
+
+def test_last_line_without_newline(tmp_path):
+    path = tmp_path / "data.json"
+    path.write_bytes(b"a\nbc")
+    assert list(read_lines(str(path))) == [b"a", b"bc"]
+
+
+@pytest.mark.parametrize("name", ["data.json", "data.json.gz"])
+def test_empty_local_file(tmp_path, name):
+    path = tmp_path / name
+    path.write_bytes(b"")
+    assert list(read_lines(str(path))) == []
+
+
+def test_chunk_lines_byte_cap():
+    lines = [b"x" * (1 << 20)] * 10
+    chunks = list(chunk_lines(iter(lines), 500))
+    assert [len(chunk) for chunk in chunks] == [4, 4, 2]
+    assert CHUNK_BYTES == 4 << 20
+
+    small = [b"ab"] * 1001
+    assert [len(chunk) for chunk in chunk_lines(small, 500)] == [500, 500, 1]
+    chunks = chunk_lines(small, 500, max_bytes=3)
+    assert [len(chunk) for chunk in chunks] == [2] * 500 + [1]
+    assert list(chunk_lines([], 500)) == []
@@ -0,0 +1,112 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import gzip
+import json
+
+import pytest
+
+pytest.importorskip("google.cloud.datastore")
+
+import engine
+
+from collections import Counter
+from export_source import ExportSource
+from fakes import FakeDatastoreClient, describe_table
+from write_sink import WriteSinkError, make_sink
+
+FILES = 3
+ITEMS_PER_FILE = 700
+
+
+class FakeDynamoDB:
+    def describe_table(self, TableName):
+        return describe_table(TableName, "pk")
+
+
+@pytest.fixture
+def export_dir(tmp_path):
+    # A local copy of a full export: manifest-files.json and gzip data files
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    manifest = []
+    for f in range(FILES):
+        name = f"file{f}.json.gz"
+        with gzip.open(data_dir / name, "wt") as fout:
+            for i in range(ITEMS_PER_FILE):
+                item = {"pk": {"S": f"f{f}-{i}"}, "n": {"N": str(i)}}
+                fout.write(json.dumps({"Item": item}) + "\n")
+        key = f"AWSDynamoDB/01667837262018-1223ed5d/data/{name}"
+        manifest.append({"itemCount": ITEMS_PER_FILE, "dataFileS3Key": key})
+    with open(tmp_path / "manifest-files.json", "w") as fout:
+        fout.writelines(json.dumps(entry) + "\n" for entry in manifest)
+    return str(tmp_path)
+
+
+def copy(export_dir, target, monkeypatch, **kwargs):
+    monkeypatch.setattr(engine, "make_client", lambda target_name: target)
+    # Fail a commit at its first attempt rather than after the backoff
+    monkeypatch.setattr(
+        engine, "make_sink", lambda *args, **kw: make_sink(*args, max_attempts=1, **kw)
+    )
+    source = ExportSource("T", export_dir, files=2, ddb_client=FakeDynamoDB())
+    return engine.copy_table(
+        source,
+        "datastore",
+        progress_interval=0,
+        rate_limiter=None,
+        doc_id_strategy="concat",
+        **kwargs,
+    )
+
+
+def written(target):
+    return Counter(path for paths in target.commits for path in paths)
+
+
+def test_copies_every_data_file(aws, export_dir, monkeypatch):
+    target = FakeDatastoreClient()
+
+    read_cnt, write_cnt = copy(export_dir, target, monkeypatch)
+
+    assert read_cnt == write_cnt == FILES * ITEMS_PER_FILE
+    writes = written(target)
+    assert len(writes) == FILES * ITEMS_PER_FILE
+    assert set(writes.values()) == {1}
+    assert target.entities["T/f2-699"] == {"pk": "f2-699", "n": 699}
+
+
+def test_resume_copies_only_unfinished_files(aws, export_dir, tmp_path, monkeypatch):
+    checkpoint = str(tmp_path / "copy.db")
+    failing = FakeDatastoreClient(
+        fail_commit=lambda paths: any(path.startswith("T/f1-") for path in paths)
+    )
+    with pytest.raises(WriteSinkError):
+        copy(export_dir, failing, monkeypatch, checkpoint_path=checkpoint)
+    assert not any(path.startswith("T/f1-") for path in failing.entities)
+
+    target = FakeDatastoreClient()
+    read_cnt, write_cnt = copy(
+        export_dir, target, monkeypatch, checkpoint_path=checkpoint, resume=True
+    )
+
+    # Only the data file whose writes failed is read and written again
+    assert read_cnt == write_cnt == ITEMS_PER_FILE
+    assert set(written(target)) == {f"T/f1-{i}" for i in range(ITEMS_PER_FILE)}
+    assert len(failing.entities) + len(target.entities) == FILES * ITEMS_PER_FILE
+
+    # Resuming a finished copy writes nothing
+    done = FakeDatastoreClient()
+    assert copy(
+        export_dir, done, monkeypatch, checkpoint_path=checkpoint, resume=True
+    ) == (0, 0)
+    assert not done.commits
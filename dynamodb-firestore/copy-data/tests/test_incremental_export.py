@@ -0,0 +1,128 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import gzip
+import json
+
+import pytest
+
+pytest.importorskip("google.cloud.datastore")
+
+import engine
+
+from export_source import ExportSource
+from fakes import FakeDatastoreClient, describe_table
+from write_sink import WriteSinkError, make_sink
+
+ROUTES = [{"pk": "CUST#{customer_id}", "path": "customers/{customer_id}"}]
+
+
+class FakeDynamoDB:
+    def describe_table(self, TableName):
+        return describe_table(TableName, "pk")
+
+
+def change(pk, timestamp, n=None):
+    # A line of an incremental export data file; without n, a delete
+    line = {
+        "Metadata": {"WriteTimestampMicros": {"N": str(timestamp)}},
+        "Keys": {"pk": {"S": pk}},
+    }
+    if n is not None:
+        line["NewImage"] = {"pk": {"S": pk}, "n": {"N": str(n)}}
+    return line
+
+
+def write_export(path, files):
+    # A local copy of an incremental export, with a data file of changes
+    # for each list of files
+    data_dir = path / "data"
+    data_dir.mkdir()
+    with open(path / "manifest-summary.json", "w") as fout:
+        json.dump({"exportType": "INCREMENTAL_EXPORT"}, fout)
+    with open(path / "manifest-files.json", "w") as manifest:
+        for f, changes in enumerate(files):
+            name = f"file{f}.json.gz"
+            with gzip.open(data_dir / name, "wt") as fout:
+                fout.writelines(json.dumps(line) + "\n" for line in changes)
+            key = f"AWSDynamoDB/01667837262018-1223ed5d/data/{name}"
+            manifest.write(json.dumps({"dataFileS3Key": key}) + "\n")
+    return str(path)
+
+
+def apply(export_dir, target, monkeypatch, **kwargs):
+    monkeypatch.setattr(engine, "make_client", lambda target_name: target)
+    monkeypatch.setattr(
+        engine, "make_sink", lambda *args, **kw: make_sink(*args, max_attempts=1, **kw)
+    )
+    source = ExportSource("T", export_dir, files=2, ddb_client=FakeDynamoDB())
+    return engine.copy_table(
+        source,
+        "datastore",
+        progress_interval=0,
+        rate_limiter=None,
+        doc_id_strategy="concat",
+        **kwargs,
+    )
+
+
+def test_latest_change_wins(aws, tmp_path, monkeypatch):
+    export_dir = write_export(
+        tmp_path,
+        [
+            [change("a", 1, 1), change("b", 9), change("c", 3, 3)],
+            [change("a", 2, 2), change("b", 5, 5), change("c", 1, 1)],
+            [change("CUST#1", 4), change("CUST#2", 4, 2)],
+        ],
+    )
+    target = FakeDatastoreClient()
+    target.entities["T/b"] = {"pk": "b", "n": 0}
+    target.entities["customers/1"] = {"pk": "CUST#1", "n": 0}
+
+    read_cnt, write_cnt = apply(export_dir, target, monkeypatch, key_routes=ROUTES)
+
+    assert (read_cnt, write_cnt) == (8, 5)
+    # The delete of b and the routed CUST#1 remove their documents
+    assert target.entities == {
+        "T/a": {"pk": "a", "n": 2},
+        "T/c": {"pk": "c", "n": 3},
+        "customers/2": {"pk": "CUST#2", "n": 2},
+    }
+
+
+def test_resume_applies_the_remaining_changes(aws, tmp_path, monkeypatch):
+    changes = [change(f"i{i:04d}", 1, i) for i in range(1200)]
+    export_dir = write_export(tmp_path, [changes[::2], changes[1::2]])
+    checkpoint = str(tmp_path / "copy.db")
+    # The changes are applied in path order, 500 at a time, so the second
+    # chunk fails
+    failing = FakeDatastoreClient(fail_commit=lambda paths: "T/i0600" in paths)
+    with pytest.raises(WriteSinkError):
+        apply(export_dir, failing, monkeypatch, checkpoint_path=checkpoint)
+
+    target = FakeDatastoreClient()
+    read_cnt, write_cnt = apply(
+        export_dir, target, monkeypatch, checkpoint_path=checkpoint, resume=True
+    )
+
+    # The changes are read again, and only those after the first chunk are
+    # written
+    assert (read_cnt, write_cnt) == (1200, 700)
+    written = {path for paths in target.commits for path in paths}
+    assert written == {f"T/i{i:04d}" for i in range(500, 1200)}
+
+    # Resuming applied changes writes nothing
+    done = FakeDatastoreClient()
+    assert apply(
+        export_dir, done, monkeypatch, checkpoint_path=checkpoint, resume=True
+    ) == (0, 0)
+    assert not done.commits
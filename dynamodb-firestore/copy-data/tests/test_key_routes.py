@@ -0,0 +1,39 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import pytest
+
+from key_routes import KeyRouter
+
+ROUTES = [
+    {
+        "pk": "CUST#{customer_id}",
+        "sk": "ORDER#{order_id}",
+        "path": "customers/{customer_id}/orders/{order_id}",
+    },
+    {"pk": "CUST#{customer_id}", "path": "customers/{customer_id}"},
+]
+
+
+def test_routes():
+    router = KeyRouter(ROUTES, "pk", "sk")
+    path = router.path({"pk": "CUST#1", "sk": "ORDER#a/b"})
+    assert path == "customers/1/orders/a%2Fb"
+    assert router.path({"pk": "CUST#1", "sk": "EMAIL#x@y"}) == "customers/1"
+    assert router.path({"pk": "ORDER#1", "sk": "LINE#1"}) is None
+
+
+def test_unused_sort_key_placeholder_rejected():
+    rule = {"pk": "CUST#{customer_id}", "sk": "EMAIL#{email}"}
+    with pytest.raises(ValueError, match="overwrite"):
+        KeyRouter([dict(rule, path="customers/{customer_id}")], "pk", "sk")
+    KeyRouter([dict(rule, path="customers/{customer_id}/emails/{email}")], "pk", "sk")
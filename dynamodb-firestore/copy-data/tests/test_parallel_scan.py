@@ -0,0 +1,64 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from collections import Counter
+
+import pytest
+
+pytest.importorskip("google.cloud.datastore")
+
+import boto3
+import engine
+
+from fakes import FakeDatastoreClient
+from scan_source import ScanSource
+
+ITEMS = 1234
+
+
+@pytest.fixture
+def table(aws):
+    client = boto3.client("dynamodb")
+    client.create_table(
+        TableName="T",
+        KeySchema=[
+            {"AttributeName": "pk", "KeyType": "HASH"},
+            {"AttributeName": "sk", "KeyType": "RANGE"},
+        ],
+        AttributeDefinitions=[
+            {"AttributeName": "pk", "AttributeType": "S"},
+            {"AttributeName": "sk", "AttributeType": "N"},
+        ],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    items = [{"pk": {"S": f"p{i % 100}"}, "sk": {"N": str(i)}} for i in range(ITEMS)]
+    for i in range(0, ITEMS, 25):
+        requests = [{"PutRequest": {"Item": item}} for item in items[i : i + 25]]
+        client.batch_write_item(RequestItems={"T": requests})
+    return client
+
+
+@pytest.mark.parametrize("segments, workers", [(1, 1), (1, 4), (3, 2), (8, 8)])
+def test_every_item_is_copied_once(table, monkeypatch, segments, workers):
+    target = FakeDatastoreClient()
+    monkeypatch.setattr(engine, "make_client", lambda target_name: target)
+    source = ScanSource("T", segments, workers, ddb_client=table)
+
+    read_cnt, write_cnt = engine.copy_table(
+        source, "datastore", progress_interval=0, rate_limiter=None
+    )
+
+    assert read_cnt == write_cnt == ITEMS
+    writes = Counter(path for paths in target.commits for path in paths)
+    assert len(writes) == ITEMS
+    assert set(writes.values()) == {1}
+    assert sorted(doc["sk"] for doc in target.entities.values()) == list(range(ITEMS))
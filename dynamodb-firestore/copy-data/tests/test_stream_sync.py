@@ -0,0 +1,118 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import pytest
+
+pytest.importorskip("boto3")
+
+import stream_sync
+
+from doc_ids import doc_id_function
+from fakes import FakeDatastoreClient
+from pipeline import Pipeline
+from stream_sync import coalesce_records
+
+
+def record(event_name, seq, pk, **attributes):
+    keys = {"pk": {"S": pk}}
+    change = {"Keys": keys, "SequenceNumber": str(seq)}
+    if event_name != "REMOVE":
+        change["NewImage"] = dict(keys, **{k: {"S": v} for k, v in attributes.items()})
+    return {"eventName": event_name, "dynamodb": change}
+
+
+def coalesce(records):
+    pipeline = Pipeline("T", "pk", None)
+    return coalesce_records(records, pipeline, doc_id_function("concat", "pk", None))
+
+
+def test_last_change_of_a_document_wins():
+    latest = coalesce(
+        [
+            record("INSERT", 100, "a", v="1"),
+            record("MODIFY", 101, "a", v="2"),
+            record("REMOVE", 102, "a"),
+        ]
+    )
+    assert latest == {"T/a": ("102", None)}
+
+
+def test_delete_then_reinsert_is_an_insert():
+    latest = coalesce(
+        [
+            record("INSERT", 100, "a", v="1"),
+            record("REMOVE", 101, "a"),
+            record("INSERT", 102, "a", v="3"),
+        ]
+    )
+    assert latest == {"T/a": ("102", {"pk": {"S": "a"}, "v": {"S": "3"}})}
+
+
+def test_documents_keep_the_order_of_their_last_change():
+    latest = coalesce(
+        [
+            record("INSERT", 98, "a", v="1"),
+            record("INSERT", 99, "b", v="1"),
+            record("MODIFY", 100, "c", v="1"),
+            record("MODIFY", 101, "a", v="2"),
+            record("REMOVE", 1000, "b"),
+        ]
+    )
+    assert latest == {
+        "T/a": ("101", {"pk": {"S": "a"}, "v": {"S": "2"}}),
+        "T/b": ("1000", None),
+        "T/c": ("100", {"pk": {"S": "c"}, "v": {"S": "1"}}),
+    }
+    # Sequence numbers are compared as numbers, not strings
+    order = sorted(latest, key=lambda path: int(latest[path][0]))
+    assert order == ["T/c", "T/a", "T/b"]
+
+
+def test_failed_sub_batch_retries_from_its_first_record(monkeypatch):
+    pytest.importorskip("google.cloud.datastore")
+    monkeypatch.setenv("DYNAMODB_TABLE_NAME", "T")
+    monkeypatch.setenv("DYNAMODB_PK", "pk")
+    monkeypatch.delenv("DYNAMODB_SK", raising=False)
+    monkeypatch.setattr(stream_sync, "doc_id_strategy", "concat")
+    monkeypatch.setattr(stream_sync, "pipelines", {})
+    monkeypatch.setattr(stream_sync, "write_shards", 4)
+    monkeypatch.setattr(stream_sync, "max_write_attempts", 1)
+    # The sub-batches of records 6-10 and 16-20 fail
+    client = FakeDatastoreClient(
+        fail_commit=lambda paths: "T/k08" in paths or "T/k18" in paths
+    )
+    monkeypatch.setitem(stream_sync.clients, "datastore", client)
+    records = [record("INSERT", seq, f"k{seq:02}", v="1") for seq in range(1, 21)]
+
+    handler = stream_sync.make_handler("datastore")
+    response = handler({"Records": records}, None)
+
+    # Only the earliest failed record is reported, and the records before
+    # it, whose documents were committed, are not delivered again
+    assert response == {"batchItemFailures": [{"itemIdentifier": "6"}]}
+    committed = [f"T/k{seq:02}" for seq in [*range(1, 6), *range(11, 16)]]
+    assert sorted(client.entities) == committed
+
+
+def test_batch_without_failures_reports_none(monkeypatch):
+    pytest.importorskip("google.cloud.datastore")
+    monkeypatch.setenv("DYNAMODB_TABLE_NAME", "T")
+    monkeypatch.setenv("DYNAMODB_PK", "pk")
+    monkeypatch.setattr(stream_sync, "pipelines", {})
+    client = FakeDatastoreClient()
+    monkeypatch.setitem(stream_sync.clients, "datastore", client)
+    records = [record("INSERT", 1, "a", v="1"), record("REMOVE", 2, "b")]
+
+    response = stream_sync.make_handler("datastore")({"Records": records}, None)
+
+    assert response == {"batchItemFailures": []}
+    assert list(client.entities.values()) == [{"pk": "a", "v": "1"}]
@@ -0,0 +1,66 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import pytest
+
+from fakes import FakeDatastoreClient
+from verify import RangeDigest, read_datastore, routed_collections
+
+ROUTES = [
+    {"pk": "CUST#{customer_id}", "sk": "PROFILE", "path": "customers/{customer_id}"},
+    {
+        "pk": "CUST#{customer_id}",
+        "sk": "ORDER#{order_id}",
+        "path": "customers/{customer_id}/orders/{order_id}",
+    },
+    {"pk": "ITEM#{item_id}", "path": "catalog/items/products/{item_id}"},
+]
+
+
+def test_routed_collections():
+    collections = {
+        (parent, collection_id): paths.pattern
+        for parent, collection_id, paths in routed_collections("table", ROUTES)
+    }
+    assert collections == {
+        ("", "customers"): "customers/[^/]+",
+        (None, "orders"): "customers/[^/]+/orders/[^/]+",
+        ("catalog/items", "products"): "catalog/items/products/[^/]+",
+    }
+    assert routed_collections("customers", ROUTES[:1]) == []
+
+
+def test_placeholder_collection_rejected():
+    rule = {"pk": "T#{t}", "sk": "{kind}#{id}", "path": "{kind}/{id}"}
+    with pytest.raises(ValueError, match="collection ID"):
+        routed_collections("table", [rule])
+
+
+def test_read_datastore_keeps_routed_paths():
+    client = FakeDatastoreClient()
+    routed = [
+        "table/1",
+        "customers/c1",
+        "customers/c1/orders/o1",
+        "catalog/items/products/p1",
+    ]
+    unrelated = [
+        "shops/s1/orders/o1",
+        "customers/c1/notes/n1/orders/o1",
+        "catalog/other/products/p1",
+    ]
+    for path in routed + unrelated:
+        client.entities[path] = {"path": path}
+
+    digest = RangeDigest(lambda path: "0", 1, keep={"0"})
+    read_datastore(client, "table", digest, False, ROUTES)
+    assert sorted(digest.items) == sorted(routed)
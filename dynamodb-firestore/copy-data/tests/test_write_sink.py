@@ -0,0 +1,103 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+firestore = pytest.importorskip("google.cloud.firestore")
+
+from google.api_core.exceptions import ServiceUnavailable
+from google.auth.credentials import AnonymousCredentials
+from google.cloud.firestore_v1.bulk_batch import BulkWriteBatch
+from google.cloud.firestore_v1.types import BatchWriteResponse, WriteResult
+from google.rpc import status_pb2
+from write_sink import FirestoreBulkSink, WriteSinkError
+
+
+def fake_commit(failures):
+    # Fails the first `failures` BatchWrite RPCs, then accepts every write
+    calls = []
+
+    def commit(batch, *args, **kwargs):
+        calls.append(len(batch))
+        if len(calls) <= failures:
+            raise ServiceUnavailable("connection reset")
+        return BatchWriteResponse(
+            status=[status_pb2.Status(code=0)] * len(batch),
+            write_results=[WriteResult()] * len(batch),
+        )
+
+    return commit, calls
+
+
+def make_sink(max_attempts):
+    client = firestore.Client(project="test", credentials=AnonymousCredentials())
+    return FirestoreBulkSink(client, max_in_flight=1, max_attempts=max_attempts)
+
+
+def test_failed_rpc_is_retried(monkeypatch):
+    commit, calls = fake_commit(failures=1)
+    monkeypatch.setattr(BulkWriteBatch, "commit", commit)
+    sink = make_sink(max_attempts=2)
+    committed = []
+    ops = [(f"T/{i}", {"n": i}) for i in range(30)]
+
+    # The second write waits for the retry of the first batch to be sent
+    sink.write(ops[:20], lambda: committed.append(True))
+    sink.write(ops[20:])
+    sink.close()
+
+    assert committed == [True]
+    assert sink.stats.succeeded == 30
+    assert sink.stats.retried == 20
+    assert sink.stats.in_flight == 0
+    assert not sink.failed_paths
+    assert len(calls) == 3
+
+
+def test_failed_rpc_fails_its_writes(monkeypatch):
+    commit, _ = fake_commit(failures=100)
+    monkeypatch.setattr(BulkWriteBatch, "commit", commit)
+    sink = make_sink(max_attempts=1)
+    committed = []
+    ops = [(f"T/{i}", {"n": i}) for i in range(30)]
+
+    # More writes than max_in_flight allows: write() must not block forever
+    sink.write(ops[:20], lambda: committed.append(True))
+    sink.write(ops[20:])
+    with pytest.raises(WriteSinkError, match="connection reset"):
+        sink.close()
+
+    assert not committed
+    assert sink.stats.failed == 30
+    assert sink.stats.in_flight == 0
+    assert sink.failed_paths == {path for path, _ in ops}
+
+
+def test_writes_without_result_fail_on_flush(monkeypatch):
+    commit, _ = fake_commit(failures=0)
+    monkeypatch.setattr(BulkWriteBatch, "commit", commit)
+    sink = make_sink(max_attempts=1)
+    # The response of the batch is lost before any write callback runs
+    monkeypatch.setattr(sink._bulk_writer, "_process_response", lambda *args: None)
+
+    sink.write([("T/a", {}), ("T/b", None)])
+    sink.flush()
+
+    assert sink.failed_paths == {"T/a", "T/b"}
+    assert sink.stats.in_flight == 0
+
+
+def test_missing_bulk_writer_internals(monkeypatch):
+    from google.cloud.firestore_v1.bulk_writer import BulkWriter
+
+    monkeypatch.delattr(BulkWriter, "_schedule_ready_retries")
+    with pytest.raises(ImportError, match="_schedule_ready_retries"):
+        make_sink(max_attempts=1)
@@ -0,0 +1,352 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Verifies a copy by comparing digests of key ranges instead of documents.
+#
+# Every document is hashed, with its path, into a 128-bit value, and the
+# hashes are summed per leaf range. With md5 and xxh3 document IDs in the
+# table collection, a leaf range is the documents whose ID starts with the
+# same depth hex digits, which Firestore and Datastore can read as a key
+# range; other paths are placed by a hash of the path. A sum does not
+# depend on the order it is taken in, so parallel scan segments and
+# parallel range reads add to the same digest, and the digest of a range
+# is the sum of those of its sub-ranges. Comparing the source and target
+# trees from the root only descends into ranges that disagree, and a second
+# pass reads just the leaf ranges that disagree to name the documents.
+
+import base64
+import hashlib
+import json
+import re
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from decimal import Decimal
+from key_routes import KeyRouter
+
+# Document ID strategies whose IDs are hex digests
+HEX_STRATEGIES = ("md5", "xxh3")
+_HEX_DIGITS = "0123456789abcdef"
+_MASK = (1 << 128) - 1
+# Documents hashed at once by the readers
+_BATCH_SIZE = 500
+
+
+def _default(value):
+    # Values json does not serialize, as both sides store them: Firestore
+    # and Datastore return Decimal numbers as floats
+    if isinstance(value, (bytes, bytearray)):
+        return "b64:" + base64.b64encode(value).decode()
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+def document_hash(path, doc):
+    """Returns the 128-bit hash of a document and its path."""
+    normalized = json.dumps(
+        doc, sort_keys=True, separators=(",", ":"), default=_default
+    )
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(path.encode())
+    digest.update(b"\0")
+    digest.update(normalized.encode())
+    return int.from_bytes(digest.digest(), "big")
+
+
+def leaf_function(table, doc_id_strategy, depth):
+    """Returns a function that maps a document path to its leaf range."""
+    prefix = f"{table}/"
+    hex_ids = doc_id_strategy in HEX_STRATEGIES
+
+    def leaf_of(path):
+        if hex_ids and path.startswith(prefix) and "/" not in path[len(prefix) :]:
+            return path[len(prefix) : len(prefix) + depth]
+        return hashlib.blake2b(path.encode(), digest_size=8).hexdigest()[:depth]
+
+    return leaf_of
+
+
+class RangeDigest:
+    """Count and sum of document hashes per leaf range.
+
+    With keep, a set of leaf ranges, the hash of every document in those
+    ranges is also kept in items, by path.
+    """
+
+    def __init__(self, leaf_of, depth, keep=None):
+        self.leaf_of = leaf_of
+        self.depth = depth
+        self.keep = keep
+        self.leaves = {}
+        self.items = {}
+        self._lock = threading.Lock()
+
+    def add(self, path_docs):
+        hashes = [
+            (path, self.leaf_of(path), document_hash(path, doc))
+            for path, doc in path_docs
+        ]
+        with self._lock:
+            for path, leaf, value in hashes:
+                count, total = self.leaves.get(leaf, (0, 0))
+                self.leaves[leaf] = (count + 1, (total + value) & _MASK)
+                if self.keep is not None and leaf in self.keep:
+                    self.items[path] = value
+
+    def count(self):
+        return sum(count for count, _ in self.leaves.values())
+
+    def tree(self):
+        """Returns the (count, sum) of every range prefix, from "" to leaves."""
+        nodes = dict(self.leaves)
+        level = self.leaves
+        for _ in range(self.depth):
+            parents = {}
+            for prefix, (count, total) in level.items():
+                parent_count, parent_total = parents.get(prefix[:-1], (0, 0))
+                parents[prefix[:-1]] = (
+                    parent_count + count,
+                    (parent_total + total) & _MASK,
+                )
+            nodes.update(parents)
+            level = parents
+        return nodes
+
+
+def compare(source, target):
+    """Returns the leaf ranges whose digests differ, and the nodes compared.
+
+    Starts at the root and only compares the sub-ranges of ranges that
+    differ.
+    """
+    source_tree = source.tree()
+    target_tree = target.tree()
+    depth = source.depth
+    frontier = [""]
+    leaves = []
+    compared = 0
+    while frontier:
+        next_frontier = []
+        for prefix in frontier:
+            compared += 1
+            if source_tree.get(prefix) == target_tree.get(prefix):
+                continue
+            if len(prefix) == depth:
+                leaves.append(prefix)
+                continue
+            for digit in _HEX_DIGITS:
+                child = prefix + digit
+                if child in source_tree or child in target_tree:
+                    next_frontier.append(child)
+        frontier = next_frontier
+    return leaves, compared
+
+
+def diff_items(source, target):
+    """Returns the missing, extra and different paths of two drill-downs."""
+    missing = sorted(path for path in source.items if path not in target.items)
+    extra = sorted(path for path in target.items if path not in source.items)
+    different = sorted(
+        path
+        for path, value in source.items.items()
+        if path in target.items and target.items[path] != value
+    )
+    return missing, extra, different
+
+
+def routed_collections(table, key_routes):
+    """Returns the collections other than the table that key routes write to.
+
+    Each is a (parent, collection_id, paths) tuple, where parent is the path
+    of the parent document, "" for a root collection, or None to read every
+    collection with the ID, and paths matches the paths of the documents
+    the routes write there. Documents of other paths in the same
+    collections were not written by the copy.
+    """
+    if not key_routes:
+        return []
+    by_id = {}
+    for route in KeyRouter(key_routes, None, None).routes.values():
+        if route.parent == "" and route.collection_id == table:
+            continue
+        by_id.setdefault(route.collection_id, []).append(route)
+
+    collections = []
+    for collection_id, routes in by_id.items():
+        # A collection is read once, as a group if any parent depends on
+        # the keys, or else under each parent
+        scopes = {}
+        for route in routes:
+            parent = None if any(r.parent is None for r in routes) else route.parent
+            scopes.setdefault(parent, []).append(route.path_regex)
+        for parent, regexes in scopes.items():
+            paths = re.compile("|".join(regexes))
+            collections.append((parent, collection_id, paths))
+    return collections
+
+
+def _id_ranges(leaves):
+    # Returns the [start, end) document ID ranges of hex leaf prefixes, or
+    # of the first hex digit when leaves is None
+    if leaves is None:
+        leaves = list(_HEX_DIGITS)
+    ranges = []
+    for leaf in sorted(leaves):
+        # The range ends at the first ID after the prefix, and prefixes of
+        # only "f" run to the end of the ID space
+        end = leaf.rstrip("f")
+        if end:
+            end = end[:-1] + _HEX_DIGITS[_HEX_DIGITS.index(end[-1]) + 1]
+        ranges.append((leaf, end or None))
+    return ranges
+
+
+def _read(readers, digest, workers):
+    def run(reader):
+        batch = []
+        for path, doc in reader():
+            batch.append((path, doc))
+            if len(batch) == _BATCH_SIZE:
+                digest.add(batch)
+                batch = []
+        digest.add(batch)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(run, readers))
+
+
+def read_firestore(client, table, digest, hex_ids, key_routes=None, workers=8):
+    """Adds the documents of a copy in Firestore to digest.
+
+    With hex document IDs, the table collection is read in parallel ID
+    ranges, only those of digest.keep if it is set. The collections of key
+    routes are read under their parent documents, or as collection groups
+    when their parents depend on the keys, and only the document paths the
+    routes give are kept.
+    """
+    from google.cloud.firestore_v1.field_path import FieldPath
+
+    collection = client.collection(table)
+
+    def range_reader(start, end):
+        def reader():
+            query = collection.where(
+                FieldPath.document_id(), ">=", collection.document(start)
+            )
+            if end is not None:
+                query = query.where(
+                    FieldPath.document_id(), "<", collection.document(end)
+                )
+            for snapshot in query.stream():
+                yield snapshot.reference.path, snapshot.to_dict()
+
+        return reader
+
+    def query_reader(query, paths=None):
+        def reader():
+            for snapshot in query.stream():
+                path = snapshot.reference.path
+                if paths is None or paths.fullmatch(path):
+                    yield path, snapshot.to_dict()
+
+        return reader
+
+    if hex_ids:
+        readers = [range_reader(*r) for r in _id_ranges(digest.keep)]
+    else:
+        readers = [query_reader(collection)]
+    for parent, collection_id, paths in routed_collections(table, key_routes):
+        if parent is None:
+            query = client.collection_group(collection_id)
+        elif parent:
+            query = client.collection(f"{parent}/{collection_id}")
+        else:
+            query = client.collection(collection_id)
+        readers.append(query_reader(query, paths))
+    _read(readers, digest, workers)
+
+
+def read_datastore(client, table, digest, hex_ids, key_routes=None, workers=8):
+    """Adds the entities of a copy in Datastore to digest.
+
+    Like read_firestore, with key ranges of the table kind, and a query per
+    kind of the key routes, under the ancestor of their parent document if
+    it is fixed.
+    """
+
+    def path_of(entity):
+        return "/".join(str(part) for part in entity.key.flat_path)
+
+    def query_reader(kind, start=None, end=None, parent=None, paths=None):
+        def reader():
+            query = client.query(kind=kind)
+            if parent:
+                query.ancestor = client.key(*parent.split("/"))
+            if start is not None:
+                query.add_filter("__key__", ">=", client.key(kind, start))
+            if end is not None:
+                query.add_filter("__key__", "<", client.key(kind, end))
+            for entity in query.fetch():
+                path = path_of(entity)
+                if paths is None or paths.fullmatch(path):
+                    yield path, dict(entity)
+
+        return reader
+
+    if hex_ids:
+        readers = [query_reader(table, *r) for r in _id_ranges(digest.keep)]
+    else:
+        readers = [query_reader(table)]
+    for parent, kind, paths in routed_collections(table, key_routes):
+        readers.append(query_reader(kind, parent=parent, paths=paths))
+    _read(readers, digest, workers)
+
+
+def verify_copy(read_source, read_target, max_report=20):
+    """Compares the digests of a copy, and drills down into differences.
+
+    read_source and read_target take the set of leaf ranges to keep the
+    document hashes of, or None, and return a RangeDigest. Each side is
+    read concurrently with the other. Returns True if the copy matches.
+    """
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        source = executor.submit(read_source, None)
+        target = executor.submit(read_target, None)
+        source, target = source.result(), target.result()
+    leaves, compared = compare(source, target)
+    print(
+        f"Verified {source.count()} source and {target.count()} target "
+        f"documents in {len(source.tree())} ranges, compared {compared}"
+    )
+    if not leaves:
+        print("The copy matches")
+        return True
+
+    print(f"{len(leaves)} leaf ranges differ, reading them again")
+    keep = set(leaves)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        source = executor.submit(read_source, keep)
+        target = executor.submit(read_target, keep)
+        source, target = source.result(), target.result()
+    missing, extra, different = diff_items(source, target)
+    for name, paths in [
+        ("Missing", missing),
+        ("Extra", extra),
+        ("Different", different),
+    ]:
+        print(f"{name} documents: {len(paths)}")
+        for path in paths[:max_report]:
+            print(f"  {path}")
+    return False
@@ -0,0 +1,471 @@
+# Copyright 2021, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Write sinks take lists of (path, doc) operations, where path is a
+# "collection/document" path and doc is None for a delete, and commit them
+# concurrently in the background. The optional callback passed to write()
+# is called once every operation in that call has been committed. The
+# google libraries are imported on use, so that each target only needs its
+# own library installed.
+
+import asyncio
+import threading
+import time
+
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from rate_limiter import CONTENTION_CODES, is_contention
+
+# BulkWriter sends up to 20 writes in each BatchWrite RPC
+_BULK_WRITER_BATCH_SIZE = 20
+# Maximum number of writes that can be passed
+# to a Commit operation in Firestore and Datastore is 500
+_MAX_BATCH_SIZE = 500
+# Rate given to BulkWriter's own limiter, which defaults to 500 ops/s, so
+# that writes are only throttled by a RateLimiter
+_UNLIMITED_OPS_PER_SECOND = 1000000
+# gRPC status code of errors that carry none
+_UNKNOWN = 2
+# Seconds between sends of due retries while write() waits for writes
+_RETRY_POLL_SECONDS = 0.1
+# The BulkWriter internals that SinkBulkWriter relies on, which are only
+# known to work with the google-cloud-firestore versions of requirements.txt
+_BULK_WRITER_INTERNALS = [
+    "_send",
+    "_schedule_ready_retries",
+    "_enqueue_current_batch",
+    "_operations",
+]
+
+
+class SinkStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.succeeded = 0
+        self.retried = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def add(self, succeeded=0, retried=0, failed=0, in_flight=0):
+        with self._lock:
+            self.succeeded += succeeded
+            self.retried += retried
+            self.failed += failed
+            self.in_flight += in_flight
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def __str__(self):
+        return (
+            f"succeeded={self.succeeded} retried={self.retried} "
+            f"failed={self.failed} in_flight={self.in_flight} "
+            f"peak_in_flight={self.peak_in_flight}"
+        )
+
+
+class WriteSinkError(Exception):
+    pass
+
+
+class _Ticket:
+    # Calls callback once `remaining` operations have been committed
+    def __init__(self, remaining, callback):
+        self.remaining = remaining
+        self.callback = callback
+        self.failed = False
+
+
+def _failed_batch_response(batch, error):
+    # A BatchWrite response that rejects every write of batch with error
+    from google.cloud.firestore_v1.types import BatchWriteResponse
+    from google.rpc import status_pb2
+
+    status = getattr(error, "grpc_status_code", None)
+    code = status.value[0] if status is not None else _UNKNOWN
+    return BatchWriteResponse(
+        status=[status_pb2.Status(code=code, message=str(error))] * len(batch)
+    )
+
+
+def _bulk_writer(client, options):
+    # BulkWriter only retries the writes a BatchWrite response rejects; when
+    # the RPC itself fails, no write callback is called and the writes of the
+    # batch are lost. This BulkWriter turns a failed RPC into a response that
+    # rejects each of its writes, so they are retried or reported as failed.
+    from google.cloud.firestore_v1.bulk_writer import BulkWriter
+
+    class SinkBulkWriter(BulkWriter):
+        def _send(self, batch):
+            try:
+                return super()._send(batch)
+            except Exception as e:
+                return _failed_batch_response(batch, e)
+
+        def send_retries(self):
+            # Retries that are due are only sent when writes are added or
+            # flushed, and then wait in the current batch until it is full
+            self._schedule_ready_retries()
+            if self._operations:
+                self._enqueue_current_batch()
+
+    bulk_writer = SinkBulkWriter(client=client, options=options)
+    missing = [
+        name for name in _BULK_WRITER_INTERNALS if not hasattr(bulk_writer, name)
+    ]
+    if missing:
+        from google.cloud.firestore import __version__
+
+        raise ImportError(
+            f"BulkWriter of google-cloud-firestore {__version__} has no "
+            f"{', '.join(missing)}; install the version of requirements.txt"
+        )
+    return bulk_writer
+
+
+class FirestoreBulkSink:
+    """Writes through a Firestore BulkWriter.
+
+    BulkWriter batches and sends writes in parallel and retries individual
+    failed writes, and the writes of failed RPCs. Callers block in write()
+    while more than max_in_flight RPCs worth of writes are outstanding.
+
+    BulkWriter's own 500/50/5 limiter is turned off, so the rate is only
+    limited by the optional rate_limiter, which write() waits for tokens
+    from. The paths of the writes that failed every attempt are kept in
+    failed_paths, along with the writes that still had no result after a
+    flush.
+    """
+
+    def __init__(self, client, max_in_flight=100, max_attempts=10, rate_limiter=None):
+        from google.cloud.firestore_v1.bulk_writer import BulkWriterOptions
+
+        self.client = client
+        self.stats = SinkStats()
+        self.max_attempts = max_attempts
+        self.rate_limiter = rate_limiter
+        self._max_pending = max_in_flight * _BULK_WRITER_BATCH_SIZE
+        self._pending = threading.Condition()
+        self._lock = threading.Lock()
+        self._errors = []
+        self.failed_paths = set()
+        # Tickets of the writes waiting for a result, by document path
+        self._tickets = defaultdict(deque)
+        self._tickets_lock = threading.Lock()
+        options = BulkWriterOptions(
+            initial_ops_per_second=_UNLIMITED_OPS_PER_SECOND,
+            max_ops_per_second=_UNLIMITED_OPS_PER_SECOND,
+        )
+        self._bulk_writer = _bulk_writer(client, options)
+        self._bulk_writer.on_write_result(self._on_write_result)
+        self._bulk_writer.on_write_error(self._on_write_error)
+
+    def _on_write_result(self, reference, result, bulk_writer):
+        self.stats.add(succeeded=1)
+        self._finish(reference.path, failed=False)
+        self._release(1)
+
+    def _on_write_error(self, error, bulk_writer):
+        if self.rate_limiter and error.code in CONTENTION_CODES:
+            self.rate_limiter.on_contention()
+        # attempts counts the failed attempts before this one
+        if error.attempts + 1 < self.max_attempts:
+            self.stats.add(retried=1)
+            return True
+        self._fail(error.operation.reference.path, f"{error.code} {error.message}")
+        return False
+
+    def _fail(self, path, error):
+        self.stats.add(failed=1)
+        self._errors.append(error)
+        self.failed_paths.add(path)
+        self._finish(path, failed=True)
+        self._release(1)
+
+    def _finish(self, path, failed):
+        with self._tickets_lock:
+            tickets = self._tickets.get(path)
+            ticket = tickets.popleft() if tickets else None
+            if tickets is not None and not tickets:
+                del self._tickets[path]
+            if ticket is None:
+                return
+            ticket.failed |= failed
+            ticket.remaining -= 1
+            done = ticket.remaining == 0 and not ticket.failed
+        if done and ticket.callback:
+            ticket.callback()
+
+    def _fail_unfinished(self):
+        # Once the BulkWriter is flushed, every write has had its result, so
+        # the writes still ticketed were lost, for example when a response
+        # could not be processed. Called with self._lock held.
+        with self._tickets_lock:
+            paths = [path for path, tickets in self._tickets.items() for _ in tickets]
+        for path in paths:
+            self._fail(path, f"no result for the write of {path}")
+
+    def _release(self, n):
+        with self._pending:
+            self.stats.add(in_flight=-n)
+            self._pending.notify_all()
+
+    def write(self, ops, callback=None):
+        if not ops:
+            if callback:
+                callback()
+            return
+        while True:
+            with self._pending:
+                if self._pending.wait_for(
+                    lambda: self.stats.in_flight < self._max_pending,
+                    _RETRY_POLL_SECONDS,
+                ):
+                    self.stats.add(in_flight=len(ops))
+                    break
+            # The outstanding writes may all be waiting to be retried
+            with self._lock:
+                self._bulk_writer.send_retries()
+        if self.rate_limiter:
+            self.rate_limiter.acquire(len(ops))
+        ticket = _Ticket(len(ops), callback)
+        # BulkWriter is not safe to enqueue into from several threads
+        with self._lock:
+            with self._tickets_lock:
+                for path, _ in ops:
+                    self._tickets[path].append(ticket)
+            for path, doc in ops:
+                doc_ref = self.client.document(path)
+                if doc is None:
+                    self._bulk_writer.delete(doc_ref)
+                else:
+                    self._bulk_writer.set(doc_ref, doc)
+
+    def flush(self):
+        with self._lock:
+            self._bulk_writer.flush()
+            self._fail_unfinished()
+
+    def close(self):
+        with self._lock:
+            # BulkWriter.close() rejects the retries it sends, so flush first
+            self._bulk_writer.flush()
+            self._bulk_writer.close()
+            self._fail_unfinished()
+        if self._errors:
+            raise WriteSinkError(
+                f"{len(self._errors)} writes failed, first error: {self._errors[0]}"
+            )
+
+
+class BatchCommitSink:
+    """Commits batches of up to 500 writes on a thread pool.
+
+    At most max_in_flight commits run at once; write() blocks when the cap
+    is reached. A failed commit is retried with exponential backoff up to
+    max_attempts times. Every attempt first takes tokens from the optional
+    rate_limiter. The paths of the commits that failed every attempt are
+    kept in failed_paths. Subclasses implement _commit(ops).
+    """
+
+    def __init__(self, client, max_in_flight=8, max_attempts=5, rate_limiter=None):
+        self.client = client
+        self.stats = SinkStats()
+        self.max_attempts = max_attempts
+        self.rate_limiter = rate_limiter
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        self._idle = threading.Condition()
+        self._errors = []
+        self.failed_paths = set()
+
+    def write(self, ops, callback=None):
+        if not ops:
+            if callback:
+                callback()
+            return
+        chunks = [
+            ops[i : i + _MAX_BATCH_SIZE] for i in range(0, len(ops), _MAX_BATCH_SIZE)
+        ]
+        ticket = _Ticket(len(chunks), callback) if callback else None
+        for chunk in chunks:
+            self._slots.acquire()
+            self.stats.add(in_flight=len(chunk))
+            self._executor.submit(self._commit_with_retry, chunk, ticket)
+
+    def _commit_with_retry(self, ops, ticket):
+        try:
+            for attempt in range(1, self.max_attempts + 1):
+                try:
+                    if self.rate_limiter:
+                        self.rate_limiter.acquire(len(ops))
+                    self._commit(ops)
+                    self.stats.add(succeeded=len(ops))
+                    if ticket:
+                        with self._idle:
+                            ticket.remaining -= 1
+                            done = ticket.remaining == 0
+                        if done:
+                            ticket.callback()
+                    return
+                except Exception as e:
+                    if self.rate_limiter and is_contention(e):
+                        self.rate_limiter.on_contention()
+                    if attempt == self.max_attempts:
+                        self.stats.add(failed=len(ops))
+                        self._errors.append(e)
+                        self.failed_paths.update(path for path, _ in ops)
+                        return
+                    self.stats.add(retried=len(ops))
+                    time.sleep(min(2 ** attempt * 0.1, 10))
+        finally:
+            with self._idle:
+                self.stats.add(in_flight=-len(ops))
+                self._idle.notify_all()
+            self._slots.release()
+
+    def _commit(self, ops):
+        raise NotImplementedError
+
+    def flush(self):
+        with self._idle:
+            self._idle.wait_for(lambda: self.stats.in_flight == 0)
+
+    def close(self):
+        self.flush()
+        self._executor.shutdown()
+        if self._errors:
+            raise WriteSinkError(
+                f"{self.stats.failed} writes failed, first error: {self._errors[0]}"
+            )
+
+
+class FirestoreBatchSink(BatchCommitSink):
+    def _commit(self, ops):
+        batch = self.client.batch()
+        for path, doc in ops:
+            doc_ref = self.client.document(path)
+            if doc is None:
+                batch.delete(doc_ref)
+            else:
+                batch.set(doc_ref, doc)
+        batch.commit()
+
+
+class DatastoreSink(BatchCommitSink):
+    def __init__(self, client, *args, **kwargs):
+        from google.cloud import datastore
+
+        super().__init__(client, *args, **kwargs)
+        self._entity = datastore.Entity
+
+    def _commit(self, ops):
+        batch = self.client.batch()
+        batch.begin()
+        for path, doc in ops:
+            key = self.client.key(*path.split("/"))
+            if doc is None:
+                batch.delete(key)
+            else:
+                entity = self._entity(key)
+                entity.update(doc)
+                batch.put(entity)
+        batch.commit()
+
+
+class AsyncFirestoreSink:
+    """Commits batches with a Firestore AsyncClient from asyncio tasks.
+
+    write() is a coroutine that returns once the batch is committed, so
+    callers keep as many batches in flight as they run tasks, up to
+    max_in_flight. Failed commits are retried with exponential backoff.
+    Every attempt first takes tokens from the optional rate_limiter.
+    """
+
+    def __init__(self, client, max_in_flight=100, max_attempts=5, rate_limiter=None):
+        self.client = client
+        self.stats = SinkStats()
+        self.max_attempts = max_attempts
+        self.rate_limiter = rate_limiter
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._errors = []
+
+    async def write(self, ops, callback=None):
+        committed = not ops
+        async with self._slots:
+            self.stats.add(in_flight=len(ops))
+            for attempt in range(1, self.max_attempts + 1):
+                if committed:
+                    break
+                batch = self.client.batch()
+                for path, doc in ops:
+                    doc_ref = self.client.document(path)
+                    if doc is None:
+                        batch.delete(doc_ref)
+                    else:
+                        batch.set(doc_ref, doc)
+                try:
+                    if self.rate_limiter:
+                        await self.rate_limiter.acquire_async(len(ops))
+                    await batch.commit()
+                    self.stats.add(succeeded=len(ops))
+                    committed = True
+                except Exception as e:
+                    if self.rate_limiter and is_contention(e):
+                        self.rate_limiter.on_contention()
+                    if attempt == self.max_attempts:
+                        self.stats.add(failed=len(ops))
+                        self._errors.append(e)
+                    else:
+                        self.stats.add(retried=len(ops))
+                        await asyncio.sleep(min(2 ** attempt * 0.1, 10))
+            self.stats.add(in_flight=-len(ops))
+        if committed and callback:
+            callback()
+
+    def close(self):
+        if self._errors:
+            raise WriteSinkError(
+                f"{self.stats.failed} writes failed, first error: {self._errors[0]}"
+            )
+
+
+def make_client(target, credentials=None, asynchronous=False):
+    """Returns a client of target, "firestore" or "datastore".
+
+    Set asynchronous for a Firestore AsyncClient, which must be created in
+    the event loop it is used in.
+    """
+    if target == "datastore":
+        from google.cloud import datastore
+
+        return datastore.Client(credentials=credentials)
+    from google.cloud import firestore
+
+    if asynchronous:
+        return firestore.AsyncClient(credentials=credentials)
+    return firestore.Client(credentials=credentials)
+
+
+def make_sink(client, target, sink_type="bulk", **kwargs):
+    """Returns the write sink of target for client.
+
+    Firestore writes go through a BulkWriter with sink_type "bulk", batch
+    commits with "batch", or an AsyncClient with "async". Datastore writes
+    always go through batch commits. kwargs are passed to the sink.
+    """
+    if target == "datastore":
+        return DatastoreSink(client, **kwargs)
+    if sink_type == "async":
+        return AsyncFirestoreSink(client, **kwargs)
+    if sink_type == "batch":
+        return FirestoreBatchSink(client, **kwargs)
+    return FirestoreBulkSink(client, **kwargs)
+
@@ -0,0 +1,170 @@
+# Copyright 2022, Google, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     https://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Loads the rows of sample_data into the Customer_Order or Product table
+# with batch writes from several threads. With --rows, it synthesizes that
+# many items from the sample rows: copy k of the sample data gets the
+# suffix "-k" on its keys and IDs, so the copies do not overlap, the
+# relations between customers, orders and line items are kept within each
+# copy, and the same --rows always produces the same items.
+
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from decimal import Decimal
+import argparse
+import boto3
+import csv
+import os
+import sys
+import threading
+import time
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Sample data files of each table, and the type of their numeric columns.
+# Other columns are stored as strings, like in put_*_items.py.
+TABLES = {
+    'Customer_Order': [
+        ('customer.tsv', {}),
+        ('order.tsv', {'order_amount': Decimal, 'number_of_items': int}),
+        ('line_item.tsv', {'item_price': Decimal,
+                           'item_discount': Decimal,
+                           'item_quantity': int}),
+    ],
+    'Product': [
+        ('book_product.tsv', {'price': Decimal, 'shipping_amount': Decimal}),
+        ('electronic_product.tsv', {'price': Decimal,
+                                    'shipping_amount': Decimal}),
+    ],
+}
+
+
+def read_templates(table_name):
+    templates = []
+    for file_name, types in TABLES[table_name]:
+        path = os.path.join(base_dir, 'sample_data', file_name)
+        with open(path, newline='') as csvfile:
+            reader = csv.reader(csvfile, delimiter='\t', quotechar='"')
+            header = next(reader)
+            for row in reader:
+                item = {}
+                for name, value in zip(header, row):
+                    if not name:
+                        continue
+                    name = {'pk': 'PK', 'sk': 'SK'}.get(name, name)
+                    item[name] = types.get(name, str)(value)
+                templates.append(item)
+    return templates
+
+
+def synthesize(template, copy, padding):
+    # Copy 0 is the sample row itself
+    item = dict(template)
+    if copy:
+        suffix = f'-{copy}'
+        for name in item:
+            if name in ('PK', 'SK') or name.endswith('_id'):
+                item[name] += suffix
+    if padding:
+        item['padding'] = 'x' * padding
+    return item
+
+
+def load(table_name, templates, start, end, padding, endpoint_url, counter,
+         stop):
+    # boto3 resources are not thread safe, so each thread has its own.
+    # Stops early when stop is set, after another thread failed.
+    session = boto3.session.Session()
+    dynamo = session.resource('dynamodb', endpoint_url=endpoint_url)
+    table = dynamo.Table(table_name)
+    count = len(templates)
+
+    with table.batch_writer() as batch:
+        for n, i in enumerate(range(start, end), 1):
+            if stop.is_set():
+                return
+            batch.put_item(Item=synthesize(templates[i % count], i // count,
+                                           padding))
+            if n % 100 == 0:
+                counter.add(100)
+    counter.add((end - start) % 100)
+
+
+def load_all(table_name, templates, rows, threads, padding, endpoint_url,
+             counter, report=None):
+    # Loads rows items from a pool of threads, calling report every 10 s.
+    # Raises the first error of a thread, after stopping the others.
+    stop = threading.Event()
+    size = -(-rows // threads)
+    with ThreadPoolExecutor(threads) as executor:
+        futures = [
+            executor.submit(load, table_name, templates, first,
+                            min(rows, first + size), padding, endpoint_url,
+                            counter, stop)
+            for first in range(0, rows, size)
+        ]
+        pending = futures
+        while pending:
+            done, pending = wait(pending, timeout=10,
+                                 return_when=FIRST_EXCEPTION)
+            if any(future.exception() for future in done):
+                stop.set()
+                break
+            if pending and report:
+                report()
+    for future in futures:
+        future.result()
+
+
+class Counter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = 0
+
+    def add(self, n):
+        with self.lock:
+            self.value += n
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Load the sample data into a DynamoDB table.')
+    parser.add_argument('table_name', choices=sorted(TABLES))
+    parser.add_argument('--rows', type=int,
+                        help='number of items to write, synthesized from '
+                        'the sample rows (default: the sample rows once)')
+    parser.add_argument('--threads', type=int, default=8,
+                        help='number of writer threads (default: 8)')
+    parser.add_argument('--padding', type=int, default=0,
+                        help='bytes of padding to add to each item, to '
+                        'test larger items (default: 0)')
+    parser.add_argument('--endpoint-url',
+                        help='DynamoDB endpoint, for example '
+                        'http://localhost:8000 for DynamoDB Local')
+    args = parser.parse_args()
+
+    templates = read_templates(args.table_name)
+    rows = args.rows or len(templates)
+    counter = Counter()
+    start = time.monotonic()
+
+    def report():
+        print(f'{counter.value} of {rows} items written, '
+              f'{counter.value / (time.monotonic() - start):,.0f} items/s',
+              flush=True)
+
+    try:
+        load_all(args.table_name, templates, rows, args.threads, args.padding,
+                 args.endpoint_url, counter, report)
+    except Exception as error:
+        sys.exit(f'Loading {args.table_name} failed after {counter.value} '
+                 f'items: {error!r}')
+    print(f'Total items written to {args.table_name}: {counter.value} '
+          f'in {time.monotonic() - start:.1f} s')
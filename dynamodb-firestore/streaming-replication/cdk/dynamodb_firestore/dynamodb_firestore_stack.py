@@ -36,6 +36,13 @@ class DynamodbFirestoreStack(Stack):
         aws_secret_arn = os.environ["SECRET_ARN"]
         # Get the lambda src path
         lambda_src_loc = os.environ["LAMBDA_SRC_LOCATION"]
+        # The image is built from the dynamodb-firestore directory, two levels
+        # up, so that it can copy the modules it shares with the copy scripts
+        build_dir = os.path.normpath(os.path.join(lambda_src_loc, "..", ".."))
+        dockerfile = os.path.relpath(os.path.join(lambda_src_loc, "Dockerfile"), build_dir)
+        # Number of concurrent batches processed per stream shard, from 1 to 10.
+        # Records with the same partition key are still processed in order.
+        parallelization_factor = int(os.environ.get("PARALLELIZATION_FACTOR", "4"))
 
         # Use boto3 to get the table stream
         dynamodb = boto3.resource('dynamodb')
@@ -55,16 +62,32 @@ class DynamodbFirestoreStack(Stack):
             function_name="ddb-firestore-sync-func",
             memory_size=1024,
             timeout=Duration.seconds(300),
-            code=aws_lambda.DockerImageCode.from_image_asset(lambda_src_loc))
+            code=aws_lambda.DockerImageCode.from_image_asset(
+                build_dir, file=dockerfile))
         sync_lambda.add_environment("DYNAMODB_TABLE_NAME", ddb_table_name)
         sync_lambda.add_environment("AWS_SECRET_ARN", aws_secret_arn)
+        # Pass the key schema so the function does not need to call
+        # describe_table on every invocation
+        for key in ddb_table.key_schema:
+            if key["KeyType"] == "HASH":
+                sync_lambda.add_environment("DYNAMODB_PK", key["AttributeName"])
+            if key["KeyType"] == "RANGE":
+                sync_lambda.add_environment("DYNAMODB_SK", key["AttributeName"])
+        # Optional type rules, document ID strategy and key routes, which
+        # must match the options the data was copied with
+        for name in ("TYPE_MAP", "DOC_ID_STRATEGY", "KEY_ROUTES"):
+            if name in os.environ:
+                sync_lambda.add_environment(name, os.environ[name])
 
         dead_letter_queue = aws_sqs.Queue(self, "deadLetterQueue")
         sync_lambda.add_event_source(
             DynamoEventSource(table_cdk,
                               starting_position=aws_lambda.StartingPosition.TRIM_HORIZON,
                               batch_size=500,
+                              parallelization_factor=parallelization_factor,
                               bisect_batch_on_error=True,
+                              # Retry from the first failed record only
+                              report_batch_item_failures=True,
                               on_failure=SqsDlq(
                                   dead_letter_queue),
                               retry_attempts=10
@@ -9,131 +9,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import boto3
-import hashlib
-import os
-import json
-import base64
+# Replicates the changes of a DynamoDB stream to Firestore in Datastore mode,
+# with the pipeline and write sinks of the copy scripts. The image copies
+# copy-data/stream_sync.py and the modules it imports next to this file.
 
-from google.oauth2 import service_account
-from google.cloud import datastore
-from boto3.dynamodb.types import TypeDeserializer
-from decimal import Decimal
+from stream_sync import make_handler
 
-# Initialize clents for AWS
-local_dynamodb_client = boto3.client("dynamodb")
-secrets_client = boto3.client("secretsmanager")
-
-# Load the GCP credential from AWS secrets manager.
-# You need to create the GCP service account key file first
-# and upload it to AWS secrets manager.
-kwargs = {"SecretId": os.environ["AWS_SECRET_ARN"]}
-sa_key_val = secrets_client.get_secret_value(**kwargs)
-json_account_info = json.loads(base64.b64decode(sa_key_val["SecretString"]))
-sa_credentials = service_account.Credentials.from_service_account_info(
-    json_account_info
-)
-
-# Initialize clint for Datastore
-datastore_client = datastore.Client(credentials=sa_credentials)
-
-
-def dumps(item: dict) -> str:
-    return json.dumps(item, default=default_type_error_handler)
-
-
-def default_type_error_handler(obj):
-    if isinstance(obj, Decimal):
-        return int(obj)
-    raise TypeError
-
-
-def parse_schema(schema_dict):
-    pk = None
-    sk = None
-
-    table_dict = schema_dict["Table"]
-    key_schema = table_dict["KeySchema"]
-    for key in key_schema:
-        key_name = key["AttributeName"]
-        key_type = key["KeyType"]
-        if key_type == "HASH":
-            pk = key_name
-            # print('pk: ' + pk)
-        if key_type == "RANGE":
-            sk = key_name
-            # print('sk: ' + sk)
-    return pk, sk
-
-
-def write_batch(fs_docs, table, pk, sk, is_delete=False):
-    batch = datastore_client.batch()
-    batch.begin()
-
-    for doc in fs_docs:
-        pk_val = doc[pk]
-
-        if sk is not None:
-            sk_val = doc[sk]
-
-        doc_id = pk_val if sk_val is None else pk_val + sk_val
-        doc_id_hash = hashlib.md5(doc_id.encode())
-        doc_id_md5 = doc_id_hash.hexdigest()
-
-        key = datastore_client.key(table, doc_id_md5)
-        if is_delete:
-            batch.delete(key)
-        else:
-            entity = datastore.Entity(key)
-            entity.update(doc)
-            batch.put(entity)
-
-    batch.commit()
-
-
-def ddb_deserialize(r, type_deserializer=TypeDeserializer()):
-    return type_deserializer.deserialize({"M": r})
-
-
-def convert_items(db_items):
-    fs_docs = []
-
-    for item in db_items:
-        item_as_json = dumps(ddb_deserialize(item))
-        fs_doc = json.loads(item_as_json)
-        fs_docs.append(fs_doc)
-    return fs_docs
-
-
-def lambda_handler(event, context):
-    table_name = os.environ["DYNAMODB_TABLE_NAME"]
-
-    res = local_dynamodb_client.describe_table(TableName=table_name)
-    pk, sk = parse_schema(res)
-
-    ddb_add_records = []
-    ddb_del_records = []
-
-    for rec in event["Records"]:
-        if rec["eventName"] in ["INSERT", "MODIFY"]:
-            add_rec = rec["dynamodb"]["NewImage"]
-            add_rec[pk] = rec["dynamodb"]["Keys"][pk]
-            add_rec[sk] = rec["dynamodb"]["Keys"][sk]
-            ddb_add_records.append(add_rec)
-
-        elif rec["eventName"] == "REMOVE":
-            del_rec = rec["dynamodb"]["OldImage"]
-            del_rec[pk] = rec["dynamodb"]["Keys"][pk]
-            del_rec[sk] = rec["dynamodb"]["Keys"][sk]
-            ddb_del_records.append(del_rec)
-
-    fs_add_docs = convert_items(ddb_add_records)
-    write_batch(fs_add_docs, table_name, pk, sk)
-    write_cnt = len(fs_add_docs)
-
-    fs_del_docs = convert_items(ddb_del_records)
-    write_batch(fs_del_docs, table_name, pk, sk, True)
-    delete_cnt = len(fs_del_docs)
-
-    print(f"Total items synced to Firestore: {write_cnt}")
-    print(f"Total items removed in Firestore: {delete_cnt}")
+lambda_handler = make_handler("datastore")